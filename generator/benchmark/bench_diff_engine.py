@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+bench_diff_engine.py
+Compare the list.pop(0) diff parsing of perforce diff parser and review diff parser with diff_engine.py.
+The recorded hunks below are repeated into a few big files, like a vendor drop of --lines lines.
+Usage:
+   PYTHONPATH=`pwd` python3 generator/benchmark/bench_diff_engine.py --lines 200000
+'''
+
+import os
+import re
+import sys
+import time
+import argparse
+sys.path.insert(1, os.path.join(os.path.abspath(__file__).split("/generator")[0], "generator/src/notification"))
+from diff_engine import iterP4Diffs, iterUnifiedDiffs, iterLines
+
+# recorded hunk of `p4 describe -a` Differences section
+RECORDED_P4_HUNK = [
+   "300,305d299",
+   "<     *    enableDecoderWatermark - this switch enables/disables H264/HEVC/",
+   "<     *                              watermark.",
+   "<     */",
+   "<    Bool enableDecoderWatermark;",
+   "<",
+   "<    /*",
+   "1021c1015",
+   "<    Log(\"%s: decoder watermark %d\\n\", __FUNCTION__, enableDecoderWatermark);",
+   "---",
+   ">    Log(\"%s: decoder watermark disabled\\n\", __FUNCTION__);",
+   "1104a1099,1101",
+   ">    if (mks->remoteConnection == NULL) {",
+   ">       return FALSE;",
+   ">    }",
+   "",
+]
+# the same changes recorded from review board patch
+RECORDED_UNIFIED_HUNK = [
+   "@@ -300,6 +299,0 @@ typedef struct MKSConfig {",
+   "-    *    enableDecoderWatermark - this switch enables/disables H264/HEVC/",
+   "-    *                              watermark.",
+   "-    */",
+   "-   Bool enableDecoderWatermark;",
+   "-",
+   "-   /*",
+   "@@ -1021,1 +1015,1 @@ MKS_Init(MKS *mks)",
+   "-   Log(\"%s: decoder watermark %d\\n\", __FUNCTION__, enableDecoderWatermark);",
+   "+   Log(\"%s: decoder watermark disabled\\n\", __FUNCTION__);",
+   "@@ -1104,0 +1099,3 @@ MKS_Connect(MKS *mks)",
+   "+   if (mks->remoteConnection == NULL) {",
+   "+      return FALSE;",
+   "+   }",
+]
+
+def legacyP4Diff(diffLines):
+   '''perforce_diff_parser.parseLastChangeDiff before diff_engine.py, the add file branch is left out'''
+   linePatterns = [re.compile(r"^(\d+),(\d+)([acd])(\d+),(\d+)$"), re.compile(r"^(\d+),(\d+)([acd])(\d+)$"),
+                   re.compile(r"^(\d+)([acd])(\d+),(\d+)$"), re.compile(r"^(\d+)([acd])(\d+)$")]
+   def getFileDiff(diffContent):
+      deleteLineNo, addLineNo = 0, 0
+      fileDiff = []
+      while diffContent:
+         line = diffContent.pop(0)
+         if '---' == line:
+            continue
+         elif any(pattern.match(line) for pattern in linePatterns):
+            for pattern in linePatterns:
+               if pattern.match(line):
+                  results = pattern.findall(line)[0]
+                  typeIndex = [index for index, res in enumerate(results) if res in ['a', 'c', 'd']][0]
+                  deleteLineNo, addLineNo = int(results[0]), int(results[typeIndex + 1])
+                  break
+         else:
+            line = line.rstrip('\r')
+            if line.startswith('<'):
+               if line[2:]:
+                  fileDiff.append(('-', deleteLineNo, line[2:]))
+               deleteLineNo += 1
+            elif line.startswith('>'):
+               if line[2:]:
+                  fileDiff.append(('+', addLineNo, line[2:]))
+               addLineNo += 1
+      return fileDiff
+   diffInfo = {}
+   filePath, fileContent = "", []
+   while diffLines:
+      line = diffLines.pop(0)
+      if re.match(r'^==== (.*) ====$', line):
+         if fileContent and filePath:
+            diffInfo[filePath] = getFileDiff(fileContent)
+            fileContent = []
+         filePath = "/".join(re.findall(r'==== (.*) ====', line)[0].split('#')[0].split("/")[5:])
+      else:
+         fileContent.append(line)
+   if fileContent and filePath:
+      diffInfo[filePath] = getFileDiff(fileContent)
+   return diffInfo
+
+def legacyUnifiedDiff(differences):
+   '''review_diff_parser.parseLastReviewDiff before diff_engine.py'''
+   linePattern = re.compile(r"^@@ (\-\d+),(\d+) (\+\d+),(\d+) @@")
+   def getFileDiff(diffContent):
+      deleteLineNo, addLineNo = 0, 0
+      fileDiff = []
+      while diffContent:
+         line = diffContent.pop(0)
+         if linePattern.match(line):
+            lineNoInfo = linePattern.findall(line)[0]
+            deleteLineNo, addLineNo = abs(int(lineNoInfo[0])), int(lineNoInfo[2])
+            continue
+         if line.startswith("-"):
+            if line[1:]:
+               fileDiff.append(('-', deleteLineNo, line[1:]))
+            deleteLineNo += 1
+         elif line.startswith("+"):
+            if line[1:]:
+               fileDiff.append(('+', addLineNo, line[1:]))
+            addLineNo += 1
+         elif "\\ No newline at end of file" == line:
+            continue
+         else:
+            deleteLineNo += 1
+            addLineNo += 1
+      return fileDiff
+   diffInfo = {}
+   filePath, fileContent = "", []
+   diffLines = differences.split('\n')
+   while diffLines:
+      line = diffLines.pop(0)
+      if line.startswith("diff --git") or re.match(r"index [0-9a-z]{40}..[0-9a-z]{40}", line):
+         continue
+      elif line.startswith("--- ") or line.startswith("+++ "):
+         if fileContent and filePath:
+            diffInfo[filePath] = getFileDiff(fileContent)
+            fileContent = []
+         line = line.replace("--- ", "").replace("+++ ", "").split()[0]
+         filePath = "/".join(line.split("/")[2:])
+      else:
+         fileContent.append(line)
+   if fileContent and filePath:
+      diffInfo[filePath] = getFileDiff(fileContent)
+   return diffInfo
+
+def shiftP4Hunk(hunk, offset):
+   shifted = []
+   for line in hunk:
+      matchObj = re.match(r"^(\d+)(?:,(\d+))?([acd])(\d+)(?:,(\d+))?$", line)
+      if matchObj:
+         left, diffType, right = [int(n) + offset for n in matchObj.group(1, 2) if n], matchObj.group(3), \
+                                 [int(n) + offset for n in matchObj.group(4, 5) if n]
+         line = "{0}{1}{2}".format(",".join(map(str, left)), diffType, ",".join(map(str, right)))
+      shifted.append(line)
+   return shifted
+
+def shiftUnifiedHunk(hunk, offset):
+   shifted = []
+   for line in hunk:
+      matchObj = re.match(r"^@@ -(\d+),(\d+) \+(\d+),(\d+) @@(.*)$", line)
+      if matchObj:
+         line = "@@ -{0},{1} +{2},{3} @@{4}".format(int(matchObj.group(1)) + offset, matchObj.group(2),
+                                                    int(matchObj.group(3)) + offset, matchObj.group(4),
+                                                    matchObj.group(5))
+      shifted.append(line)
+   return shifted
+
+def makeDiffs(lineCount, fileCount):
+   hunkCount = max(1, lineCount // len(RECORDED_P4_HUNK) // fileCount)
+   p4Lines, unifiedLines = [], []
+   for fileIndex in range(fileCount):
+      path = "apps/crtbora/common/mks{0}.cc".format(fileIndex)
+      p4Lines += ["==== //depot/bora/main/{0}#119 (text) ====".format(path), ""]
+      unifiedLines += ["diff --git a/bora/{0} b/bora/{0}".format(path),
+                       "index {0}..{1} 100644".format("a" * 40, "b" * 40),
+                       "--- a/bora/{0}".format(path), "+++ b/bora/{0}".format(path)]
+      for hunkIndex in range(hunkCount):
+         p4Lines += shiftP4Hunk(RECORDED_P4_HUNK, hunkIndex * 2000)
+         unifiedLines += shiftUnifiedHunk(RECORDED_UNIFIED_HUNK, hunkIndex * 2000)
+   return p4Lines, "\n".join(unifiedLines)
+
+def toLists(diffInfo):
+   return {filePath: fileDiff if isinstance(fileDiff, str) else list(fileDiff) for filePath, fileDiff in diffInfo.items()}
+
+def benchmark(name, func, repeat):
+   best, result = None, None
+   for _ in range(repeat):
+      startTime = time.perf_counter()
+      result = func()
+      elapsed = time.perf_counter() - startTime
+      best = elapsed if best is None else min(best, elapsed)
+   print("{0:<16} {1:>8} records  best of {2}: {3:.3f}s".format(name, sum(map(len, result.values())), repeat, best))
+   return result
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description='Benchmark diff parsing')
+   parser.add_argument('--lines', type=int, default=200000, help='Number of diff lines')
+   parser.add_argument('--files', type=int, default=4, help='Number of files the lines are split into')
+   parser.add_argument('--repeat', type=int, default=3, help='Repeat times')
+   args = parser.parse_args()
+   p4Lines, unifiedDiff = makeDiffs(args.lines, args.files)
+   legacyP4 = benchmark("legacy p4", lambda: legacyP4Diff(list(p4Lines)), args.repeat)
+   engineP4 = toLists(benchmark("engine p4", lambda: dict(iterP4Diffs(p4Lines, set())), args.repeat))
+   legacyUnified = benchmark("legacy unified", lambda: legacyUnifiedDiff(unifiedDiff), args.repeat)
+   engineUnified = toLists(benchmark("engine unified", lambda: dict(iterUnifiedDiffs(iterLines(unifiedDiff))),
+                                     args.repeat))
+   print("p4 result equal: {0}, unified result equal: {1}, p4 equal to unified: {2}".format(
+      legacyP4 == engineP4, legacyUnified == engineUnified, engineP4 == engineUnified))
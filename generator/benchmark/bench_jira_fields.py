@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+bench_jira_fields.py
+Compare the per issue if/elif field matching of JiraReport.GetAllIssues with the field extractors compiled once
+per report. The recorded search page below is repeated into --issues issues.
+Usage:
+   PYTHONPATH=`pwd` python3 generator/benchmark/bench_jira_fields.py --issues 10000
+'''
+
+import os
+import sys
+import copy
+import time
+import argparse
+sys.path.insert(1, os.path.join(os.path.abspath(__file__).split("/generator")[0], "generator/src/notification"))
+from jira_report import compileIssueExtractor, SUMMARY_MAX_LENGTH
+
+FIELDS = ["id", "key", "summary", "priority", "status", "assignee", "labels", "components", "project", "duedate",
+          "created", "customfield_10051", "customfield_12852"]
+# recorded issues of `rest/api/2/search`, trimmed to the fields above
+RECORDED_PAGE = [
+   {"id": "5451714", "key": "STORVMC-3922",
+    "fields": {"summary": "vSAN health check reports stale disk group state after host reboot in stretched cluster",
+               "priority": {"name": "P1"}, "status": {"name": "Needs Review"},
+               "assignee": {"emailAddress": "jdoe@broadcom.com"}, "labels": ["vmaas-m3", "vmc-storage-sh"],
+               "components": [{"name": "vSAN Health"}],
+               "project": {"name": "VMC Storage", "projectCategory": {"name": "VMC"}},
+               "duedate": "2023-06-14", "created": "2023-07-09T23:42:13.000-0700",
+               "customfield_10051": "3211561.0", "customfield_12852": {"value": "assigned"}}},
+   {"id": "5451802", "key": "STORVMC-3931",
+    "fields": {"summary": "Resync ETA is wrong", "priority": {"name": "P2"}, "status": {"name": "Open"},
+               "assignee": None, "labels": [], "components": [],
+               "project": {"name": "VMC Storage", "projectCategory": {"name": "VMC"}},
+               "duedate": None, "created": "2023-07-11T08:02:45.000-0700",
+               "customfield_10051": None, "customfield_12852": None}},
+   {"id": "5452210", "key": "VSANCORE-16532",
+    "fields": {"summary": "DOM owner abdication\r\nloops when ```clomd``` restarts during rebalance of large objects",
+               "priority": {"name": "P0"}, "status": {"name": "In Progress"},
+               "assignee": {"emailAddress": "asmith@broadcom.com"}, "labels": ["vsan-plus-service-agent"],
+               "components": [{"name": "DOM"}, {"name": "CLOM"}],
+               "project": {"name": "vSAN Core", "projectCategory": {"name": "vSAN"}},
+               "duedate": "2023-08-01", "created": "2023-05-30T17:20:00.000-0700",
+               "customfield_10051": "3190022.0", "customfield_12852": {"name": "resolved"}}},
+]
+
+def legacyDetails(issues, fields):
+   '''JiraReport.GetAllIssues before the compiled field extractors'''
+   details = []
+   for issue in issues:
+      detail = {}
+      issueFields = issue.get('fields', {})
+      for field in fields:
+         if field in ('id', 'key'):
+            detail[field] = issue[field]
+         else:
+            try:
+               if field in ('labels', 'components'):
+                  detail[field] = ','.join(issueFields.get(field, []))
+               elif field in ('priority', 'status', 'issuetype'):
+                  detail[field] = issueFields.get(field, {}).get('name', '')
+               elif field in ('assignee', 'reporter'):
+                  detail[field] = issueFields.get(field, {}).get('emailAddress', '').split('@')[0]
+               elif field in ('duedate', 'created', 'updated'):
+                  detail[field] = issueFields.get(field, '').split('T')[0]
+               elif field in ('summary', 'description'):
+                  words = issueFields.get(field, '')
+                  words = words if len(words) < SUMMARY_MAX_LENGTH else words[:SUMMARY_MAX_LENGTH - 3] + "..."
+                  detail[field] = words.replace('\n', '').replace('\r', '').replace('```', '')
+               elif field == 'project':
+                  detail[field] = '[{0}][{1}]'.format(issueFields.get(field, {}).get('name', ''),
+                                                      issueFields.get(field, {}).get('projectCategory', {}).get('name', ''))
+               elif field == 'customfield_10051':  # PR
+                  detail[field] = issueFields.get(field, '').rstrip('.0')
+               else:
+                  if issueFields.get(field) is None:
+                     detail[field] = ''
+                  elif isinstance(issueFields.get(field), str):
+                     detail[field] = issueFields.get(field)
+                  elif isinstance(issueFields.get(field), list):
+                     detail[field] = ','.join(issueFields.get(field))
+                  elif isinstance(issueFields.get(field), dict):
+                     if issueFields.get(field, {}).get('value'):
+                        detail[field] = issueFields.get(field, {}).get('value')
+                     elif issueFields.get(field, {}).get('name'):
+                        detail[field] = issueFields.get(field, {}).get('name')
+                     else:
+                        detail[field] = '---'  # not found
+                  else:
+                     detail[field] = '---'  # not found
+            except:
+               detail[field] = ''
+      details.append(detail)
+   return details
+
+def compiledDetails(issues, fields):
+   '''JiraReport.GetAllIssues with the extractors compiled once'''
+   return list(map(compileIssueExtractor(fields), issues))
+
+def makeIssues(issueCount):
+   issues = []
+   for index in range(issueCount):
+      issue = copy.deepcopy(RECORDED_PAGE[index % len(RECORDED_PAGE)])
+      issue["id"] = str(5400000 + index)
+      issues.append(issue)
+   return issues
+
+def benchmark(name, func, repeat):
+   best, result = None, None
+   for _ in range(repeat):
+      startTime = time.perf_counter()
+      result = func()
+      elapsed = time.perf_counter() - startTime
+      best = elapsed if best is None else min(best, elapsed)
+   print("{0:<10} {1:>8} issues  best of {2}: {3:.3f}s".format(name, len(result), repeat, best))
+   return result
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description='Benchmark jira field extraction')
+   parser.add_argument('--issues', type=int, default=10000, help='Number of issues')
+   parser.add_argument('--repeat', type=int, default=5, help='Repeat times')
+   args = parser.parse_args()
+   issues = makeIssues(args.issues)
+   legacy = benchmark("legacy", lambda: legacyDetails(issues, FIELDS), args.repeat)
+   compiled = benchmark("compiled", lambda: compiledDetails(issues, FIELDS), args.repeat)
+   print("result equal: {0}".format(legacy == compiled))
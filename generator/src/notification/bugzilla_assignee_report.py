@@ -12,7 +12,7 @@ import re
 from urllib import parse
 from collections import defaultdict, namedtuple
 from generator.src.utils.BotConst import SERVICE_ACCOUNT, SERVICE_PASSWORD
-from generator.src.utils.Utils import logExecutionTime, noIntervalPolling, transformReport
+from generator.src.utils.Utils import logExecutionTime, RetryPolicy, raiseForStatus, transformReport
 from generator.src.utils.Logger import logger
 Record = namedtuple('Record', ['bugId', 'assignee', 'reporter', 'severity', 'priority',
                                'status', 'fixBy', 'eta', 'summary'])
@@ -33,18 +33,20 @@ class BugzillaAssigneeSpider(object):
                                    'Host': 'bugzilla-rest.lvn.broadcom.net'})
 
    @logExecutionTime
-   @noIntervalPolling
+   @RetryPolicy(fallback="error")
    def getBugInfoByAssignee(self, user):
-      res = self.session.get(self.assigneeQueryUrl.format(user))
+      res = self.session.get(self.assigneeQueryUrl.format(user), timeout=60)
+      raiseForStatus(res)
       bugInfos = res.json().get('bugs', [])
       if not bugInfos:
          return res.json().get('message', '')
       return bugInfos
 
    @logExecutionTime
-   @noIntervalPolling
+   @RetryPolicy(fallback="error")
    def getBugInfoById(self, bugId):
-      res = self.session.get(self.bugIdQueryUrl.format(bugId))
+      res = self.session.get(self.bugIdQueryUrl.format(bugId), timeout=60)
+      raiseForStatus(res)
       bugInfos = res.json().get('bugs', [])
       if not bugInfos:
          return res.json().get('message', '')
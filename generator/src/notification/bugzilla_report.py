@@ -15,7 +15,7 @@ import argparse
 import pandas as pd
 from generator.src.notification.bugzilla_web_parser import BugzillaUtils, BUGZILLA_DOMAIN_NAME, DOWNLOAD_DIR
 from generator.src.utils.BotConst import BUGZILLA_DETAIL_URL, SUMMARY_MAX_LENGTH
-from generator.src.utils.Utils import logExecutionTime, noIntervalPolling, splitOverlengthReport, transformReport
+from generator.src.utils.Utils import logExecutionTime, RetryPolicy, splitOverlengthReport, transformReport
 from generator.src.utils.MiniQueryFunctions import short2long, \
    getShortUrlsFromCacheFile, getLastPRsFromCacheFile, updatePRsInCacheFile
 from generator.src.utils.Logger import logger
@@ -126,7 +126,7 @@ class BugzillaSpider(object):
       return dfDict, isTranspose, Axis2param.get(multiAxis, ''), ver, hor
 
    @logExecutionTime
-   @noIntervalPolling
+   @RetryPolicy(fallback="error")
    def readCsvFile(self, csvFile):
       df = pd.read_csv(csvFile)
       firstHeaderName = df.columns.values[0]
@@ -15,7 +15,7 @@ import datetime
 from lxml import etree
 from generator.src.utils.Logger import logger
 from generator.src.utils.BotConst import SERVICE_ACCOUNT, SERVICE_PASSWORD
-from generator.src.utils.Utils import logExecutionTime
+from generator.src.utils.Utils import logExecutionTime, RetryPolicy, raiseForStatus
 
 BUGZILLA_DOMAIN_NAME = "https://bugzilla-vcf.lvn.broadcom.net/"
 DOWNLOAD_DIR = os.path.join(os.path.abspath(__file__).split("/generator")[0], "persist/tmp/bugzilla-report")
@@ -41,7 +41,7 @@ class BugzillaUtils(object):
       try:
          reqData = {"Bugzilla_login": SERVICE_ACCOUNT, "Bugzilla_password": SERVICE_PASSWORD}
          session = requests.session()
-         response = session.post(BUGZILLA_DOMAIN_NAME, data=reqData)
+         response = RetryPolicy().call(session.post, BUGZILLA_DOMAIN_NAME, data=reqData, timeout=120)
          content = response.content.decode()
          html = etree.HTML(content)
          textList = html.xpath('//*[@id="bugzilla-body"]/div/div//text()')
@@ -55,8 +55,10 @@ class BugzillaUtils(object):
          raise Exception("I can't login %s now. "
                          "Maybe temporary bugzilla server down." % BUGZILLA_DOMAIN_NAME)
 
+   @RetryPolicy()
    def getHtml(self, bugzillaLink):
-      response = self._session.get(bugzillaLink)
+      response = self._session.get(bugzillaLink, timeout=120)
+      raiseForStatus(response)
       content = response.content.decode(errors='ignore')
       return etree.HTML(content)
 
@@ -72,10 +74,16 @@ class BugzillaUtils(object):
             self._session = self.getSession()
             self.html = self.getHtml(bugzillaLink)
 
+   @RetryPolicy()
+   def download(self, downloadUrl):
+      response = self._session.get(downloadUrl, timeout=120)
+      raiseForStatus(response)
+      return response
+
    def downloadCsvFile(self, downloadUrl):
       todayStr = datetime.datetime.today().strftime("%Y%m%d")
       csvFile = os.path.join(DOWNLOAD_DIR, "bugzilla{0}_{1}.csv".format(todayStr, uuid.uuid4()))
-      content = self._session.get(downloadUrl).content.strip()
+      content = self.download(downloadUrl).content.strip()
       if len(content) > 0:  # check the content of csv file
          with open(csvFile, "wb") as f:
             f.write(content)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+diff_engine.py
+Single pass diff parsing shared by perforce diff parser and review diff parser.
+- iterP4Diffs       `Differences ...` section of `p4 describe -a`, hunk header like `5769,5770c5801,5803`
+- iterUnifiedDiffs  review board patch, hunk header like `@@ -158,6 +158,71 @@`
+Both consume any iterable of lines once and yield (filePath, FileDiff) file by file,
+so a huge change is never held as a list of lines. Lines are dispatched by the first character,
+only the candidates of a hunk header are matched by the compiled regex.
+Binary files are skipped. If maxFileLines or maxChangeLines is given, DiffTooLarge is raised
+once a file or the whole change has more diff lines than that, instead of exhausting the memory.
+Each parsed FileDiff carries a digest, so an identical file of a change and a review is accepted
+by comparing two digests. findCodeMismatch compares the lines of a mismatching file by
+(lineNo, hash) arrays, with numpy if it is installed.
+'''
+
+import re
+import sys
+import hashlib
+from array import array
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+# `85c85`, `90,91c90`, `104c103,104`, `5769,5770c5801,5803`
+P4_HUNK_PATTERN = re.compile(r"^(\d+)(?:,(\d+))?([acd])(\d+)(?:,(\d+))?$")
+# `@@ -158,6 +158,71 @@ test_all_done(...)`, the line count is omitted when it is 1
+UNIFIED_HUNK_PATTERN = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# review board marks a fully deleted file by this value instead of a fileDiff
+DELETED_FILE = "delete"
+
+class DiffTooLarge(Exception):
+   def __str__(self):
+      return "too large to compare: {0}".format(super().__str__())
+
+class FileDiff(object):
+   '''
+   Diff records of one file, iterated as tuple (+/-, lineNo, code).
+   Stored as parallel arrays and interned code strings, instead of one tuple per line.
+   digest is set by the parsers once the file is parsed, see computeDigest.
+   '''
+   __slots__ = ('signs', 'lineNos', 'codes', 'digest')
+   SIGNS = {'+': 1, '-': -1}
+   SIGN_CHARS = {1: '+', -1: '-'}
+
+   def __init__(self):
+      self.signs = array('b')
+      self.lineNos = array('i')
+      self.codes = []
+      self.digest = None
+
+   def append(self, sign, lineNo, code):
+      self.signs.append(FileDiff.SIGNS[sign])
+      self.lineNos.append(lineNo)
+      self.codes.append(sys.intern(code))
+
+   def __len__(self):
+      return len(self.codes)
+
+   def __iter__(self):
+      signChars = FileDiff.SIGN_CHARS
+      for sign, lineNo, code in zip(self.signs, self.lineNos, self.codes):
+         yield signChars[sign], lineNo, code
+
+   def __eq__(self, other):
+      return isinstance(other, FileDiff) and self.signs == other.signs and self.lineNos == other.lineNos \
+         and self.codes == other.codes
+
+   def computeDigest(self):
+      '''
+      Digest of the added lines and the deleted lines, each in lineNo order.
+      p4 and review board may print the '+' and '-' lines of a hunk in different order,
+      but the lines of one sign always go with increasing lineNo.
+      '''
+      hashObj = hashlib.blake2b(digest_size=16)
+      for sign in (1, -1):
+         hashObj.update("\0{0}\n".format(sign).encode())
+         for lineSign, lineNo, code in zip(self.signs, self.lineNos, self.codes):
+            if lineSign == sign:
+               hashObj.update("{0} {1}\n".format(lineNo, code).encode(errors='surrogatepass'))
+      self.digest = hashObj.digest()
+      return self
+
+   def getLines(self, sign):
+      '''(lineNos, codes) of the lines with sign '+' or '-' '''
+      value = FileDiff.SIGNS[sign]
+      lineNos, codes = [], []
+      for lineSign, lineNo, code in zip(self.signs, self.lineNos, self.codes):
+         if lineSign == value:
+            lineNos.append(lineNo)
+            codes.append(code)
+      return lineNos, codes
+
+   def __getstate__(self):
+      return self.signs, self.lineNos, self.codes, self.digest
+
+   def __setstate__(self, state):
+      self.signs, self.lineNos, self.codes = state[:3]
+      self.digest = state[3] if len(state) > 3 else None
+      if self.digest is None:
+         self.computeDigest()
+
+   def __repr__(self):
+      return "FileDiff({0})".format(list(self))
+
+def iterLines(text):
+   '''Same lines as text.split('\n'), without building the list'''
+   start = 0
+   while True:
+      end = text.find('\n', start)
+      if end < 0:
+         yield text[start:]
+         return
+      yield text[start:end]
+      start = end + 1
+
+def checkLineCount(filePath, fileLines, changeLines, maxFileLines, maxChangeLines):
+   if maxFileLines and fileLines > maxFileLines:
+      raise DiffTooLarge("{0} has more than {1} diff lines".format(filePath, maxFileLines))
+   if maxChangeLines and changeLines > maxChangeLines:
+      raise DiffTooLarge("change has more than {0} diff lines".format(maxChangeLines))
+
+def getP4FilePath(line):
+   '''
+   `==== //depot/bora/main/apps/crtbora/common/mks.cc#119 (text) ====` -> apps/crtbora/common/mks.cc
+   Only the path under the branch is kept, the same as the path in review board patch.
+   '''
+   depotFile = line[5:-5].split('#')[0]
+   return "/".join(depotFile.split("/")[5:])
+
+def getUnifiedFilePath(line):
+   '''
+   `+++ b/bora/lib/foo.c` -> bora/lib/foo.c, `--- //depot/bora/main/lib/foo.c` -> lib/foo.c, `+++ /dev/null` -> ''
+   '''
+   fields = line[4:].split()
+   path = fields[0] if fields else ''
+   if path.startswith("a/") or path.startswith("b/"):
+      return "/".join(path.split("/")[2:])
+   return "/".join(path.split("/")[5:])
+
+def isP4FileHeader(line):
+   return line.startswith('==== ') and line.endswith(' ====')
+
+def isP4BinaryFile(line):
+   '''The file type is at the end of the header, e.g. `==== //depot/bora/main/x.png#2 (binary+F) ====`'''
+   fileType = line[line.rfind('(') + 1:line.rfind(')')]
+   return 'binary' in fileType
+
+def iterP4Diffs(lines, addFiles=(), maxFileLines=None, maxChangeLines=None, binaryFiles=None):
+   '''
+   Yield (filePath, FileDiff) of each file in the `Differences ...` section of `p4 describe -a`.
+   Delete code's lineNo is at the left of `acd`, add code's lineNo at the right of `acd`:
+      300,305d299
+      <     *    enableDecoderWatermark - this switch enables/disables H264/HEVC/
+   The content of an added file is printed as is without `>`, its first line is lineNo 1.
+   :param addFiles: set of file paths added by the change
+   :param binaryFiles: set to collect the paths of skipped binary files
+   '''
+   filePath, fileDiff = None, None
+   isAddFile, isFirstLine = False, False
+   deleteLineNo, addLineNo = 0, 0
+   fileLines, changeLines = 0, 0
+   for line in lines:
+      if isP4FileHeader(line):
+         if filePath:
+            yield filePath, fileDiff.computeDigest()
+         filePath, fileDiff, fileLines = getP4FilePath(line), FileDiff(), 0
+         if isP4BinaryFile(line):
+            if binaryFiles is not None:
+               binaryFiles.add(filePath)
+            filePath = None
+            continue
+         isAddFile = filePath in addFiles
+         # Between file path and first line code of an added file, there is one empty line.
+         isFirstLine = isAddFile
+         deleteLineNo, addLineNo = 0, 1 if isAddFile else 0
+         continue
+      if filePath is None:
+         continue
+      fileLines += 1
+      changeLines += 1
+      if (maxFileLines and fileLines > maxFileLines) or (maxChangeLines and changeLines > maxChangeLines):
+         checkLineCount(filePath, fileLines, changeLines, maxFileLines, maxChangeLines)
+      line = line.rstrip('\r')
+      if isAddFile:
+         if isFirstLine:
+            isFirstLine = False
+            if not line.strip():
+               continue
+         if line:
+            fileDiff.append('+', addLineNo, line)
+         addLineNo += 1
+         continue
+      head = line[:1]
+      if '<' == head:  # delete
+         if line[2:]:
+            fileDiff.append('-', deleteLineNo, line[2:])
+         deleteLineNo += 1
+      elif '>' == head:  # add
+         if line[2:]:
+            fileDiff.append('+', addLineNo, line[2:])
+         addLineNo += 1
+      elif head.isdigit():
+         matchObj = P4_HUNK_PATTERN.match(line)
+         if matchObj:
+            deleteLineNo, addLineNo = int(matchObj.group(1)), int(matchObj.group(4))
+   if filePath:
+      yield filePath, fileDiff.computeDigest()
+
+def iterUnifiedDiffs(lines, maxFileLines=None, maxChangeLines=None):
+   '''
+   Yield (filePath, FileDiff) of each file in a unified diff, FileDiff is DELETED_FILE if the file is deleted.
+      --- a/bora/modules/vmkernel/wobtree/splinterdb/src/splinter_test.c
+      +++ b/bora/modules/vmkernel/wobtree/splinterdb/src/splinter_test.c
+      @@ -158,6 +158,71 @@ test_all_done(const uint8 done, const uint8 num_tables)
+          return (done == ((1 << num_tables) - 1));
+       }
+   The line counts of the hunk header tell where the hunk ends, so a deleted line starting with `-- `
+   is not taken for a `--- ` file header. Lines outside hunks like `diff --git` and `index ...` are skipped,
+   so are binary files, which have no hunk.
+   '''
+   filePath, oldPath, fileDiff = None, '', FileDiff()
+   hasHunk, contextCount = False, 0
+   deleteLineNo, addLineNo, oldLeft, newLeft = 0, 0, 0, 0
+   fileLines, changeLines = 0, 0
+   for line in lines:
+      if oldLeft > 0 or newLeft > 0:
+         fileLines += 1
+         changeLines += 1
+         if (maxFileLines and fileLines > maxFileLines) or (maxChangeLines and changeLines > maxChangeLines):
+            checkLineCount(filePath, fileLines, changeLines, maxFileLines, maxChangeLines)
+         head = line[:1]
+         if '-' == head:
+            if line[1:]:
+               fileDiff.append('-', deleteLineNo, line[1:])
+            deleteLineNo += 1
+            oldLeft -= 1
+            continue
+         if '+' == head:
+            if line[1:]:
+               fileDiff.append('+', addLineNo, line[1:])
+            addLineNo += 1
+            newLeft -= 1
+            continue
+         if ' ' == head or not line:
+            deleteLineNo += 1
+            addLineNo += 1
+            oldLeft -= 1
+            newLeft -= 1
+            contextCount += 1
+            continue
+         if '\\' == head:  # \ No newline at end of file
+            continue
+         # the hunk is shorter than its header says
+         oldLeft, newLeft = 0, 0
+      if line.startswith('@@'):
+         matchObj = UNIFIED_HUNK_PATTERN.match(line)
+         if matchObj:
+            deleteLineNo, addLineNo = int(matchObj.group(1)), int(matchObj.group(3))
+            oldLeft = int(matchObj.group(2)) if matchObj.group(2) is not None else 1
+            newLeft = int(matchObj.group(4)) if matchObj.group(4) is not None else 1
+            hasHunk = True
+      elif line.startswith('--- '):
+         if filePath and hasHunk:
+            yield filePath, getUnifiedFileDiff(fileDiff, contextCount)
+         filePath, oldPath, fileDiff = None, getUnifiedFilePath(line), FileDiff()
+         hasHunk, contextCount, fileLines = False, 0, 0
+      elif line.startswith('+++ '):
+         # the new path of a deleted file is /dev/null
+         filePath = getUnifiedFilePath(line) or oldPath
+   if filePath and hasHunk:
+      yield filePath, getUnifiedFileDiff(fileDiff, contextCount)
+
+def getUnifiedFileDiff(fileDiff, contextCount):
+   '''If one file's difference is '-' totally, it's a deleted file, just mark DELETED_FILE to skip compare detail.'''
+   if 0 == contextCount and 1 not in fileDiff.signs:
+      return DELETED_FILE
+   return fileDiff.computeDigest()
+
+def isSameDiff(reviewDiff, changeDiff):
+   return reviewDiff.digest is not None and reviewDiff.digest == changeDiff.digest
+
+def findCodeMismatch(reviewDiff, changeDiff, sign):
+   '''
+   Find a line number having different code in the review and the change among the '+' or '-' lines.
+   Line numbers only in one side are not compared, a later line of the same lineNo wins, as the old
+   compare by dicts {lineNo: code}.
+   :return: (lineNo, reviewCode, changeCode) of the smallest such lineNo, or None
+   '''
+   reviewLineNos, reviewCodes = reviewDiff.getLines(sign)
+   changeLineNos, changeCodes = changeDiff.getLines(sign)
+   if numpy is None:
+      reviewLines, changeLines = dict(zip(reviewLineNos, reviewCodes)), dict(zip(changeLineNos, changeCodes))
+      for lineNo in sorted(set(reviewLines) & set(changeLines)):
+         if reviewLines[lineNo] != changeLines[lineNo]:
+            return lineNo, reviewLines[lineNo], changeLines[lineNo]
+      return None
+   reviewIndexes = getLastIndexes(reviewLineNos)
+   changeIndexes = getLastIndexes(changeLineNos)
+   reviewHashes = numpy.array([hash(code) for code in reviewCodes], dtype=numpy.int64)[reviewIndexes]
+   changeHashes = numpy.array([hash(code) for code in changeCodes], dtype=numpy.int64)[changeIndexes]
+   reviewLineNos = numpy.array(reviewLineNos, dtype=numpy.int64)[reviewIndexes]
+   changeLineNos = numpy.array(changeLineNos, dtype=numpy.int64)[changeIndexes]
+   lineNos, reviewAt, changeAt = numpy.intersect1d(reviewLineNos, changeLineNos, assume_unique=True,
+                                                   return_indices=True)
+   for index in numpy.flatnonzero(reviewHashes[reviewAt] != changeHashes[changeAt]):
+      reviewCode = reviewCodes[reviewIndexes[reviewAt[index]]]
+      changeCode = changeCodes[changeIndexes[changeAt[index]]]
+      if reviewCode != changeCode:
+         return int(lineNos[index]), reviewCode, changeCode
+   return None
+
+def getLastIndexes(lineNos):
+   '''Indexes of lineNos sorted by lineNo, keeping the last index of a duplicated lineNo'''
+   lineNos = numpy.asarray(lineNos, dtype=numpy.int64)
+   order = numpy.argsort(lineNos, kind='stable')
+   sortedLineNos = lineNos[order]
+   isLast = numpy.ones(len(order), dtype=bool)
+   isLast[:-1] = sortedLineNos[:-1] != sortedLineNos[1:]
+   return order[isLast]
@@ -5,29 +5,70 @@
 '''
 Module docstring.  
 jira_api_util.py
+Search results are cached in persist/cache/jira-jql.db for JQL_CACHE_TTL seconds by normalized jql, so reports
+of the same jql with other titles or fields, and a report sent again soon, don't search jira again.
+Hits and misses of the cache are counted in the same database by all report processes, see logJqlCacheStats.
 '''
 
+import re
+import time
 import requests
+from collections import Counter
+from requests.adapters import HTTPAdapter
 from generator.src.utils.BotConst import JIRA_ACCESS_TOKEN, CONTENT_TYPE_JSON
+from generator.src.utils.Logger import logger
+from generator.src.utils.Utils import RetryPolicy, HttpStatusError, boundedMap
+from generator.src.utils.DiskCache import DiskCache
 
 JIRA_ISSUE_API = 'https://vmw-jira.broadcom.net/rest/api/2/issue'
 JIRA_SEARCH_API = 'https://vmw-jira.broadcom.net/rest/api/2/search'
+# issues asked in one search page, jira may return less if its limit is lower
+SEARCH_PAGE_SIZE = 50
+# pages after the first one are searched at the same time
+SEARCH_WORKERS = 4
 
+# jira issues change, a cached search result is only served for a few minutes
+JQL_CACHE_TTL = 300
+# the logged hit ratio of all processes is over this many seconds
+JQL_CACHE_STATS_PERIOD = 24 * 3600
+QUOTED_PATTERN = re.compile(r'''("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')''')
+OPERATOR_SPACE_PATTERN = re.compile(r'\s*([=!~<>(),])\s*')
+# jql reserved words are case insensitive, unquoted field names and values like labels are not
+RESERVED_WORD_PATTERN = re.compile(r'\b(and|or|not|in|is|was|changed|empty|null|order|by|asc|desc)\b', re.IGNORECASE)
+
+# normalized jql -> {'fields': searched fields, 'limit': searched limit, 'total': total, 'issues': issues}
+jqlCache = DiskCache('jira-jql', maxBytes=128 * 1024 * 1024, ttl=JQL_CACHE_TTL)
+jqlCacheStats = Counter()
+
+# keep-alive connections shared by all requests to jira
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=SEARCH_WORKERS))
+
+def raiseJiraError(response):
+    status_code = response.status_code
+    try:
+        error_message = response.json().get('errorMessages', 'not found')
+    except ValueError:
+        error_message = response.reason
+    raise HttpStatusError(status_code, error_message)
+
+@RetryPolicy()
 def detail(jiraID):
     headers = {
         'Authorization': JIRA_ACCESS_TOKEN,
         "Content-Type": CONTENT_TYPE_JSON
     }
-    response = requests.get(
+    response = session.get(
         url=JIRA_ISSUE_API + "/" + jiraID,
-        headers=headers
+        headers=headers,
+        timeout=60
     )
     status_code = response.status_code
     if status_code == 200:
         return response.json()
-    error_message = response.json().get('errorMessages', 'not found')
-    raise Exception(f'{status_code} - {error_message}')
+    raiseJiraError(response)
 
+@RetryPolicy()
 def search(jql, startAt, maxResults, fields):
     '''
     JIRA API - searching for issues by jql
@@ -62,26 +103,121 @@ def search(jql, startAt, maxResults, fields):
         'Authorization': JIRA_ACCESS_TOKEN,
         "Content-Type": CONTENT_TYPE_JSON
     }
-    response = requests.get(
+    response = session.get(
         url=JIRA_SEARCH_API,
         headers=headers,
-        params=query
+        params=query,
+        timeout=120
     )
     status_code = response.status_code
     if status_code == 200:
         datas = response.json()
         return datas['startAt'], datas['maxResults'], datas['total'], datas['issues']
-    error_message = response.json().get('errorMessages', 'not found')
-    raise Exception(f'{status_code} - {error_message}')
-
-def queryIssuesByJql(jql, fields):
-    issueList = []
-    startAt, maxResults, total, issues = search(jql, 0, 50, fields)
-    issueList.extend(issues)
-    while len(issueList) < total:
-        startAt, maxResults, _, issues = search(jql, startAt + maxResults, 50, fields)
-        issueList.extend(issues)
-    return issueList
+    raiseJiraError(response)
+
+def searchIssuePages(jql, fields, limit=None, maxResults=SEARCH_PAGE_SIZE, maxWorkers=SEARCH_WORKERS):
+    '''
+    Yield (total, issues of one page) in page order. The first page tells the total and the page size jira
+    accepts, then the other pages are searched by maxWorkers threads. With limit, the pages after the first
+    limit issues are not searched.
+    A failed page is retried by search, an issue moved to the next page while searching is yielded once.
+    '''
+    firstPageSize = min(maxResults, limit) if limit else maxResults
+    startAt, pageSize, total, issues = search(jql, 0, firstPageSize, fields)
+    pageSize = pageSize if pageSize > 0 else firstPageSize
+    endAt = min(total, limit) if limit else total
+    def iterPages():
+        yield issues
+        searchPage = lambda pageStart: search(jql, pageStart, pageSize, fields)
+        for _, future in boundedMap(searchPage, range(startAt + pageSize, endAt, pageSize), maxWorkers=maxWorkers):
+            yield future.result()[3]
+    issueIds = set()
+    count = 0
+    for pageIssues in iterPages():
+        page = []
+        for issue in pageIssues:
+            issueId = issue.get('id')
+            if issueId is not None:
+                if issueId in issueIds:
+                    continue
+                issueIds.add(issueId)
+            page.append(issue)
+        if limit:
+            page = page[:limit - count]
+        count += len(page)
+        yield total, page
+        if limit and count >= limit:
+            return
+
+def normalizeJql(jql):
+    '''
+    Lower case the reserved words and drop the optional spaces outside of quoted values, which don't change the
+    jql results. Field names and values are kept as written.
+    '''
+    parts = QUOTED_PATTERN.split(jql.strip())
+    for index in range(0, len(parts), 2):
+        part = OPERATOR_SPACE_PATTERN.sub(r'\1', ' '.join(parts[index].split()))
+        parts[index] = RESERVED_WORD_PATTERN.sub(lambda matchObj: matchObj.group(1).lower(), part)
+    return ''.join(parts)
+
+def isCachedResultEnough(cached, fields, limit):
+    if cached is None or not set(fields) <= set(cached['fields']):
+        return False
+    return cached['limit'] is None or (limit is not None and limit <= cached['limit'])
+
+def selectFields(issue, fields):
+    '''Issue of a field superset search with only the fields jira returns for fields'''
+    issue = dict(issue)
+    issue['fields'] = {field: value for field, value in issue.get('fields', {}).items() if field in fields}
+    return issue
+
+def iterIssuePages(jql, fields, limit=None, maxResults=SEARCH_PAGE_SIZE, maxWorkers=SEARCH_WORKERS, useCache=True):
+    '''
+    searchIssuePages through jqlCache. A cached search of the jql with the same or more fields and limit serves
+    the pages, otherwise the jql is searched with the fields of the cached search too, so the new result serves
+    both reports.
+    '''
+    if not useCache:
+        yield from searchIssuePages(jql, fields, limit, maxResults, maxWorkers)
+        return
+    key = normalizeJql(jql)
+    cached = jqlCache.get(key)
+    if isCachedResultEnough(cached, fields, limit):
+        jqlCacheStats['hit'] += 1
+        jqlCache.recordStats(hits=1)
+        issues = cached['issues'][:limit] if limit else cached['issues']
+        for start in range(0, max(len(issues), 1), maxResults):
+            yield cached['total'], [selectFields(issue, fields) for issue in issues[start:start + maxResults]]
+        return
+    jqlCacheStats['miss'] += 1
+    jqlCache.recordStats(misses=1)
+    searchFields, searchLimit = sorted(fields), limit
+    if cached is not None:
+        searchFields = sorted(set(fields) | set(cached['fields']))
+        if limit is not None:
+            searchLimit = None if cached['limit'] is None else max(limit, cached['limit'])
+    total, issues = 0, []
+    for total, page in searchIssuePages(jql, searchFields, searchLimit, maxResults, maxWorkers):
+        issues.extend(page)
+        if limit:
+            page = page[:max(0, limit - len(issues) + len(page))]
+        yield total, [selectFields(issue, fields) for issue in page]
+    jqlCache.set(key, {'fields': searchFields, 'limit': searchLimit, 'total': total, 'issues': issues})
+
+def getJqlCacheHitRatio(since=None):
+    '''Hit ratio of the jql cache in all report processes since the epoch time, of the last day by default'''
+    return jqlCache.getHitRatio(time.time() - JQL_CACHE_STATS_PERIOD if since is None else since)
+
+def logJqlCacheStats():
+    '''Log the hits of this process and the hit ratio of all report processes of the last day'''
+    hits, misses = jqlCache.getStats(time.time() - JQL_CACHE_STATS_PERIOD)
+    logger.info("jql cache hit {0}/{1} in this process, hit ratio {2:.2f} of {3} searches in the last day".format(
+        jqlCacheStats['hit'], jqlCacheStats['hit'] + jqlCacheStats['miss'],
+        hits / (hits + misses) if hits + misses else 0.0, hits + misses))
+
+def queryIssuesByJql(jql, fields, maxResults=SEARCH_PAGE_SIZE, maxWorkers=SEARCH_WORKERS):
+    '''Search all issues of the jql, see iterIssuePages'''
+    return [issue for _, page in iterIssuePages(jql, fields, None, maxResults, maxWorkers) for issue in page]
 
 # jql = 'issuekey IN parentIssuesOf("{0}")'.format('VSANCORE-16532')
 # issues = queryIssuesByJql(jql, ["id", "labels", "priority"])
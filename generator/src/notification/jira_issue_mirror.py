@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+jira_issue_mirror.py
+Local mirror of the issues of a jql in persist/cache/jira-mirror.db, for big standing jqls like a whole project.
+The first sync searches all issues, then a sync only searches the issues updated since the last sync by
+`(<jql>) AND updated >= -<N>m`, the relative time doesn't depend on the timezone of jira user.
+An issue leaving the jql isn't found by the updated search, so the issues and their order are reconciled by
+an ID-only search of the jql every MIRROR_FULL_SCAN_INTERVAL seconds, when the mirrored count doesn't match
+the total of the jql, when an update in a jql ordered by mutable fields like `ORDER BY updated DESC` moves
+the issues, or when a new issue can't be ranked. A newly created issue of a jql ordered by key, id or
+created is ranked first or last without the ID-only search.
+'''
+
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import threading
+from generator.src.utils.Logger import logger
+from jira_api_util import search, searchIssuePages, normalizeJql, selectFields, SEARCH_PAGE_SIZE
+
+MIRROR_PATH = os.path.join(os.path.abspath(__file__).split("/generator")[0], "persist/cache/jira-mirror.db")
+MIRROR_FULL_SCAN_INTERVAL = 6 * 3600
+# issues updated while the last sync was searching are searched again
+MIRROR_SYNC_OVERLAP_MINUTES = 2
+# issues of one `id in (...)` search
+MIRROR_ID_SEARCH_SIZE = 200
+ORDER_BY_PATTERN = re.compile(r'\border\s+by\b', re.IGNORECASE)
+# the order of the mirrored issues by these fields doesn't change when an issue is updated,
+# and a newly created issue is the last of them, as the ids increase with the creation
+IMMUTABLE_ORDER_FIELDS = {'key', 'issuekey', 'id', 'created', 'createddate'}
+
+def splitOrderBy(jql):
+   '''Split "<filter> ORDER BY <fields>" to the filter and the order by clause, the clause is '' if missing'''
+   matchObjs = list(ORDER_BY_PATTERN.finditer(jql))
+   if not matchObjs:
+      return jql.strip(), ''
+   return jql[:matchObjs[-1].start()].strip(), jql[matchObjs[-1].start():].strip()
+
+def isOrderedByMutableFields(jql):
+   '''True if the jql is ordered by a field other than IMMUTABLE_ORDER_FIELDS, e.g. updated or priority'''
+   orderBy = splitOrderBy(jql)[1]
+   if not orderBy:
+      return False
+   orderFields = [item.split()[0].strip('"').lower() for item in ORDER_BY_PATTERN.sub('', orderBy).split(',')
+                  if item.strip()]
+   return any(field not in IMMUTABLE_ORDER_FIELDS for field in orderFields)
+
+def getFirstOrderItem(jql):
+   '''[field, direction] of the first field of the order by clause, [] if the jql isn't ordered'''
+   return ORDER_BY_PATTERN.sub('', splitOrderBy(jql)[1]).split(',')[0].split()
+
+def getFirstOrderField(jql):
+   orderItem = getFirstOrderItem(jql)
+   return orderItem[0].strip('"').lower() if orderItem else ''
+
+def isOrderedDescending(jql):
+   '''True if the first field of the order by clause is DESC'''
+   orderItem = getFirstOrderItem(jql)
+   return len(orderItem) > 1 and 'desc' == orderItem[1].lower()
+
+def getKeyProject(issueKey):
+   '''VSAN-123 -> VSAN'''
+   return issueKey.rsplit('-', 1)[0]
+
+class JiraIssueMirror(object):
+   def __init__(self, path=MIRROR_PATH):
+      self.path = path
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      self.lock = threading.Lock()
+      self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+      self.conn.execute("PRAGMA journal_mode=WAL")
+      self.conn.execute("CREATE TABLE IF NOT EXISTS syncs (jql TEXT PRIMARY KEY, fields TEXT, lastSync REAL, "
+                        "lastFullScan REAL)")
+      self.conn.execute("CREATE TABLE IF NOT EXISTS issues (jql TEXT, id TEXT, rank INTEGER, issue TEXT, "
+                        "PRIMARY KEY (jql, id))")
+      self.conn.commit()
+
+   def getSync(self, key):
+      row = self.conn.execute("SELECT fields, lastSync, lastFullScan FROM syncs WHERE jql = ?", (key,)).fetchone()
+      return None if row is None else (json.loads(row[0]), row[1], row[2])
+
+   def countIssues(self, key):
+      return self.conn.execute("SELECT COUNT(*) FROM issues WHERE jql = ?", (key,)).fetchone()[0]
+
+   def saveIssues(self, key, issues, ranks=None):
+      '''
+      Insert or update the issues, a new issue without rank is ranked after the mirrored issues.
+      Return the number of new issues.
+      '''
+      nextRank = self.conn.execute("SELECT COALESCE(MAX(rank), -1) + 1 FROM issues WHERE jql = ?",
+                                   (key,)).fetchone()[0]
+      newCount = 0
+      for issue in issues:
+         row = self.conn.execute("SELECT rank FROM issues WHERE jql = ? AND id = ?", (key, issue['id'])).fetchone()
+         newCount += row is None
+         rank = ranks.get(issue['id']) if ranks else None
+         if rank is None:
+            if row is None:
+               rank, nextRank = nextRank, nextRank + 1
+            else:
+               rank = row[0]
+         self.conn.execute("INSERT OR REPLACE INTO issues (jql, id, rank, issue) VALUES (?, ?, ?, ?)",
+                           (key, issue['id'], rank, json.dumps(issue)))
+      return newCount
+
+   def rankNewIssues(self, key, jql, issues):
+      '''
+      Rank the new issues of an updated search without searching the jql, return {id: rank} of them.
+      In a jql ordered by the creation of the issues, an issue created after all mirrored issues goes last,
+      or first if it is ordered descending. Return None if a new issue can't be ranked so, e.g. an old issue
+      joined the jql, then the mirror is reconciled.
+      '''
+      mirroredIds = set()
+      for issue in issues:
+         if self.conn.execute("SELECT 1 FROM issues WHERE jql = ? AND id = ?", (key, issue['id'])).fetchone():
+            mirroredIds.add(issue['id'])
+      newIssues = sorted([issue for issue in issues if issue['id'] not in mirroredIds],
+                         key=lambda issue: int(issue['id']))
+      if not newIssues:
+         return {}
+      orderField = getFirstOrderField(jql)
+      if orderField not in IMMUTABLE_ORDER_FIELDS:
+         return None
+      descending = isOrderedDescending(jql)
+      maxId, minRank, maxRank = self.conn.execute("SELECT MAX(CAST(id AS INTEGER)), MIN(rank), MAX(rank) "
+                                                  "FROM issues WHERE jql = ?", (key,)).fetchone()
+      if maxId is not None and int(newIssues[0]['id']) <= maxId:
+         return None
+      if orderField in ('key', 'issuekey') and maxId is not None:
+         # keys are ordered by project first, the new issues must be of the project at the end of the mirror
+         row = self.conn.execute("SELECT issue FROM issues WHERE jql = ? AND rank = ?",
+                                 (key, minRank if descending else maxRank)).fetchone()
+         project = getKeyProject(json.loads(row[0]).get('key', ''))
+         if any(getKeyProject(issue.get('key', '')) != project for issue in newIssues):
+            return None
+      if descending:
+         firstRank = (0 if minRank is None else minRank) - 1
+         return {issue['id']: firstRank - index for index, issue in enumerate(newIssues)}
+      firstRank = (-1 if maxRank is None else maxRank) + 1
+      return {issue['id']: firstRank + index for index, issue in enumerate(newIssues)}
+
+   def sync(self, jql, fields):
+      '''
+      Bring the mirror of the jql up to date, the first sync or a sync of new fields searches all issues.
+      The issues are searched before each write, so a write transaction never waits for jira and a report of
+      another process reading or syncing the mirror isn't blocked for long.
+      '''
+      key = normalizeJql(jql)
+      with self.lock:
+         try:
+            self.syncLocked(key, jql, fields)
+         except sqlite3.OperationalError:
+            self.conn.rollback()
+            raise
+
+   def syncLocked(self, key, jql, fields):
+      syncStart = time.time()
+      syncInfo = self.getSync(key)
+      if syncInfo is None or not set(fields) <= set(syncInfo[0]):
+         # keep the mirrored fields, so reports of the jql with other fields don't sync all issues in turn
+         self.fullSync(key, jql, sorted(set(fields) | set(syncInfo[0] if syncInfo else [])), syncStart)
+         return
+      mirroredFields, lastSync, lastFullScan = syncInfo
+      updatedCount, newIssuesRanked = self.deltaSync(key, jql, mirroredFields, lastSync)
+      total = search(jql, 0, 0, ['id'])[2]
+      # an updated issue keeps its rank, which is wrong if the jql is ordered by fields an update can change
+      staleOrder = not newIssuesRanked or (updatedCount > 0 and isOrderedByMutableFields(jql))
+      if syncStart - lastFullScan > MIRROR_FULL_SCAN_INTERVAL or total != self.countIssues(key) or staleOrder:
+         logger.info("reconcile jira mirror of {0}, mirrored {1} total {2}".format(jql, self.countIssues(key),
+                                                                                    total))
+         self.reconcile(key, jql, mirroredFields)
+         lastFullScan = syncStart
+      self.conn.execute("UPDATE syncs SET lastSync = ?, lastFullScan = ? WHERE jql = ?",
+                        (syncStart, lastFullScan, key))
+      self.conn.commit()
+
+   def fullSync(self, key, jql, fields, syncStart):
+      issues = [issue for _, page in searchIssuePages(jql, fields) for issue in page]
+      self.conn.execute("DELETE FROM issues WHERE jql = ?", (key,))
+      self.saveIssues(key, issues, {issue['id']: rank for rank, issue in enumerate(issues)})
+      self.conn.execute("INSERT OR REPLACE INTO syncs (jql, fields, lastSync, lastFullScan) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(fields), syncStart, syncStart))
+      self.conn.commit()
+      logger.info("full sync jira mirror of {0}: {1} issues".format(jql, len(issues)))
+
+   def deltaSync(self, key, jql, fields, lastSync):
+      '''
+      Save the issues updated since the last sync, return the number of them and False if the new issues
+      among them aren't ranked, see rankNewIssues.
+      '''
+      jqlFilter, orderBy = splitOrderBy(jql)
+      minutes = int(math.ceil((time.time() - lastSync) / 60)) + MIRROR_SYNC_OVERLAP_MINUTES
+      deltaJql = '({0}) AND updated >= -{1}m {2}'.format(jqlFilter, minutes, orderBy).strip()
+      issues = [issue for _, page in searchIssuePages(deltaJql, fields) for issue in page]
+      newRanks = self.rankNewIssues(key, jql, issues)
+      newCount = self.saveIssues(key, issues, newRanks)
+      self.conn.commit()
+      logger.info("delta sync jira mirror of {0}: {1} issues updated in {2} minutes, {3} new".format(
+         jql, len(issues), minutes, newCount))
+      return len(issues), newRanks is not None
+
+   def reconcile(self, key, jql, fields):
+      '''Delete the issues left the jql, search the issues joined it without update, rank the issues as jira'''
+      ranks = {}
+      for _, page in searchIssuePages(jql, ['id']):
+         for issue in page:
+            ranks[issue['id']] = len(ranks)
+      mirroredIds = set(row[0] for row in self.conn.execute("SELECT id FROM issues WHERE jql = ?", (key,)))
+      missingIds = [issueId for issueId in ranks if issueId not in mirroredIds]
+      missingIssues = []
+      for start in range(0, len(missingIds), MIRROR_ID_SEARCH_SIZE):
+         idJql = 'id in ({0})'.format(','.join(missingIds[start:start + MIRROR_ID_SEARCH_SIZE]))
+         missingIssues += [issue for _, page in searchIssuePages(idJql, fields) for issue in page]
+      self.conn.executemany("DELETE FROM issues WHERE jql = ? AND id = ?",
+                            [(key, issueId) for issueId in mirroredIds - set(ranks)])
+      self.conn.executemany("UPDATE issues SET rank = ? WHERE jql = ? AND id = ?",
+                            [(rank, key, issueId) for issueId, rank in ranks.items() if issueId in mirroredIds])
+      self.saveIssues(key, missingIssues, ranks)
+      self.conn.commit()
+
+   def iterIssuePages(self, jql, fields, limit=None, maxResults=SEARCH_PAGE_SIZE):
+      '''Yield (total, issues of one page) like jira_api_util.iterIssuePages, read from the synced mirror'''
+      key = normalizeJql(jql)
+      total = self.countIssues(key)
+      sql = "SELECT issue FROM issues WHERE jql = ? ORDER BY rank"
+      if limit:
+         sql += " LIMIT {0}".format(int(limit))
+      cursor = self.conn.execute(sql, (key,))
+      while True:
+         rows = cursor.fetchmany(maxResults)
+         yield total, [selectFields(json.loads(row[0]), fields) for row in rows]
+         if len(rows) < maxResults:
+            return
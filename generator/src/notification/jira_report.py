@@ -27,13 +27,14 @@ jira_report.py
 '''
 import os
 import re
+import sqlite3
 import argparse
-import itertools
-from collections import defaultdict
+from collections import Counter
 from typing import Dict, Union, Any
 import json
 from urllib import parse
-from jira_api_util import queryIssuesByJql
+from jira_api_util import iterIssuePages, logJqlCacheStats
+from jira_issue_mirror import JiraIssueMirror
 from generator.src.utils.BotConst import BUGZILLA_DETAIL_URL, JIRA_BROWSE_URL, SUMMARY_MAX_LENGTH
 from generator.src.utils.Logger import logger
 from generator.src.utils.Utils import splitOverlengthReport, transformReport
@@ -43,6 +44,10 @@ os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
 JIRA_PAGE_URL = 'https://vmw-jira.broadcom.net/issues/?jql='
 MAX_TOTAL_RESULT_SIZE = 50
+# values of the pivot field shown in the pivot table, the other values are counted in one cell
+PIVOT_MAX_COLUMNS = 10
+PIVOT_OTHER_NAME = 'Other'
+PIVOT_CELL_INDENT = '        '
 DisplayFields = {'key': 'Jira ID',
                  'issuetype': 'Type',
                  'priority': 'Pri',
@@ -60,6 +65,111 @@ DisplayFields = {'key': 'Jira ID',
                  'description': 'Desc',
                  'summary': 'Summary'}
 
+# display value of a field of unexpected shape is '', e.g. null assignee, list of component dicts
+IGNORED_FIELD_ERRORS = (AttributeError, TypeError, ValueError)
+
+def getCustomFieldValue(value):
+   if value is None:
+      return ''
+   elif isinstance(value, str):
+      return value
+   elif isinstance(value, list):
+      return ','.join(value)
+   elif isinstance(value, dict):
+      return value.get('value') or value.get('name') or '---'  # '---' if not found
+   else:
+      return '---'  # not found
+
+# custom field value of the type -> display value
+CUSTOM_SHAPE_EXTRACTORS = {str: lambda value: value,
+                           list: ','.join,
+                           dict: lambda value: value.get('value') or value.get('name') or '---'}
+
+def compileCustomFieldExtractor(field):
+   '''
+   The display value of a custom field depends on its shape, which is the same for all issues in practice.
+   The shape is detected from the first non-null value, a value of another shape falls back to getCustomFieldValue.
+   '''
+   shapeType, extractByShape = None, None
+   def extract(issue, issueFields):
+      nonlocal shapeType, extractByShape
+      value = issueFields.get(field)
+      if value is None:
+         return ''
+      if shapeType is None:
+         shapeType = type(value)
+         extractByShape = CUSTOM_SHAPE_EXTRACTORS.get(shapeType, getCustomFieldValue)
+      try:
+         return extractByShape(value) if type(value) is shapeType else getCustomFieldValue(value)
+      except IGNORED_FIELD_ERRORS:
+         return ''
+   return extract
+
+def compileFieldExtractor(field):
+   '''
+   Return function(issue, issueFields) -> display value of the field, issueFields is issue['fields'].
+   The field name is matched once per report here instead of once per issue.
+   '''
+   if field in ('id', 'key'):
+      def extract(issue, issueFields):
+         return issue[field]
+   elif field in ('labels', 'components'):
+      def extract(issue, issueFields):
+         try:
+            return ','.join(issueFields.get(field, []))
+         except IGNORED_FIELD_ERRORS:
+            return ''
+   elif field in ('priority', 'status', 'issuetype'):
+      def extract(issue, issueFields):
+         try:
+            return issueFields.get(field, {}).get('name', '')
+         except IGNORED_FIELD_ERRORS:
+            return ''
+   elif field in ('assignee', 'reporter'):
+      def extract(issue, issueFields):
+         try:
+            return issueFields.get(field, {}).get('emailAddress', '').split('@')[0]
+         except IGNORED_FIELD_ERRORS:
+            return ''
+   elif field in ('duedate', 'created', 'updated'):
+      def extract(issue, issueFields):
+         try:
+            return issueFields.get(field, '').split('T')[0]
+         except IGNORED_FIELD_ERRORS:
+            return ''
+   elif field in ('summary', 'description'):
+      def extract(issue, issueFields):
+         try:
+            words = issueFields.get(field, '')
+            words = words if len(words) < SUMMARY_MAX_LENGTH else words[:SUMMARY_MAX_LENGTH - 3] + "..."
+            return words.replace('\n', '').replace('\r', '').replace('```', '')
+         except IGNORED_FIELD_ERRORS:
+            return ''
+   elif field == 'project':
+      def extract(issue, issueFields):
+         try:
+            project = issueFields.get(field, {})
+            return '[{0}][{1}]'.format(project.get('name', ''), project.get('projectCategory', {}).get('name', ''))
+         except IGNORED_FIELD_ERRORS:
+            return ''
+   elif field == 'customfield_10051':  # PR
+      def extract(issue, issueFields):
+         try:
+            return issueFields.get(field, '').rstrip('.0')
+         except IGNORED_FIELD_ERRORS:
+            return ''
+   else:
+      extract = compileCustomFieldExtractor(field)
+   return extract
+
+def compileIssueExtractor(fields):
+   '''Return function(issue) -> {field: display value} of the fields'''
+   extractors = [(field, compileFieldExtractor(field)) for field in fields]
+   def extract(issue):
+      issueFields = issue.get('fields', {})
+      return {field: extractField(issue, issueFields) for field, extractField in extractors}
+   return extract
+
 class JiraReport(object):
    def __init__(self, args):
       self.title = parse.unquote(args.title)
@@ -71,67 +181,71 @@ class JiraReport(object):
          self.fields = ["id", "key"] + fields
       elif self.groupbyField not in self.fields:
          self.fields.append(self.groupbyField)
+      # pivot mode counts the issues by group by field (rows) and pivot field (columns) in one search
+      self.pivotField = args.pivot if self.groupbyField != 'none' else 'none'
+      if self.pivotField != 'none' and self.pivotField not in self.fields:
+         self.fields.append(self.pivotField)
       self.creator = args.creator
       logger.debug('user define jql: {}'.format(self.jql))
       logger.debug('user define fields: {}'.format(fields))
       logger.debug('user define group by field: {}'.format(self.groupbyField))
+      logger.debug('user define pivot field: {}'.format(self.pivotField))
       self.totalSize = 0
+      self.extractIssue = compileIssueExtractor(self.fields)
+      self.extractGroupby = compileFieldExtractor(self.groupbyField)
+      self.extractPivot = compileFieldExtractor(self.pivotField)
+      self.mirror = JiraIssueMirror() if 'Yes' == args.mirror else None
+
+   def IterIssuePages(self, jql, limit=None):
+      '''Search the pages from jira, or from the local mirror after it is synced with jira'''
+      if self.mirror is not None:
+         try:
+            self.mirror.sync(jql, self.fields)
+            return self.mirror.iterIssuePages(jql, self.fields, limit=limit)
+         except sqlite3.OperationalError as e:  # e.g. database is locked by the sync of another report
+            logger.error("jira mirror of {0} err: {1}, search jira instead".format(jql, e))
+      return iterIssuePages(jql, self.fields, limit=limit)
 
    def GetAllIssues(self):
+      '''Details of the first MAX_TOTAL_RESULT_SIZE issues, the pages after them are not searched'''
       logger.debug('Search jira list fields: {}'.format(self.fields))
       jql = self.jql.replace('currentUser()', self.creator)
-      issueList = queryIssuesByJql(jql, self.fields)
-      self.totalSize = len(issueList)
-      logger.debug('The number of overall issue is', self.totalSize)
-      if self.groupbyField == 'none':
-         issueList = issueList[:MAX_TOTAL_RESULT_SIZE]
       details = []
-      for issue in issueList:
-         detail = {}
-         issueFields = issue.get('fields', {})
-         for field in self.fields:
-            if field in ('id', 'key'):
-               detail[field] = issue[field]
-            else:
-               try:
-                  if field in ('labels', 'components'):
-                     detail[field] = ','.join(issueFields.get(field, []))
-                  elif field in ('priority', 'status', 'issuetype'):
-                     detail[field] = issueFields.get(field, {}).get('name', '')
-                  elif field in ('assignee', 'reporter'):
-                     detail[field] = issueFields.get(field, {}).get('emailAddress', '').split('@')[0]
-                  elif field in ('duedate', 'created', 'updated'):
-                     detail[field] = issueFields.get(field, '').split('T')[0]
-                  elif field in ('summary', 'description'):
-                     words = issueFields.get(field, '')
-                     words = words if len(words) < SUMMARY_MAX_LENGTH else words[:SUMMARY_MAX_LENGTH - 3] + "..."
-                     detail[field] = words.replace('\n', '').replace('\r', '').replace('```', '')
-                  elif field == 'project':
-                     detail[field] = '[{0}][{1}]'.format(issueFields.get(field, {}).get('name', ''),
-                                                         issueFields.get(field, {}).get('projectCategory', {}).get('name', ''))
-                  elif field == 'customfield_10051':  # PR
-                     detail[field] = issueFields.get(field, '').rstrip('.0')
-                  else:
-                     if issueFields.get(field) is None:
-                        detail[field] = ''
-                     elif isinstance(issueFields.get(field), str):
-                        detail[field] = issueFields.get(field)
-                     elif isinstance(issueFields.get(field), list):
-                        detail[field] = ','.join(issueFields.get(field))
-                     elif isinstance(issueFields.get(field), dict):
-                        if issueFields.get(field, {}).get('value'):
-                           detail[field] = issueFields.get(field, {}).get('value')
-                        elif issueFields.get(field, {}).get('name'):
-                           detail[field] = issueFields.get(field, {}).get('name')
-                        else:
-                           detail[field] = '---'  # not found
-                     else:
-                        detail[field] = '---'  # not found
-               except:
-                  detail[field] = ''
-         details.append(detail)
+      for total, issues in self.IterIssuePages(jql, limit=MAX_TOTAL_RESULT_SIZE):
+         self.totalSize = total
+         details.extend(map(self.extractIssue, issues))
+      logger.debug('The number of overall issue is {}'.format(self.totalSize))
       return details
 
+   def CountIssues(self):
+      '''
+      Count all issues by the value of the group by field, page by page while the pages are searched,
+      no issue is kept after it is counted.
+      '''
+      logger.debug('Search jira table fields: {}'.format(self.fields))
+      jql = self.jql.replace('currentUser()', self.creator)
+      groupbyCounter = Counter()
+      extract = self.extractGroupby
+      for _, issues in self.IterIssuePages(jql):
+         groupbyCounter.update(extract(issue, issue.get('fields', {})) for issue in issues)
+      self.totalSize = sum(groupbyCounter.values())
+      logger.debug('The number of overall issue is {}'.format(self.totalSize))
+      return groupbyCounter
+
+   def CountPivotIssues(self):
+      '''Count all issues by the values of the group by field and the pivot field, in one pass over the pages'''
+      logger.debug('Search jira pivot fields: {}'.format(self.fields))
+      jql = self.jql.replace('currentUser()', self.creator)
+      pivotCounter = Counter()
+      extractRow, extractColumn = self.extractGroupby, self.extractPivot
+      for _, issues in self.IterIssuePages(jql):
+         for issue in issues:
+            issueFields = issue.get('fields', {})
+            pivotCounter[(extractRow(issue, issueFields), extractColumn(issue, issueFields))] += 1
+      self.totalSize = sum(pivotCounter.values())
+      logger.debug('The number of overall issue is {}'.format(self.totalSize))
+      return pivotCounter
+
    def GetJiraList(self, issues):
       line_formatter = ""
       column_width: dict[str, int] = {}
@@ -170,32 +284,32 @@ class JiraReport(object):
       messages.append("```")
       return messages
 
-   def GetJiraTable(self, issues):
-      # Issues grouped by the specified field
-      groupbyDict = defaultdict(list)
-      for key, group in itertools.groupby(issues, lambda x: x[self.groupbyField]):
-         groupbyDict[key].extend(list(group))
-      urlTailDict = {}
-      numberDict = {}
-      urlTailDict[self.jql] = JIRA_PAGE_URL + parse.quote(self.jql)
-      numberDict['Total'] = len(issues)
-      if self.groupbyField.lower() == 'priority':  # Order by priority asc
+   def OrderGroupbyKeys(self, field, groupbyCounter):
+      if field.lower() == 'priority':  # Order by priority asc
          index_map = {}
          index = 0
-         for key in groupbyDict.keys():
+         for key in groupbyCounter.keys():
             result = re.findall("P[0-9]", key)
             if len(result) > 0:
                index_map[key] = result[0]
             else:
                index_map[key] = "Q{}".format(index)
                index += 1
-         orderedKeys = sorted(groupbyDict, key=lambda k: index_map[k], reverse=False)
+         return sorted(groupbyCounter, key=lambda k: index_map[k], reverse=False)
       else:  # Order by count desc
-         orderedKeys = sorted(groupbyDict, key=lambda k: len(groupbyDict[k]), reverse=True)
+         return sorted(groupbyCounter, key=lambda k: groupbyCounter[k], reverse=True)
+
+   def GetJiraTable(self, groupbyCounter):
+      # Issue count of each value of the specified field
+      urlTailDict = {}
+      numberDict = {}
+      urlTailDict[self.jql] = JIRA_PAGE_URL + parse.quote(self.jql)
+      numberDict['Total'] = sum(groupbyCounter.values())
+      orderedKeys = self.OrderGroupbyKeys(self.groupbyField, groupbyCounter)
       for key in orderedKeys:
          groupbyJql = self.jql + ' AND {0} = "{1}"'.format(self.groupbyField, key)
          urlTailDict[groupbyJql] = JIRA_PAGE_URL + parse.quote(groupbyJql)
-         numberDict[key] = len(groupbyDict[key])
+         numberDict[key] = groupbyCounter[key]
       # Generate simple table report
       messages = []
       fieldDisplayName = DisplayFields.get(self.groupbyField)
@@ -214,15 +328,71 @@ class JiraReport(object):
          messages.append(resultLine)
       return messages
 
+   def GetPivotTable(self, pivotCounter):
+      '''
+      One header line per value of the group by field with its count, then one line per value of the pivot field
+      with the count of the cell. Every count links to the jql of its row and column, like the counts of
+      GetJiraTable. Only the first PIVOT_MAX_COLUMNS values of the pivot field are shown, the other values are
+      counted in one "Other" cell, so a wide pivot doesn't flood the channel. Each line holds one link, so
+      splitOverlengthReport can always split the table under MAX_CHAR_LENGTH_IN_ONE_REPORT.
+      '''
+      rowCounter, columnCounter, rowCells = Counter(), Counter(), {}
+      for (rowKey, columnKey), count in pivotCounter.items():
+         rowCounter[rowKey] += count
+         columnCounter[columnKey] += count
+         rowCells.setdefault(rowKey, {})[columnKey] = count
+      orderedRows = self.OrderGroupbyKeys(self.groupbyField, rowCounter)
+      orderedColumns = self.OrderGroupbyKeys(self.pivotField, columnCounter)
+      shownColumns, otherColumns = orderedColumns[:PIVOT_MAX_COLUMNS], set(orderedColumns[PIVOT_MAX_COLUMNS:])
+      otherCondition = ' AND {0} not in ({1})'.format(self.pivotField,
+                                                      ', '.join('"{0}"'.format(key) for key in shownColumns))
+      def getLine(conditions, count, name, indent=''):
+         drillDownJql = self.jql + ''.join(' AND {0} = "{1}"'.format(field, key) for field, key in conditions)
+         if name == PIVOT_OTHER_NAME:
+            drillDownJql += otherCondition
+         resultLine = indent + '<%s|%s>' % (JIRA_PAGE_URL + parse.quote(drillDownJql), str(count))
+         resultLine += '             '
+         if count < 100:
+            resultLine += '  '
+         if count < 10:
+            resultLine += '  '
+         return resultLine + name
+      def getCellLines(rowConditions, cellCounter):
+         lines = [getLine(rowConditions + [(self.pivotField, columnKey)], cellCounter[columnKey], columnKey,
+                          PIVOT_CELL_INDENT) for columnKey in shownColumns if cellCounter.get(columnKey)]
+         otherCount = sum(cellCounter.get(columnKey, 0) for columnKey in otherColumns)
+         if otherCount:
+            lines.append(getLine(rowConditions, otherCount, PIVOT_OTHER_NAME, PIVOT_CELL_INDENT))
+         return lines
+      messages = []
+      messages.append('Count         {0} / {1}'.format(DisplayFields.get(self.groupbyField, self.groupbyField),
+                                                      DisplayFields.get(self.pivotField, self.pivotField)))
+      messages.append('---------------------------')
+      messages.append(getLine([], sum(rowCounter.values()), 'Total'))
+      messages.extend(getCellLines([], columnCounter))
+      for rowKey in orderedRows:
+         rowConditions = [(self.groupbyField, rowKey)]
+         messages.append(getLine(rowConditions, rowCounter[rowKey], rowKey))
+         messages.extend(getCellLines(rowConditions, rowCells[rowKey]))
+      return messages
+
    def GetReport(self):
-      issues = self.GetAllIssues()
+      if self.pivotField != 'none':
+         pivotCounter = self.CountPivotIssues()
+      elif self.groupbyField != 'none':
+         groupbyCounter = self.CountIssues()
+      else:
+         issues = self.GetAllIssues()
       is_empty = (self.totalSize == 0)
       messages = ["*Title: {}*".format(self.title)]
       if is_empty:
          messages.append("No issues currently.")
          reports = ["\n".join(messages)]
+      elif self.pivotField != 'none':
+         messages.extend(self.GetPivotTable(pivotCounter))
+         reports = splitOverlengthReport(messages, isContentInCodeBlock=False, enablePagination=False)
       elif self.groupbyField != 'none':
-         table = self.GetJiraTable(issues)
+         table = self.GetJiraTable(groupbyCounter)
          messages.extend(table)
          reports = splitOverlengthReport(messages, isContentInCodeBlock=False, enablePagination=False)
       else:
@@ -245,7 +415,11 @@ def parseArgs():
    parser.add_argument('--jql', type=str, required=True, help='short link of bugzilla')
    parser.add_argument('--fields', type=str, required=True, help='display issue list which column named by fields')
    parser.add_argument('--groupby', type=str, required=True, help='display issue table group by the field')
+   parser.add_argument('--pivot', type=str, default='none',
+                       help='display issue table group by the group by field and this field, needs --groupby')
    parser.add_argument('--creator', type=str, required=True, help='use to replace currentUser() in jql')
+   parser.add_argument('--mirror', type=str, default='No', choices=['Yes', 'No'],
+                       help='render from the local mirror of the jql, only the updated issues are searched')
    return parser.parse_args()
 
 if __name__ == "__main__":
@@ -254,3 +428,4 @@ if __name__ == "__main__":
    ret = generator.GetReport()
    print(ret)
    logger.info(ret)
+   logJqlCacheStats()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+perforce_change_index.py
+Local index of submitted changes per branch, saved in persist/cache/p4-change-index.db.
+Each branch keeps a watermark: the last CLN synced and the earliest submit time covered.
+Every sync only asks perforce for the delta `//depot/<branch>/...@<last CLN + 1>,@now`,
+so the reports sharing one branch don't scan the branch again and again.
+Submitted CLN increases with submit time, because perforce renumbers a change when it is submitted.
+'''
+
+import os
+import sqlite3
+from filelock import FileLock
+from generator.src.utils.Logger import logger
+from generator.src.utils.Utils import RetryPolicy
+from perforce_client import ChangeRecord, formatP4Time, isExcluded
+
+INDEX_PATH = os.path.join(os.path.abspath(__file__).split("/generator")[0], "persist/cache/p4-change-index.db")
+
+def toP4Date(epoch):
+   return formatP4Time(epoch, "%Y/%m/%d:%H:%M:%S")
+
+class ChangeIndex(object):
+   def __init__(self, p4Client, relogin=None, path=INDEX_PATH):
+      self.p4Client = p4Client
+      self.relogin = relogin
+      self.path = path
+      # branch -> startTime synced in this run, so the users of one report share one delta query
+      self.syncedBranches = {}
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+      self.conn.execute("PRAGMA journal_mode=WAL")
+      self.conn.execute("CREATE TABLE IF NOT EXISTS changes (branch TEXT, cln INTEGER, user TEXT, client TEXT, "
+                        "time INTEGER, desc TEXT, PRIMARY KEY (branch, cln))")
+      self.conn.execute("CREATE INDEX IF NOT EXISTS changes_time ON changes (branch, time)")
+      self.conn.execute("CREATE TABLE IF NOT EXISTS watermark (branch TEXT PRIMARY KEY, lastCln INTEGER, "
+                        "startTime INTEGER)")
+      self.conn.commit()
+
+   @RetryPolicy(relogin=lambda self, *args: self.relogin() if self.relogin else None)
+   def fetchChanges(self, path):
+      return list(self.p4Client.changes([path], longDesc=True, excludeKeyword=None, nTimeOut=5000))
+
+   def saveChanges(self, branch, changes):
+      self.conn.executemany("INSERT OR REPLACE INTO changes (branch, cln, user, client, time, desc) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            [(branch, int(c.cln), c.user, c.client, c.time, c.desc) for c in changes])
+
+   def sync(self, branch, startTime):
+      '''
+      Make the index of the branch cover [startTime, now].
+      :param startTime: epoch time
+      '''
+      startTime = int(startTime)
+      depotPath = "//depot/{0}/...".format(branch)
+      with FileLock(self.path + ".lock"):
+         row = self.conn.execute("SELECT lastCln, startTime FROM watermark WHERE branch = ?", (branch,)).fetchone()
+         lastCln, coveredStartTime = row if row else (0, startTime)
+         changes = []
+         if startTime < coveredStartTime:
+            # backfill the earlier window once
+            changes += self.fetchChanges("{0}@{1},{2}".format(depotPath, toP4Date(startTime),
+                                                              toP4Date(coveredStartTime)))
+            coveredStartTime = startTime
+         if lastCln > 0:
+            delta = self.fetchChanges("{0}@{1},@now".format(depotPath, lastCln + 1))
+         else:
+            delta = self.fetchChanges("{0}@{1},@now".format(depotPath, toP4Date(coveredStartTime)))
+         changes += delta
+         lastCln = max([int(change.cln) for change in delta] + [lastCln])
+         self.saveChanges(branch, changes)
+         self.conn.execute("INSERT OR REPLACE INTO watermark (branch, lastCln, startTime) VALUES (?, ?, ?)",
+                           (branch, lastCln, coveredStartTime))
+         self.conn.commit()
+      logger.info("sync change index of {0}: {1} new changes, last CLN {2}".format(branch, len(changes), lastCln))
+
+   def query(self, branches, startTime, endTime, users=None, excludeKeyword='CBOT'):
+      '''
+      Get ChangeRecord list submitted in [startTime, endTime] on the branches, sync the index before query.
+      :param users: only changes of these users if given
+      '''
+      for branch in branches:
+         if self.syncedBranches.get(branch, float('inf')) > startTime:
+            self.sync(branch, startTime)
+            self.syncedBranches[branch] = startTime
+      sql = "SELECT DISTINCT cln, user, client, time, desc FROM changes WHERE branch IN ({0}) " \
+            "AND time >= ? AND time <= ? ORDER BY cln DESC".format(",".join("?" * len(branches)))
+      userSet = set(users) if users else None
+      changes = []
+      for cln, user, client, time, desc in self.conn.execute(sql, list(branches) + [int(startTime), int(endTime)]):
+         if userSet is not None and user not in userSet:
+            continue
+         change = ChangeRecord(cln=str(cln), user=user, client=client, time=time, desc=desc, status='submitted')
+         if excludeKeyword and isExcluded(change, excludeKeyword):
+            continue
+         changes.append(change)
+      return changes
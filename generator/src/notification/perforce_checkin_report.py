@@ -8,14 +8,16 @@ perforce_checkin_report.py
 '''
 import os
 import re
-import time
 import datetime
 import requests
 from urllib import parse
 import argparse
-from generator.src.utils.Utils import runCmd, logExecutionTime, splitOverlengthReport, transformReport
+from generator.src.utils.Utils import commandExecutor, logExecutionTime, splitOverlengthReport, transformReport, \
+   RetryPolicy, RetryableError, raiseForStatus, boundedMap
 from generator.src.utils.MiniQueryFunctions import QueryUserById
 from generator.src.utils.Logger import logger
+from perforce_client import P4Client, formatP4Time, P4_BIN, DESCRIBE_WORKERS
+from perforce_change_index import ChangeIndex
 from generator.src.utils.BotConst import SERVICE_ACCOUNT, SERVICE_PASSWORD, \
    PERFORCE_ACCOUNT, PERFORCE_PASSWORD, BUGZILLA_DETAIL_URL, PERFORCE_DESCRIBE_URL, \
    JIRA_BROWSE_URL, BUGZILLA_BASE, REVIEWBOARD_URL
@@ -27,7 +29,7 @@ INVAILD_ID = '--'
 class PerforceSpider(object):
    @logExecutionTime
    def __init__(self, args):
-      self.p4Path = '/build/apps/bin/p4 -u {}'.format(PERFORCE_ACCOUNT)
+      self.p4Client = P4Client(PERFORCE_ACCOUNT)
       self.title = parse.unquote(args.title).strip('"')
       self.branchList = args.branches.split(",")
       # perforce use UTC7 time. The UTC7 time is 7 hours later than the system time.
@@ -35,8 +37,13 @@ class PerforceSpider(object):
       startTime = datetime.datetime.fromtimestamp(args.startTime, tz=utc7).strftime("%Y/%m/%d:%H:%M:%S")
       endTime = datetime.datetime.fromtimestamp(args.endTime, tz=utc7).strftime("%Y/%m/%d:%H:%M:%S")
       self.checkTime = "{0},{1}".format(startTime, endTime)
+      self.startTime, self.endTime = args.startTime, args.endTime
+      # answer the time window and user queries from the local submitted change index
+      self.changeIndex = ChangeIndex(self.p4Client, relogin=self.Login) if 'Yes' == args.changeIndex else None
       self.userList = args.users.split(",")
       self.isNeedCheckinApproved = (args.needCheckinApproved == 'Yes')
+      # long: read descriptions from one `p4 changes -l` listing, describe: run `p4 describe -s` per CLN
+      self.changesMode = args.changesMode
       self.showTitle = '*Title: {0}*\nBranch: {1}\nCheckin Time(PST): {2} --- {3}\n'.\
          format(self.title, " & ".join(self.branchList),
                 datetime.datetime.fromtimestamp(args.startTime, tz=utc7).strftime("%Y/%m/%d %H:%M"),
@@ -47,20 +54,18 @@ class PerforceSpider(object):
       os.environ['P4CONFIG'] = ""
       os.environ['P4USER'] = PERFORCE_ACCOUNT
       os.environ['P4PORT'] = "ssl:perforce.vcfd.broadcom.net:1666"
-      cmdStr = "echo 'yes' | /build/apps/bin/p4 trust"
-      stdout, stderr, returncode = runCmd(cmdStr)
-      assert returncode == 0, "Failed to execute command:{}".format(cmdStr)
-      cmdStr = "echo '{0}' | {1} login".format(PERFORCE_PASSWORD, self.p4Path)
-      isLogin = False
-      for i in range(1, 4):
-         stdout, stderr, returncode = runCmd(cmdStr)
-         if returncode != 0:
-            logger.debug("p4 login stderr: {0}, returncode: {1}, execute times: {2}".format(stderr, returncode, i))
-            time.sleep(0.5)
-         else:
-            isLogin = True
-            break
-      return isLogin
+      stdout, stderr, returncode = commandExecutor.run([P4_BIN, 'trust'], input=b'yes\n')
+      assert returncode == 0, "Failed to execute command: p4 trust"
+      return self.Login()
+
+   @RetryPolicy(baseDelay=0.5, fallback=False)
+   def Login(self):
+      stdout, stderr, returncode = self.p4Client.login(PERFORCE_PASSWORD)
+      if returncode != 0:
+         logger.debug("p4 login stderr: {0}, returncode: {1}".format(stderr, returncode))
+         raise RetryableError("p4 login failed")
+      return True
+
 
    @logExecutionTime
    def GetReport(self):
@@ -159,56 +164,87 @@ class PerforceSpider(object):
 
    @logExecutionTime
    def GetRecords(self):
-      formatStr = "//depot/{}/...@{}"
-      branchStr = " ".join([formatStr.format(branch, self.checkTime) for branch in self.branchList])
-      if len(self.userList) == 1:
-         user = self.userList[0]
-         cmd = '{0} changes -s submitted -u {1} {2} | /bin/grep -v "CBOT"'.format(self.p4Path, user, branchStr)
-      else:
-         cmd = '{0} changes -s submitted {1} | /bin/grep -v "CBOT"'.format(self.p4Path, branchStr)
-      logger.info(cmd)
-
-      checkinDatas = []
-      stdout, stderr, returncode = runCmd(cmd)
-      if returncode != 0:
-         logger.debug("p4 changes stderr: {0}, returncode: {1}".format(stderr, returncode))
-         return checkinDatas
+      if 'long' == self.changesMode:
+         return self.GetRecordsFromLongChanges()
+      return RetryPolicy(relogin=lambda *args: self.Login()).call(self.GetRecordsFromDescribes)
 
+   def GetRecordsFromDescribes(self):
+      '''
+      Feed CLNs into a bounded pool of `p4 describe -s` workers while `p4 changes` is still listing,
+      instead of describing the CLNs one by one after the listing exits.
+      If the listing fails halfway, the retry is cheap because the finished describes are cached.
+      '''
+      user = self.userList[0] if len(self.userList) == 1 else None
+      userSet = set(self.userList)
       deduplicatedCLN = set()
-      stdout = stdout.decode('utf-8')
-      recordList = stdout.split('\n')
-      logger.debug(f"Record count: {len(recordList)}")
-      for record in recordList:
-         if record:
-            matchObj = re.match(r"Change (.*) on (.*) by (.*) '(.*)'", record, re.M | re.I)
-            cln = matchObj.group(1)
-            user = matchObj.group(3).split('@')[0]
-            if user in self.userList:
-               deduplicatedCLN.add(cln)
-      for cln in deduplicatedCLN:
-         detail = self.GetDetail(cln)
+      def iterNewCln():
+         for change in self.IterChanges(user, longDesc=False):
+            if change.user in userSet and change.cln not in deduplicatedCLN:
+               deduplicatedCLN.add(change.cln)
+               yield change.cln
+      checkinDatas = []
+      for cln, future in boundedMap(self.GetDetail, iterNewCln(), maxWorkers=DESCRIBE_WORKERS):
+         detail = future.result()
          if detail:
             checkinDatas.append(detail)
+      logger.debug(f"Record count: {len(deduplicatedCLN)}")
       return checkinDatas
 
    @logExecutionTime
+   def GetRecordsFromLongChanges(self):
+      '''
+      Get the summary, bug number and review url of all changes by one `p4 changes -l` command,
+      instead of one `p4 describe -s` per CLN.
+      The full description of each ChangeRecord looks like:
+         PR 2834567: fix the memory leak in mks
+
+         Bug Number: 2834567
+         Review URL: https://reviewboard.lvn.broadcom.net/r/1234567/
+      '''
+      user = self.userList[0] if len(self.userList) == 1 else None
+      checkinDatas = {}
+      for change in self.QueryChanges(user, longDesc=True):
+         if change.user not in self.userList or change.cln in checkinDatas:
+            continue
+         checkinDatas[change.cln] = self.ParseDescription(change.cln, change.user, formatP4Time(change.time),
+                                                          change.desc.split('\n'))
+      logger.debug(f"Record count: {len(checkinDatas)}")
+      return list(checkinDatas.values())
+
+   def QueryChanges(self, user, longDesc):
+      if self.changeIndex:
+         return self.changeIndex.query(self.branchList, self.startTime, self.endTime, users=self.userList)
+      return self.QueryChangesFromPerforce(user, longDesc)
+
+   def IterChanges(self, user, longDesc):
+      '''Yield ChangeRecord while `p4 changes` is running, not retried'''
+      if self.changeIndex:
+         return iter(self.changeIndex.query(self.branchList, self.startTime, self.endTime, users=self.userList))
+      return self.p4Client.changes(self.GetChangePaths(), user=user, longDesc=longDesc)
+
+   def GetChangePaths(self):
+      return ["//depot/{0}/...@{1}".format(branch, self.checkTime) for branch in self.branchList]
+
+   @RetryPolicy(relogin=lambda self, *args, **kwargs: self.Login())
+   def QueryChangesFromPerforce(self, user, longDesc):
+      paths = self.GetChangePaths()
+      logger.info("p4 changes -u {0} {1}".format(user, " ".join(paths)))
+      return list(self.p4Client.changes(paths, user=user, longDesc=longDesc))
+
+   @logExecutionTime
+   @RetryPolicy(relogin=lambda self, *args: self.Login(), fallback=None)
    def GetDetail(self, queryCln):
-      cmd = '{0} describe -s {1}'.format(self.p4Path, queryCln)
-      stdout, stderr, returncode = runCmd(cmd)
-      if returncode != 0:
-         logger.debug("p4 describe error: {0}, returncode: {1}".format(stderr, returncode))
-         return None
-      stdout = stdout.decode('utf-8')
-      recordList = stdout.split('\n')
-      matchObj = re.match(r"Change (.*) by (.*) on (.*)", recordList[0], re.M | re.I)
-      cln = matchObj.group(1)
-      user = matchObj.group(2).split('@')[0]
-      timeStr = matchObj.group(3)
+      describe = self.p4Client.describe(queryCln)
+      return self.ParseDescription(describe.cln, describe.user, formatP4Time(describe.time),
+                                   describe.desc.split('\n'))
+
+   def ParseDescription(self, cln, user, timeStr, recordList):
+      '''Get summary, bug IDs and review IDs from change description lines, the first line is the summary.'''
       try:  # change time example: 2022/06/14 03:44:29
          checkinTime = datetime.datetime.strptime(timeStr, "%Y/%m/%d %H:%M:%S").strftime("%b%d %H:%M")
       except:
          checkinTime = ""
-      summary = recordList[2].strip()
+      summary = recordList[0].strip() if recordList else ''
       #  please avoid lines longer than 80 chars.
       summary = summary if len(summary) < SUMMARY_MAX_LENGTH else summary[:SUMMARY_MAX_LENGTH - 3] + '...'
       bugIDs, reviewIDs = [], []
@@ -244,9 +280,8 @@ class PerforceSpider(object):
    def CheckCheckinApproved(self, PRs):
       isCheckinApproved = False
       for bugId in PRs:
-         bugzilla_detail_url = BUGZILLA_BASE + str(bugId)
          try:
-            res = requests.get(bugzilla_detail_url, auth=(SERVICE_ACCOUNT, SERVICE_PASSWORD)).json()
+            res = self.QueryBugDetail(bugId)
             if res.get('status'):
                statusCode = res.get('status')
                message = res.get('message', '')
@@ -260,6 +295,13 @@ class PerforceSpider(object):
             logger.error('Query bugzilla API error: {0}'.format(e))
       return isCheckinApproved
 
+   @RetryPolicy()
+   def QueryBugDetail(self, bugId):
+      bugzilla_detail_url = BUGZILLA_BASE + str(bugId)
+      response = requests.get(bugzilla_detail_url, auth=(SERVICE_ACCOUNT, SERVICE_PASSWORD), timeout=60)
+      raiseForStatus(response)
+      return response.json()
+
 @logExecutionTime
 def parseArgs():
    parser = argparse.ArgumentParser(description='Generate perforce report')
@@ -269,6 +311,10 @@ def parseArgs():
    parser.add_argument('--endTime', type=float, required=True, help='Check end time')
    parser.add_argument('--users', type=str, required=True, help='Users of perforce report')
    parser.add_argument('--needCheckinApproved', type=str, required=True, help='Need checkin approved or not')
+   parser.add_argument('--changesMode', type=str, default='long', choices=['long', 'describe'],
+                       help='Read change descriptions from `p4 changes -l` or `p4 describe -s` per change')
+   parser.add_argument('--changeIndex', type=str, default='No', choices=['Yes', 'No'],
+                       help='Query changes from the local submitted change index, opt-in while it is proven')
    return parser.parse_args()
 
 if __name__ == '__main__':
@@ -277,3 +323,4 @@ if __name__ == '__main__':
    ret = spider.GetReport()
    print(ret)
    logger.info(ret)
+   commandExecutor.logStats()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+perforce_client.py
+Run p4 commands with `-G` and decode the marshalled python dicts one record at a time,
+instead of matching the human-readable output like `Change (.*) on (.*) by (.*) '(.*)'` by regex.
+The regex takes the user from a description like "Revert by carol 'fast path'" and can't parse the multi-line
+descriptions of `-l`, decoding the records is dearer in CPU (benchmark/bench_perforce_client.py) but that is
+microseconds per change against the seconds of the p4 server.
+- ChangeRecord    one record of `p4 -G changes`
+- DescribeRecord  one record of `p4 -G describe -s`, affected files are restored in `files`
+Submitted changelists never change, so describe results are cached on disk by CLN and describe flavor.
+'''
+
+import marshal
+import datetime
+from collections import namedtuple
+from generator.src.utils.Logger import logger
+from generator.src.utils.Utils import commandExecutor, CommandFailed, raiseForP4Error
+from generator.src.utils.DiskCache import DiskCache
+
+P4_BIN = '/build/apps/bin/p4'
+# perforce use UTC7 time. The UTC7 time is 7 hours later than the system time.
+P4_TIMEZONE = datetime.timezone(offset=-datetime.timedelta(hours=7))
+# severity of p4 error record: 1 info, 2 warning, 3 failed, 4 fatal
+P4_SEVERITY_FAILED = 3
+# one slow describe shouldn't eat the run budget, describes run in a pool of DESCRIBE_WORKERS threads
+DESCRIBE_TIMEOUT = 60
+DESCRIBE_WORKERS = 8
+
+# shared by perforce checkin report (describe -s) and perforce review check report (describe -a)
+describeCache = DiskCache('p4-describe', maxBytes=1024 * 1024 * 1024)
+
+ChangeRecord = namedtuple('ChangeRecord', ['cln', 'user', 'client', 'time', 'desc', 'status'])
+DescribeRecord = namedtuple('DescribeRecord', ['cln', 'user', 'client', 'time', 'desc', 'status', 'files'])
+AffectedFile = namedtuple('AffectedFile', ['depotFile', 'rev', 'action', 'type'])
+
+def formatP4Time(epoch, formatter="%Y/%m/%d %H:%M:%S"):
+   '''Format the epoch time of p4 tagged output like the time shown in p4 text output.'''
+   return datetime.datetime.fromtimestamp(epoch, tz=P4_TIMEZONE).strftime(formatter)
+
+def iterMarshalRecords(stream):
+   '''
+   Decode `p4 -G` output in a streaming fashion.
+   p4 writes python2 marshal dicts whose keys and values are bytes in python3,
+   only the fields used by the records are decoded to str.
+   '''
+   while True:
+      try:
+         yield marshal.load(stream)
+      except EOFError:
+         return
+
+def getField(record, key, default=''):
+   value = record.get(key)
+   return default if value is None else value.decode('utf-8', errors='ignore')
+
+def toChangeRecord(record):
+   return ChangeRecord(cln=getField(record, b'change'), user=getField(record, b'user'),
+                       client=getField(record, b'client'), time=int(record.get(b'time', 0)),
+                       desc=getField(record, b'desc'), status=getField(record, b'status'))
+
+def toDescribeRecord(record):
+   files = []
+   index = 0
+   while 'depotFile{0}'.format(index).encode() in record:
+      files.append(AffectedFile(depotFile=getField(record, 'depotFile{0}'.format(index).encode()),
+                                rev=getField(record, 'rev{0}'.format(index).encode()),
+                                action=getField(record, 'action{0}'.format(index).encode()),
+                                type=getField(record, 'type{0}'.format(index).encode())))
+      index += 1
+   change = toChangeRecord(record)
+   return DescribeRecord(*change, files=files)
+
+def getDescribeCacheKey(cln, flavor):
+   return "{0}:{1}".format(cln, flavor)
+
+def isExcluded(change, keyword):
+   '''Same as `| /bin/grep -v "CBOT"` on one line `p4 changes` output'''
+   summary = change.desc.split('\n')[0]
+   return keyword in change.user or keyword in change.client or keyword in summary
+
+
+class P4Client(object):
+   def __init__(self, user, p4Bin=P4_BIN):
+      self.user = user
+      self.p4Bin = p4Bin
+
+   def run(self, args, nTimeOut=300):
+      '''
+      Run `p4 -G <args>` and yield decoded records while the command is running.
+      Error records are collected and raised after the command exits.
+      '''
+      argv = [self.p4Bin, '-u', self.user, '-G'] + args
+      command = " ".join(argv)
+      errors = []
+      stderr, returncode = b'', 0
+      try:
+         with commandExecutor.stream(argv, nTimeOut) as stdout:
+            try:
+               for record in iterMarshalRecords(stdout):
+                  if b'error' == record.get(b'code'):
+                     if int(record.get(b'severity', P4_SEVERITY_FAILED)) >= P4_SEVERITY_FAILED:
+                        errors.append(getField(record, b'data').strip())
+                     continue
+                  yield record
+            except (ValueError, TypeError) as e:  # truncated marshal data after the process is killed
+               errors.append("bad p4 -G output: {0}".format(e))
+      except CommandFailed as e:
+         stderr, returncode = e.stderr, e.returncode
+      if returncode < 0 or errors:
+         stderr = stderr + "\n".join(errors).encode()
+         logger.debug("{0} stderr: {1}, returncode: {2}".format(command, stderr, returncode))
+         raiseForP4Error(command, stderr, returncode)
+         raise Exception("Perforce internal error")
+
+   def login(self, password):
+      '''Run `p4 login` with the password written to stdin, return stdout, stderr and returncode'''
+      return commandExecutor.run([self.p4Bin, '-u', self.user, 'login'], input="{0}\n".format(password).encode())
+
+   def hasValidTicket(self):
+      '''`p4 login -s` succeeds if the ticket of the user is still valid, e.g. got by another report process'''
+      try:
+         return 0 == commandExecutor.run([self.p4Bin, '-u', self.user, 'login', '-s'])[2]
+      except Exception as e:
+         logger.info("p4 login -s err: {0}".format(e))
+         return False
+
+   def changes(self, paths, user=None, longDesc=True, excludeKeyword='CBOT', nTimeOut=300):
+      '''
+      Yield ChangeRecord of submitted changes.
+      :param paths: list of depot paths with revision range, e.g. //depot/bora/main/...@2022/06/14,2022/06/21
+      :param longDesc: full description by `-l`, otherwise p4 truncates it to 31 chars
+      '''
+      args = ['changes', '-s', 'submitted']
+      if longDesc:
+         args.append('-l')
+      if user:
+         args += ['-u', user]
+      for record in self.run(args + list(paths), nTimeOut=nTimeOut):
+         change = toChangeRecord(record)
+         if excludeKeyword and isExcluded(change, excludeKeyword):
+            continue
+         yield change
+
+   def describe(self, cln, nTimeOut=DESCRIBE_TIMEOUT):
+      '''Return DescribeRecord of `p4 describe -s <cln>`, submitted change is read from cache if described before'''
+      describe = self.describes([cln], nTimeOut=nTimeOut).get(str(cln))
+      if describe is None:
+         raise Exception("p4 describe {0} returns nothing".format(cln))
+      return describe
+
+   def describes(self, clns, nTimeOut=DESCRIBE_TIMEOUT):
+      '''
+      Return {cln: DescribeRecord} of one `p4 describe -s <cln> <cln> ...`, submitted changes are read from cache
+      if described before. The CLNs failed in perforce are missing, the error is raised only if all of them fail.
+      '''
+      results, uncachedClns = {}, []
+      for cln in clns:
+         describe = describeCache.get(getDescribeCacheKey(cln, '-s'))
+         if describe is not None:
+            results[str(cln)] = describe
+         else:
+            uncachedClns.append(str(cln))
+      if not uncachedClns:
+         return results
+      described = 0
+      try:
+         for record in self.run(['describe', '-s'] + uncachedClns, nTimeOut=nTimeOut):
+            describe = toDescribeRecord(record)
+            results[describe.cln] = describe
+            described += 1
+            if 'submitted' == describe.status:
+               describeCache.set(getDescribeCacheKey(describe.cln, '-s'), describe)
+      except Exception as e:
+         if 0 == described:
+            raise
+         logger.info("p4 describe -s of {0} CLNs err: {1}".format(len(uncachedClns), e))
+      return results
@@ -9,10 +9,31 @@ perforce_diff_parser.py
 
 import os
 import re
-import time
+import itertools
+from collections import namedtuple
 from generator.src.utils.Logger import logger
-from generator.src.utils.Utils import runCmd
+from generator.src.utils.Utils import commandExecutor, RetryPolicy, RetryableError, CommandFailed, raiseForP4Error
 from generator.src.utils.BotConst import SERVICE_ACCOUNT, SERVICE_PASSWORD
+from perforce_client import P4Client, describeCache, getDescribeCacheKey, formatP4Time, P4_BIN
+from perforce_change_index import ChangeIndex
+from diff_engine import iterP4Diffs, iterLines, FileDiff
+
+# `p4 describe -a` prints the whole diff, a huge change of one CLN may take long
+DESCRIBE_DIFF_TIMEOUT = 5000
+# a batch gets this many seconds per CLN, up to DESCRIBE_DIFF_TIMEOUT
+DESCRIBE_BATCH_TIMEOUT_PER_CLN = 300
+# `p4 describe -a` up to DESCRIBE_BATCH_SIZE CLNs in one command, DESCRIBE_BATCH_WORKERS commands at the same time
+DESCRIBE_BATCH_SIZE = 10
+DESCRIBE_BATCH_WORKERS = 3
+# header line of each change in `p4 describe` output, e.g. Change 9385524 by alanh@alanh-jetpack on 2021/11/22 00:45:44
+DESCRIBE_HEADER_PATTERN = re.compile(r"^Change (\d+) by (.*) on (.*)$")
+# the diff of a change beyond these line counts is reported as too large to compare instead of being parsed
+MAX_FILE_DIFF_LINES = 50000
+MAX_CHANGE_DIFF_LINES = 200000
+# `p4 describe -a` results are cached with the diff parsed, not as text lines
+DESCRIBE_CACHE_FLAVOR = '-a:parsed'
+# teams up to this size run `p4 changes -u <user>` per user, bigger teams run one branch-wide `p4 changes`
+SMALL_TEAM_SIZE = 3
 
 
 class ReviewLinkNotFound(Exception):
@@ -20,45 +41,165 @@ class ReviewLinkNotFound(Exception):
       return "p4 change without any review"
 
 
+class DescribeTimeout(Exception):
+   '''`p4 describe -a` killed at its timeout, not retried as the same describe would time out again'''
+   def __str__(self):
+      return "p4 describe timeout: {0}".format(super().__str__())
+
+
+def getDescribeTimeout(clnCount):
+   return min(DESCRIBE_DIFF_TIMEOUT, DESCRIBE_BATCH_TIMEOUT_PER_CLN * clnCount) if clnCount > 1 \
+      else DESCRIBE_DIFF_TIMEOUT
+
+
+# describe lines before `Differences ...`, affected files, {filePath: FileDiff}, paths of binary files,
+# and the exception to raise when the diff is asked for, e.g. DiffTooLarge
+ChangeDescribe = namedtuple('ChangeDescribe', ['describes', 'changeTime', 'affectedFiles', 'fileDiffs',
+                                               'binaryFiles', 'diffError'])
+
+def iterChangeLines(lines):
+   '''
+   Split the output lines of `p4 describe -a <cln> <cln> ...` change by change, yield (cln, change time, lines).
+   The lines of one change are an iterator, which is skipped if it isn't read up before the next change.
+   Description lines are indented by tab and diff lines start with `<`, `>`, `---` or `====`,
+   so only the header of a change starts with "Change " at column 0.
+   '''
+   headerCount = [0]
+   def countHeader(line):
+      if line.startswith("Change ") and DESCRIBE_HEADER_PATTERN.match(line):
+         headerCount[0] += 1
+      return headerCount[0]
+   for index, changeLines in itertools.groupby(lines, countHeader):
+      if 0 == index:  # nothing before the first change
+         continue
+      matchObj = DESCRIBE_HEADER_PATTERN.match(next(changeLines))
+      yield matchObj.group(1), matchObj.group(3), changeLines
+
+
 class PerforceDiffParser(object):
-   def __init__(self):
-      self.p4alias = '/build/apps/bin/p4 -u {}'.format(SERVICE_ACCOUNT)
-      self.linePattern1 = re.compile(r"^(\d+)([acd])(\d+)$")
-      self.linePattern2 = re.compile(r"^(\d+)([acd])(\d+),(\d+)$")
-      self.linePattern3 = re.compile(r"^(\d+),(\d+)([acd])(\d+)$")
-      self.linePattern4 = re.compile(r"^(\d+),(\d+)([acd])(\d+),(\d+)$")
+   def __init__(self, maxFileDiffLines=MAX_FILE_DIFF_LINES, maxChangeDiffLines=MAX_CHANGE_DIFF_LINES):
       self.reviewIdPattern = re.compile(r"https://reviewboard.eng.vmware.com/r/(\d{7,})", re.I)
-      self.changeCommand = '%s changes -s submitted -u {0} %s | /bin/grep -v "CBOT"'
-      self.addFiles = []
+      self.p4Client = P4Client(SERVICE_ACCOUNT)
+      self.changePaths = []
+      self.changeIndex = None
+      self.maxFileDiffLines = maxFileDiffLines
+      self.maxChangeDiffLines = maxChangeDiffLines
 
    def loginPerforce(self):
       os.environ['P4CONFIG'] = ""
       os.environ['P4USER'] = SERVICE_ACCOUNT
-      command = "echo '{0}' | {1} login".format(SERVICE_PASSWORD, self.p4alias)
-      for i in range(1, 4):
-         stdout, stderr, returncode = runCmd(command)
-         if returncode != 0:
-            logger.debug("p4 login stderr: {0}, returncode: {1}, execute times: {2}".format(stderr, returncode, i))
-            time.sleep(0.5)
-         else:
+      try:
+         if self.p4Client.hasValidTicket():
             return
-      raise Exception("Perforce internal error")
+         self.login()
+      except RetryableError:
+         raise Exception("Perforce internal error")
+
+   @RetryPolicy(baseDelay=0.5)
+   def login(self):
+      stdout, stderr, returncode = self.p4Client.login(SERVICE_PASSWORD)
+      if returncode != 0:
+         logger.debug("p4 login stderr: {0}, returncode: {1}".format(stderr, returncode))
+         raise RetryableError("p4 login failed")
+
+   def streamDescribes(self, clns, handleChange):
+      '''
+      Run `p4 describe -a <cln> <cln> ...` and call handleChange(lines, change time) change by change
+      while the output is streamed, the whole output is never decoded at once.
+      Return {cln: result of handleChange}, the CLNs failed in perforce are missing.
+      Raise DescribeTimeout if the command is killed at the timeout of the batch, see getDescribeTimeout.
+      '''
+      argv = [P4_BIN, '-u', SERVICE_ACCOUNT, 'describe', '-a'] + [str(cln) for cln in clns]
+      nTimeOut = getDescribeTimeout(len(clns))
+      results = {}
+      try:
+         with commandExecutor.stream(argv, nTimeOut=nTimeOut) as stdout:
+            lines = (line.decode('utf-8', errors='ignore').rstrip('\n') for line in stdout)
+            for cln, changeTime, changeLines in iterChangeLines(lines):
+               results[cln] = handleChange(changeLines, changeTime)
+      except CommandFailed as e:
+         if e.returncode < 0:  # killed by the watchdog
+            raise DescribeTimeout("{0} CLNs in {1}s".format(len(clns), nTimeOut))
+         raiseForP4Error(" ".join(argv), e.stderr, e.returncode)
+         logger.debug("{0} stderr: {1}, returncode: {2}".format(" ".join(argv), e.stderr, e.returncode))
+      return results
+
+   @RetryPolicy(relogin=lambda self, *args, **kwargs: self.login())
+   def describeFromPerforce(self, clns):
+      '''Return {cln: ChangeDescribe} of `p4 describe -a <cln> <cln> ...`, parsed file by file while streamed'''
+      return self.streamDescribes(clns, self.parseDescribe)
+
+   @RetryPolicy(relogin=lambda self, *args, **kwargs: self.login())
+   def describeRawFromPerforce(self, clns):
+      '''Return {cln: (change time, text after the header line)}, parsed later by parseRawDescribe'''
+      return self.streamDescribes(clns, lambda changeLines, changeTime: (changeTime, "\n".join(changeLines)))
 
-   def setParams(self, startTime, endTime, branchList):
+   def setParams(self, startTime, endTime, branchList, useChangeIndex=False):
       checkinTimeRange = "{0},{1}".format(startTime.strftime("%Y/%m/%d:%H:%M:%S"),
                                           endTime.strftime("%Y/%m/%d:%H:%M:%S"))
-      branchStr = " ".join(["//depot/{0}/...@{1}".format(branch, checkinTimeRange) for branch in branchList])
-      self.changeCommand = self.changeCommand % (self.p4alias, branchStr)
-
-   def getChanges(self, user):
-      command = self.changeCommand.format(user)
-      stdout, stderr, returncode = runCmd(command, nTimeOut=5000)
-      if not stdout and 1 == returncode:
-         return []
-      elif returncode != 0:
-         logger.debug("p4 changes stdout:{0}, stderr:{1}, returncode:{2}".format(stdout, stderr, returncode))
-         raise Exception("Perforce internal error")
-      return stdout.decode('utf-8', errors='ignore').split('\n')[:-1]
+      self.changePaths = ["//depot/{0}/...@{1}".format(branch, checkinTimeRange) for branch in branchList]
+      self.startTime, self.endTime, self.branchList = startTime.timestamp(), endTime.timestamp(), branchList
+      if useChangeIndex:
+         self.changeIndex = ChangeIndex(self.p4Client, relogin=self.login)
+
+   def getChangesByUser(self, users):
+      '''
+      Get {user: ChangeRecord list} of the users' submitted changes, without CBOT changes.
+      Bigger teams run one branch-wide query for the time window and partition the changes by user in memory,
+      instead of scanning the branches once per user.
+      '''
+      changesByUser = {user: [] for user in users}
+      if self.changeIndex:
+         changes = self.changeIndex.query(self.branchList, self.startTime, self.endTime, users=users)
+      elif len(changesByUser) <= SMALL_TEAM_SIZE:
+         changes = [change for user in changesByUser for change in self.getChangesFromPerforce(user)]
+      else:
+         changes = self.getChangesFromPerforce(None)
+      for change in changes:
+         if change.user in changesByUser:
+            changesByUser[change.user].append(change)
+      return changesByUser
+
+   @RetryPolicy(relogin=lambda self, *args, **kwargs: self.login())
+   def getChangesFromPerforce(self, user):
+      return list(self.p4Client.changes(self.changePaths, user=user, longDesc=False, nTimeOut=5000))
+
+   @RetryPolicy(relogin=lambda self, *args, **kwargs: self.login())
+   def describeSummaries(self, clns):
+      return self.p4Client.describes(clns)
+
+   def getSummariesBatch(self, clns):
+      '''
+      Describe the CLNs by one `p4 describe -s <cln> <cln> ...`, which has the description and affected files
+      but no diff, for the file list check before the diff is downloaded.
+      Return {cln: DescribeRecord, or the exception of describing that CLN}.
+      '''
+      try:
+         results = self.describeSummaries(clns)
+      except Exception as e:
+         logger.info("p4 describe -s batch of {0} CLNs err: {1}".format(len(clns), e))
+         results = {}
+      for cln in clns:
+         if cln not in results:
+            try:
+               results[cln] = self.describeSummaries([cln]).get(cln, Exception("Perforce internal error"))
+            except Exception as e:
+               results[cln] = e
+      return results
+
+   def getSummaryLines(self, summary):
+      '''Description lines of DescribeRecord, for isEmergencyBackout, getReviewers and getReviewRequestId'''
+      return summary.desc.split('\n')
+
+   def getSummaryTime(self, summary):
+      return formatP4Time(summary.time)
+
+   def getChangeFiles(self, summary):
+      '''
+      Depot paths of the files affected by DescribeRecord, deleted files are left out like getDifference does.
+      Binary files are kept, they have no diff to compare but must be in the review too.
+      '''
+      return [affectedFile.depotFile for affectedFile in summary.files if 'delete' != affectedFile.action]
 
    def getDescribes(self, cln):
       '''
@@ -68,17 +209,122 @@ class PerforceDiffParser(object):
          we can get some submit brief description in first line like:
             Change 9385524 by alanh@alanh-jetpack on 2021/11/22 00:45:44
          then use RegExp `Change (.*) by (.*) on (.*)` to get submit time and other useful datas
+      Only submitted changes are described, so the result is cached by CLN.
       :param cln: string
+      :return: ChangeDescribe
       '''
-      command = '{0} describe -a {1}'.format(self.p4alias, cln)
-      stdout, stderr, returncode = runCmd(command, nTimeOut=5000)
-      if returncode != 0:
-         logger.debug("p4 describe stdout:{0}, stderr:{1}, returncode:{2}".format(stdout, stderr, returncode))
+      cacheKey = getDescribeCacheKey(cln, DESCRIBE_CACHE_FLAVOR)
+      describe = describeCache.get(cacheKey)
+      if describe is not None:
+         return describe
+      describe = self.describeFromPerforce([cln]).get(str(cln))
+      if describe is None:
          raise Exception("Perforce internal error")
-      describes = stdout.decode('utf-8', errors='ignore').split('\n')
-      matchObj = re.match(r"Change (.*) by (.*) on (.*)", describes[0], re.M | re.I)
-      changeTime = matchObj.group(3)
-      return describes[1:], changeTime
+      describeCache.set(cacheKey, describe)
+      return describe
+
+   def getDescribesBatch(self, clns):
+      '''
+      Describe many CLNs by one `p4 describe -a <cln> <cln> ...`, instead of one login and SSL connection per CLN.
+      Return {cln: ChangeDescribe, or the exception of describing that CLN}.
+      CLNs missing in the batch output are described alone, and a failed batch is split in halves,
+      so one bad CLN doesn't sink the others. A batch timed out is described CLN by CLN instead of split,
+      each CLN gets the whole DESCRIBE_DIFF_TIMEOUT, so a huge change times out once at most.
+      '''
+      results, uncachedClns = {}, []
+      for cln in clns:
+         cached = describeCache.get(getDescribeCacheKey(cln, DESCRIBE_CACHE_FLAVOR))
+         if cached is not None:
+            results[cln] = cached
+         else:
+            uncachedClns.append(cln)
+      self.describeBatch(uncachedClns, results)
+      return results
+
+   def describeBatch(self, clns, results):
+      if len(clns) <= 1:
+         for cln in clns:
+            try:
+               results[cln] = self.getDescribes(cln)
+            except Exception as e:
+               results[cln] = e
+         return
+      try:
+         describes = self.describeFromPerforce(clns)
+      except DescribeTimeout as e:
+         logger.info("p4 describe batch of {0} CLNs err: {1}, describe them alone".format(len(clns), e))
+         for cln in clns:
+            self.describeBatch([cln], results)
+         return
+      except Exception as e:
+         logger.info("p4 describe batch of {0} CLNs err: {1}, split the batch".format(len(clns), e))
+         middle = len(clns) // 2
+         self.describeBatch(clns[:middle], results)
+         self.describeBatch(clns[middle:], results)
+         return
+      missingClns = []
+      for cln in clns:
+         describe = describes.get(str(cln))
+         if describe is None:
+            missingClns.append(cln)
+            continue
+         describeCache.set(getDescribeCacheKey(cln, DESCRIBE_CACHE_FLAVOR), describe)
+         results[cln] = describe
+      if missingClns:
+         logger.info("p4 describe batch misses {0}, describe them alone".format(missingClns))
+         for cln in missingClns:
+            self.describeBatch([cln], results)
+
+   def isDescribeCached(self, cln):
+      return describeCache.contains(getDescribeCacheKey(cln, DESCRIBE_CACHE_FLAVOR))
+
+   def getRawDescribesBatch(self, clns):
+      '''
+      Describe many CLNs by one `p4 describe -a <cln> <cln> ...` without parsing the diff.
+      Return {cln: (change time, text), or the exception of describing that CLN}, CLNs missing in the batch
+      output are described alone.
+      '''
+      try:
+         results = self.describeRawFromPerforce(clns)
+      except Exception as e:
+         logger.info("p4 describe batch of {0} CLNs err: {1}, describe them alone".format(len(clns), e))
+         results = {}
+      for cln in clns:
+         if str(cln) not in results:
+            try:
+               results[cln] = self.describeRawFromPerforce([cln]).get(str(cln), Exception("Perforce internal error"))
+            except Exception as e:
+               results[cln] = e
+      return results
+
+   def parseRawDescribe(self, cln, changeTime, text):
+      '''Parse the text got by getRawDescribesBatch, and cache it the same as getDescribes'''
+      describe = self.parseDescribe(iterLines(text), changeTime)
+      describeCache.set(getDescribeCacheKey(cln, DESCRIBE_CACHE_FLAVOR), describe)
+      return describe
+
+   def parseDescribe(self, changeLines, changeTime):
+      '''
+      Parse the lines of one change after its header line.
+      The lines before `Differences ...` are kept, the diff is parsed file by file into FileDiff.
+      '''
+      describes, hasDifferences = [], False
+      for line in changeLines:
+         if "Differences ..." == line:
+            hasDifferences = True
+            break
+         describes.append(line)
+      affectedFiles, fileDiffs, binaryFiles, diffError = [], {}, set(), None
+      try:
+         affectedFiles = self.parseAffectedFiles(describes)
+         if not hasDifferences:
+            raise Exception("describe hasn't any differences")
+         addFiles = set(filePath for filePath, status in affectedFiles if 'add' == status)
+         fileDiffs = dict(iterP4Diffs(changeLines, addFiles, self.maxFileDiffLines, self.maxChangeDiffLines,
+                                      binaryFiles))
+      except Exception as e:
+         diffError = e
+      return ChangeDescribe(describes, changeTime, affectedFiles, fileDiffs, binaryFiles, diffError)
 
    def isEmergencyBackout(self, describes):
       isBackout = "Back out" in "".join(describes[:5])
@@ -127,22 +373,24 @@ class PerforceDiffParser(object):
       # There is no link on the right of "Review URL" or not find "Review URL:" keywords
       raise ReviewLinkNotFound()
 
-   def getDifference(self, describes):
+   def getDifference(self, describe):
       '''
       Restore difference infos by affected file list.
-      :return param diffInfo: dict<filePath, diffList>
+      Raise DiffTooLarge if the change is too large to compare.
+      :param describe: ChangeDescribe
+      :return param diffInfo: dict<filePath, FileDiff>
       '''
-      affectedFiles = self.parseAffectedFiles(describes)
-      lastChangeDiff = self.parseDifferences(describes)
-      # filter delete file
+      if describe.diffError is not None:
+         raise describe.diffError
+      # filter delete file and binary file
       diffInfo = {}
-      for filePath, status in affectedFiles:
-         if 'add' == status:
-            diffInfo[filePath] = lastChangeDiff.get(filePath, [])
-         elif 'delete' == status:
+      for filePath, status in describe.affectedFiles:
+         if 'delete' == status:
             logger.info("change: {0} deleted".format(filePath))
+         elif filePath in describe.binaryFiles:
+            logger.info("change: {0} is binary".format(filePath))
          else:
-            diffInfo[filePath] = lastChangeDiff.get(filePath, [])
+            diffInfo[filePath] = describe.fileDiffs.get(filePath, FileDiff().computeDigest())
       return diffInfo
 
    def parseAffectedFiles(self, describes):
@@ -157,14 +405,13 @@ class PerforceDiffParser(object):
          ... //depot/bora/main/apps/rde/rmksContainer/linux/callbacks.c#69 edit
          ......
          restore filePath: apps/rde/rmksContainer/linux/callbacks.c  status: edit
-         If this file status is 'add', restore in self.addFiles because of have not '>' at the beginning of each line
+         The content of a file with status 'add' hasn't '>' at the beginning of each line in the differences.
       '''
       try:
          index = describes.index("Affected files ...")
       except Exception as e:
          raise Exception("describe hasn't any affected files: {0}".format(e))
 
-      self.addFiles = []
       fileList = []
       affectedFiles = describes[index+2:]
       for line in affectedFiles:
@@ -177,121 +424,4 @@ class PerforceDiffParser(object):
             filePath = "/".join(filePath.split("/")[5:])
             status = line.split()[1]
             fileList.append((filePath, status))
-            if 'add' == status:
-               self.addFiles.append(filePath)
       return fileList
-
-   def parseDifferences(self, describes):
-      '''Get difference in perforce describe stdout.'''
-      try:
-         index = describes.index("Differences ...")
-      except Exception as e:
-         raise Exception("describe hasn't any differences: {0}".format(e))
-
-      # jump `Differences ...` and one empty line to get the real difference content
-      diffContent = describes[index+2:]
-      differences = self.parseLastChangeDiff(diffContent)
-      return differences
-
-   def parseLastChangeDiff(self, diffLines):
-      '''
-      Split difference by '==== fileInfo ====' to get each file difference detail
-      For example:
-         Differences ...
-
-         ==== //depot/bora/main/apps/crtbora/common/mks.cc#119 (text) ====
-
-         300,305d299
-         <     *    enableDecoderWatermark - this switch enables/disables H264/HEVC/
-      '''
-      diffInfo = {}
-      filePath, fileContent = "", []
-      while diffLines:
-         line = diffLines.pop(0)
-         if re.match(r'^==== (.*) ====$', line):
-            if fileContent and filePath:
-               isAddFile = filePath in self.addFiles
-               diffInfo[filePath] = self.getChangeFileDiff(fileContent, isAddFile)
-               fileContent = []
-            filePath = self.getChangeFilePath(line)
-         else:
-            fileContent.append(line)
-      if fileContent and filePath:
-         isAddFile = filePath in self.addFiles
-         diffInfo[filePath] = self.getChangeFileDiff(fileContent, isAddFile)
-      return diffInfo
-
-   def getChangeFilePath(self, line):
-      line = re.findall(r'==== (.*) ====', line)[0]
-      line = line.split('#')[0]
-      return "/".join(line.split("/")[5:])
-
-   def matchLineInfo(self, pattern, line):
-      results = pattern.findall(line)[0]
-      diffType, typeIndex = '', 0
-      for index, res in enumerate(results):
-         if res in ['a', 'c', 'd']:
-            diffType = res
-            typeIndex = index
-            break
-      left = results[:typeIndex]
-      right = results[typeIndex + 1:]
-      delStart, delEnd = left if 2 == len(left) else (left[0], left[0])
-      addStart, addEnd = right if 2 == len(right) else (right[0], right[0])
-      return delStart, delEnd, diffType, addStart, addEnd
-
-   def getChangeFileDiff(self, diffContent, isAddFile):
-      '''
-      Get each file difference detail
-      :return param fileDiff: List element: Tuple (+/-, code, lineNo)
-      Here explain for some example:
-         1) RegExp `^(\d+)([acd])(\d+)$` to match `85c85`
-         2) RegExp `^(\d+)([acd])(\d+),(\d+)$` to match `90,91c90`
-         3) RegExp `^(\d+),(\d+)([acd])(\d+)$` to match `104c103,104`
-         4) RegExp `^(\d+),(\d+)([acd])(\d+),(\d+)$` to match `5769,5770c5801,5803`
-      Delete code's lineNo at the left of `acd`, add code's lineNo at the right of `acd`.
-      If one number on the left side, this shows that delete start lineNo is the same as end lineNo (delete one line);
-      If two number on the left side, this shows that delete lines range: [start lineNo, end lineNo];
-      If one number on the right side, this shows that add start lineNo is the same as end lineNo (add one line);
-      If two number on the right side, this shows that add lines range: [start lineNo, end lineNo];
-      Diff type: `a` - add   `d` - delete   `c` - both `add` and `delete`
-      '''
-      deleteLineNo, addLineNo = 0, 0
-      if isAddFile:
-         # Between file path and first line code, there is one empty line.
-         # We should jump this line and mark first line code is lineNo=1.
-         diffContent = diffContent[1:] if not diffContent[0].strip() else diffContent
-         addLineNo = 1
-      codes = []
-      fileDiff = []
-      while diffContent:
-         line = diffContent.pop(0)
-         if '---' == line:
-            continue
-         elif self.linePattern1.match(line) or self.linePattern2.match(line) \
-               or self.linePattern3.match(line) or self.linePattern4.match(line):
-            if codes:
-               fileDiff.extend(codes)
-               codes = []
-            # get delete start lineNo and add start lineNo
-            for pattern in [self.linePattern4, self.linePattern3, self.linePattern2, self.linePattern1]:
-               if pattern.match(line):
-                  delStart, delEnd, diffType, addStart, addEnd = self.matchLineInfo(pattern, line)
-                  deleteLineNo, addLineNo = int(delStart), int(addStart)
-                  break
-         else:
-            line = line.rstrip('\r')
-            if line.startswith('<'):  # delete
-               if line[2:]:
-                  codes.append(('-', deleteLineNo, line[2:]))
-               deleteLineNo += 1
-            elif line.startswith('>'):  # add
-               if line[2:]:
-                  codes.append(('+', addLineNo, line[2:]))
-               addLineNo += 1
-            elif isAddFile:
-               if line:
-                  codes.append(('+', addLineNo, line))
-               addLineNo += 1
-      fileDiff.extend(codes)
-      return fileDiff
@@ -10,14 +10,26 @@ features:
 2. notification for change where last review and actual submission are different
 '''
 
-import re
+import os
+import sys
+import json
+import zlib
 import datetime
+import subprocess
+import multiprocessing
 from urllib import parse
-from collections import defaultdict
-from perforce_diff_parser import PerforceDiffParser, ReviewLinkNotFound
+from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from perforce_diff_parser import PerforceDiffParser, ReviewLinkNotFound, DESCRIBE_BATCH_SIZE, DESCRIBE_BATCH_WORKERS, \
+   MAX_FILE_DIFF_LINES, MAX_CHANGE_DIFF_LINES
+from diff_engine import DiffTooLarge, isSameDiff, findCodeMismatch
 from review_diff_parser import ReviewDiffParser
-from generator.src.utils.Utils import logExecutionTime, noIntervalPolling, transformReport
+from review_check_verdict_store import VerdictStore, VERDICT_OK, VERDICT_NO_REVIEW, VERDICT_UNEQUAL, VERDICT_ERROR
+from generator.src.utils.Utils import logExecutionTime, transformReport, \
+   setRunTimeout, getRemainingTime, getRunDeadline, setRunDeadline, boundedMap, commandExecutor, \
+   REVIEW_CHECK_RUN_TIMEOUT
 from generator.src.utils.Logger import logger
+from generator.src.utils.MessageDispatcher import MessageDispatcher
 from generator.src.utils.BotConst import PERFORCE_DESCRIBE_URL, REVIEWBOARD_URL
 
 # restful API: post message to a given channel id
@@ -28,8 +40,19 @@ POST_MESSAGE_API_BY_USER = "https://slackbot.vela.decc.vmware.com/api/v1/user/{0
 POST_MESSAGE_BEAR_TOKEN = "Bearer d89f55072b9d4fbda1e38a66c83adaad"
 # vsan-slackbot-monitor channel id
 VSAN_SLACKBOT_MONITOR_CHANNELID = "C03JWGX5GJW"
+# concurrent posts of the report messages, and seconds between two posts to one user or channel
+POST_MESSAGE_WORKERS = 4
+POST_MESSAGE_INTERVAL = 1.0
+# concurrent requests to review board, p4 commands are capped by --p4Workers
+REVIEW_BOARD_WORKERS = 4
+# chunks of DESCRIBE_BATCH_SIZE changes checked at the same time
+CHECK_CHUNK_WORKERS = 3
+# with --parseWorkers, diffs are parsed and compared in a process pool if there are at least so many changes,
+# smaller runs don't pay for starting the processes
+PARSE_PROCESS_MIN_CHANGES = 30
+# records of the shards run by --shards are written here and merged by the report process
+SHARD_DIR = os.path.join(os.path.abspath(__file__).split("/generator")[0], "persist/tmp/review-check-shards")
 
-import requests
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -50,6 +73,58 @@ class CompareNotEqual(Exception):
       return self.errorInfo
 
 
+def getBranchPath(path, branchList):
+   '''
+   Path of the file under its branch, e.g. lib/foo.c of //depot/bora/main/lib/foo.c with branch bora/main.
+   Review board shows the path from the repository root, e.g. bora/lib/foo.c, or a/bora/lib/foo.c in the patch,
+   the a/ and the tree of the branches are dropped like the review diff parser does.
+   '''
+   path = path.split('#')[0]
+   if path.startswith("//"):
+      for branch in sorted(branchList, key=len, reverse=True):
+         prefix = "//depot/{0}/".format(branch.strip("/"))
+         if path.startswith(prefix):
+            return path[len(prefix):]
+      return "/".join(path.split("/")[5:])
+   if path.startswith("a/") or path.startswith("b/"):
+      path = path[2:]
+   for tree in set(branch.strip("/").split("/")[0] for branch in branchList):
+      if path.startswith(tree + "/"):
+         return path[len(tree) + 1:]
+   return path
+
+def compareRawDiffs(cln, changeTime, rawDescribe, patch, maxFileDiffLines, maxChangeDiffLines):
+   '''
+   Run in the parse process pool: parse the `p4 describe -a` text of the change and the review patch, compare them
+   and return the verdict (exception name, message), (None, None) if they are the same.
+   Only the verdict is sent back, the parsed describe is cached in this process.
+   :param rawDescribe: text got by PerforceDiffParser.getRawDescribesBatch, None to read the cached describe
+   '''
+   try:
+      p4Parser = PerforceDiffParser(maxFileDiffLines, maxChangeDiffLines)
+      if rawDescribe is None:
+         describe = p4Parser.getDescribes(cln)
+      else:
+         describe = p4Parser.parseRawDescribe(cln, changeTime, rawDescribe)
+      lastChangeDiff = p4Parser.getDifference(describe)
+      lastReviewDiff = ReviewDiffParser(maxFileDiffLines, maxChangeDiffLines).getDifferenceFromPatch(patch)
+      PerforceReviewCheckSpider.compareTwoDiffs(lastChangeDiff, lastReviewDiff)
+   except CompareNotEqual as e:
+      return 'CompareNotEqual', str(e)
+   except DiffTooLarge as e:
+      return 'DiffTooLarge', e.args[0] if e.args else ""
+   except Exception as e:
+      return 'Exception', str(e)
+   return None, None
+
+def toVerdictError(verdict):
+   '''Restore the exception from the verdict of compareRawDiffs'''
+   name, message = verdict
+   if name is None:
+      return None
+   return {'CompareNotEqual': CompareNotEqual, 'DiffTooLarge': DiffTooLarge}.get(name, Exception)(message)
+
+
 class PerforceReviewCheckSpider(object):
    def __init__(self, args):
       self.title = parse.unquote(args.title)
@@ -60,8 +135,20 @@ class PerforceReviewCheckSpider(object):
       self.dtStartTime = datetime.datetime.fromtimestamp(args.startTime, tz=utc7)
       self.dtEndTime = datetime.datetime.fromtimestamp(args.endTime, tz=utc7)
       self.checkinTime = ""
-      self.p4Parser = PerforceDiffParser()
-      self.rbParser = ReviewDiffParser()
+      self.useChangeIndex = ('Yes' == args.changeIndex)
+      self.p4Parser = PerforceDiffParser(args.maxFileDiffLines, args.maxChangeDiffLines)
+      self.rbParser = ReviewDiffParser(args.maxFileDiffLines, args.maxChangeDiffLines)
+      self.p4Workers = args.p4Workers
+      self.reviewBoardWorkers = args.reviewBoardWorkers
+      self.parseWorkers = args.parseWorkers
+      self.maxFileDiffLines = args.maxFileDiffLines
+      self.maxChangeDiffLines = args.maxChangeDiffLines
+      self.recheck = ('Yes' == args.recheck)
+      self.verdictStore = VerdictStore()
+      self.shardCount = args.shards
+      self.shardBy = args.shardBy
+      self.shardIndex = args.shardIndex
+      self.shardResults = args.shardResults.split(",") if args.shardResults else []
 
    def isVSAN(self, branch):
       '''
@@ -70,7 +157,8 @@ class PerforceReviewCheckSpider(object):
       '''
       return branch in ['bora/main', 'scons/main', 'vsan-mgmt-ui/main']
 
-   def compareTwoDiffs(self, lastChangeDiff, lastReviewDiff):
+   @staticmethod
+   def compareTwoDiffs(lastChangeDiff, lastReviewDiff):
       # check diff file list
       changeDiffFileList = [file for file in lastChangeDiff.keys()]
       reviewDiffFileList = [file for file in lastReviewDiff.keys()]
@@ -84,69 +172,323 @@ class PerforceReviewCheckSpider(object):
             raise CompareNotEqual(f"compare file list unequal due to: {differentFiles.pop()}")
       for file, reviewCodes in lastReviewDiff.items():
          changeCodes = lastChangeDiff[file]
-         # sort diff line no
-         reviewCodes.sort(key=lambda a: a[1], reverse=False)
-         changeCodes.sort(key=lambda a: a[1], reverse=False)
-         # compare add diff codes
-         reviewAdd = {r[1]: r[2] for r in reviewCodes if '+' == r[0]}
-         changeAdd = {r[1]: r[2] for r in changeCodes if '+' == r[0]}
-         addLineNoList = set(reviewAdd.keys()) & set(changeAdd.keys())
-         for lineNo in addLineNoList:
-            reviewCode = "#{0} {1}".format(lineNo, reviewAdd[lineNo])
-            changeCode = "#{0} {1}".format(lineNo, changeAdd[lineNo])
-            if reviewCode != changeCode:
-               raise CompareNotEqual(f"{file} add code unequal - review({reviewCode}) change({changeCode})")
-         # compare delete diff codes
-         reviewDelete = {r[1]: r[2] for r in reviewCodes if '-' == r[0]}
-         changeDelete = {r[1]: r[2] for r in changeCodes if '-' == r[0]}
-         deleteLineNoList = set(reviewDelete.keys()) & set(changeDelete.keys())
-         for lineNo in deleteLineNoList:
-            reviewCode = "#{0} {1}".format(lineNo, reviewDelete[lineNo])
-            changeCode = "#{0} {1}".format(lineNo, reviewDelete[lineNo])
-            if reviewCode != changeCode:
-               raise CompareNotEqual(f"{file} delete code unequal - review({reviewCode}) change({changeCode})")
-
-   def getRecords(self):
+         if isSameDiff(reviewCodes, changeCodes):
+            continue
+         # compare add diff codes, then delete diff codes
+         for sign, name in (('+', 'add'), ('-', 'delete')):
+            mismatch = findCodeMismatch(reviewCodes, changeCodes, sign)
+            if mismatch:
+               lineNo, reviewCode, changeCode = mismatch
+               reviewCode = "#{0} {1}".format(lineNo, reviewCode)
+               changeCode = "#{0} {1}".format(lineNo, changeCode)
+               raise CompareNotEqual(f"{file} {name} code unequal - review({reviewCode}) change({changeCode})")
+
+   def compareFileLists(self, changeFiles, reviewFiles):
+      '''
+      Compare the file list of `p4 describe -s` with the file list of the last review revision,
+      before any diff is downloaded. Both sides are compared by exact paths under the branch.
+      '''
+      if len(reviewFiles) != len(changeFiles):
+         raise CompareNotEqual(f"compare file list unequal review({len(reviewFiles)}) change({len(changeFiles)})")
+      changePaths = set(getBranchPath(path, self.branchList) for path in changeFiles)
+      reviewPaths = set(getBranchPath(path, self.branchList) for path in reviewFiles)
+      differentFiles = sorted(reviewPaths - changePaths) or sorted(changePaths - reviewPaths)
+      if differentFiles:
+         raise CompareNotEqual(f"compare file list unequal due to: {differentFiles[0]}")
+
+   def recordFailure(self, check, e, records):
+      '''Put the change into no review, unequal or unknown records by the exception, and save the verdict'''
+      noReviews, unEquals, unknowns = records
+      cln, user = check['cln'], check['user']
+      if isinstance(e, ReviewLinkNotFound):
+         logger.info("occur review link not found: {0}".format(e))
+         noReviews[user].append((cln, check['changeTime']))
+         self.verdictStore.save(check, VERDICT_NO_REVIEW)
+      elif isinstance(e, CompareNotEqual):
+         logger.info("occur compare not equal: {0}".format(e))
+         unEquals[user].append((cln, check['reviewRequestId'], check['changeTime'], str(e)))
+         self.verdictStore.save(check, VERDICT_UNEQUAL, str(e))
+      elif isinstance(e, DiffTooLarge):
+         logger.info("occur change {0} {1}".format(cln, e))
+         unknowns.append("change {0} {1}".format(cln, e))
+         self.verdictStore.save(check, VERDICT_ERROR, str(e))
+      else:
+         logger.info("occur unknown exception during generating p4-review-check-report: {0}".format(e))
+         unknowns.append(str(e))
+         self.verdictStore.save(check, VERDICT_ERROR, str(e))
+
+   def getReviewRevision(self, reviewRequestId):
+      '''The last diff revision of the review request, None if it can't be got'''
+      try:
+         return self.rbParser.getLastRevision(reviewRequestId)
+      except Exception as e:
+         logger.info("get revision of review request #{0} error: {1}".format(reviewRequestId, e))
+         return None
+
+   def replayVerdicts(self, changeList, records, rbPool):
+      '''
+      Put the changes judged by earlier runs into the records by their saved verdicts,
+      return the changes to check. Unknowns of earlier runs are checked again, and so are the changes whose
+      review got a new diff revision since the verdict.
+      '''
+      if self.recheck:
+         return changeList
+      noReviews, unEquals, _ = records
+      verdicts = self.verdictStore.load([change.cln for change in changeList])
+      revisionFutures = {cln: rbPool.submit(self.getReviewRevision, verdict.reviewRequestId)
+                         for cln, verdict in verdicts.items() if verdict.reviewRequestId}
+      for cln, revisionFuture in revisionFutures.items():
+         if revisionFuture.result() != verdicts[cln].reviewRevision:
+            del verdicts[cln]
+      for verdict in verdicts.values():
+         if VERDICT_NO_REVIEW == verdict.verdict:
+            noReviews[verdict.user].append((verdict.cln, verdict.changeTime))
+         elif VERDICT_UNEQUAL == verdict.verdict:
+            unEquals[verdict.user].append((verdict.cln, verdict.reviewRequestId, verdict.changeTime, verdict.reason))
+      logger.info("{0} of {1} changes are judged by earlier runs".format(len(verdicts), len(changeList)))
+      return [change for change in changeList if change.cln not in verdicts]
+
+   def checkFileList(self, change, summary, check):
+      '''
+      Phase one, by the description and affected files only.
+      Return True if the change needs the diff compare of phase two.
+      '''
+      logger.info("-"*30)
+      logger.info("p4 change cln={0}, user={1}".format(change.cln, change.user))
+      if isinstance(summary, Exception):
+         raise summary
+      describeList = self.p4Parser.getSummaryLines(summary)
+      check['changeTime'] = self.p4Parser.getSummaryTime(summary)
+      if self.p4Parser.isEmergencyBackout(describeList):
+         logger.info("It is emergency back out change")
+         return False
+      check['reviewRequestId'] = self.p4Parser.getReviewRequestId(describeList)
+      # the verdict is valid for the last revision, whose file list and diff are compared
+      check['reviewRevision'] = self.rbParser.getLastRevision(check['reviewRequestId'])
+      self.compareFileLists(self.p4Parser.getChangeFiles(summary),
+                            self.rbParser.getFileList(check['reviewRequestId']))
+      return True
+
+   def checkChunk(self, chunk, p4Pool, rbPool, parsePool=None):
+      '''
+      Run the checks of one chunk of changes, p4 commands in p4Pool and review board requests in rbPool,
+      so each upstream has its own concurrency cap and the two are queried at the same time.
+      With parsePool, the diffs are parsed and compared there, otherwise they are parsed in the threads.
+      Return [(check, error, lastChangeDiff, lastReviewDiff)], the diffs are compared by getRecords,
+      they are None if the change is already checked.
+      '''
+      checks = [{'cln': change.cln, 'user': change.user, 'changeTime': "", 'reviewRequestId': "",
+                'reviewRevision': None}
+                for change in chunk]
+      summaries = p4Pool.submit(self.p4Parser.getSummariesBatch, [change.cln for change in chunk]).result()
+      fileListFutures = [rbPool.submit(self.checkFileList, change, summaries[change.cln], check)
+                         for change, check in zip(chunk, checks)]
+      results, diffChecks = [], []
+      for check, fileListFuture in zip(checks, fileListFutures):
+         try:
+            if fileListFuture.result():
+               diffChecks.append(check)
+            else:
+               results.append((check, None, None, None))
+         except Exception as e:
+            results.append((check, e, None, None))
+      if not diffChecks:
+         return results
+      # the diff is only downloaded for the changes whose file lists are the same as their reviews
+      if parsePool is not None:
+         return results + self.compareInProcesses(diffChecks, p4Pool, rbPool, parsePool)
+      describesFuture = p4Pool.submit(self.p4Parser.getDescribesBatch, [check['cln'] for check in diffChecks])
+      reviewDiffFutures = [rbPool.submit(self.rbParser.getDifference, check['reviewRequestId'])
+                           for check in diffChecks]
+      describes = describesFuture.result()
+      for check, reviewDiffFuture in zip(diffChecks, reviewDiffFutures):
+         try:
+            describe = describes[check['cln']]
+            if isinstance(describe, Exception):
+               raise describe
+            lastChangeDiff = self.p4Parser.getDifference(describe)
+            results.append((check, None, lastChangeDiff, reviewDiffFuture.result()))
+         except Exception as e:
+            reviewDiffFuture.cancel()
+            results.append((check, e, None, None))
+      return results
+
+   def compareInProcesses(self, diffChecks, p4Pool, rbPool, parsePool):
+      '''Download the raw describes and patches of the changes, and compare them by compareRawDiffs in parsePool'''
+      uncachedClns = [check['cln'] for check in diffChecks if not self.p4Parser.isDescribeCached(check['cln'])]
+      rawDescribesFuture = p4Pool.submit(self.p4Parser.getRawDescribesBatch, uncachedClns) if uncachedClns else None
+      patchFutures = [rbPool.submit(self.rbParser.getPatch, check['reviewRequestId']) for check in diffChecks]
+      rawDescribes = rawDescribesFuture.result() if rawDescribesFuture else {}
+      verdictFutures = []
+      for check, patchFuture in zip(diffChecks, patchFutures):
+         try:
+            changeTime, rawDescribe = check['changeTime'], None
+            if check['cln'] in rawDescribes:
+               rawDescribe = rawDescribes[check['cln']]
+               if isinstance(rawDescribe, Exception):
+                  raise rawDescribe
+               changeTime, rawDescribe = rawDescribe
+            verdictFutures.append((check, parsePool.submit(compareRawDiffs, check['cln'], changeTime, rawDescribe,
+                                                           patchFuture.result(), self.maxFileDiffLines,
+                                                           self.maxChangeDiffLines)))
+         except Exception as e:
+            patchFuture.cancel()
+            verdictFutures.append((check, e))
+      results = []
+      for check, verdictFuture in verdictFutures:
+         try:
+            error = verdictFuture if isinstance(verdictFuture, Exception) else toVerdictError(verdictFuture.result())
+         except Exception as e:
+            error = e
+         results.append((check, error, None, None))
+      return results
+
+   def createParsePool(self, changeCount):
+      '''Process pool of --parseWorkers processes, None to parse in this process for a small run'''
+      if self.parseWorkers <= 0 or changeCount < PARSE_PROCESS_MIN_CHANGES:
+         return None
+      logger.info("parse and compare diffs of {0} changes in {1} processes".format(changeCount, self.parseWorkers))
+      # spawn, fork is not safe with the running threads and the open sqlite connections.
+      # A spawned process starts with the default deadline of Utils, so it gets the deadline of this run.
+      return ProcessPoolExecutor(max_workers=self.parseWorkers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=setRunDeadline, initargs=(getRunDeadline(),))
+
+   def getRecords(self, onUserFinal=None):
+      '''
+      The changes are checked in a pipeline: `p4 changes` lists the changes, chunks of them are described
+      and downloaded from review board by CHECK_CHUNK_WORKERS threads through the p4 and review board pools,
+      and the diffs are compared here in the order of the changes, or in the parse process pool.
+      :param onUserFinal: called with (user, noReviewList, unEqualList) once all changes of the user are checked
+      '''
       noReviews, unEquals = defaultdict(list), defaultdict(list)
       unknowns = []
+      records = (noReviews, unEquals, unknowns)
       self.p4Parser.loginPerforce()
-      self.p4Parser.setParams(self.dtStartTime, self.dtEndTime, self.branchList)
-      with self.rbParser:
-         for userName in self.userList:
-            changeList = self.p4Parser.getChanges(userName)
-            logger.info("{0} change list count: {1}".format(userName, len(changeList)))
-            for change in changeList:
-               if not change:
-                  continue
-               try:
-                  matchObj = re.match(r"Change (.*) on (.*) by (.*) '(.*)'", change)
-                  cln = matchObj.group(1)
-                  user = matchObj.group(3).split('@')[0]
-                  if user not in self.userList:
-                     continue
-                  logger.info("-"*30)
-                  logger.info("p4 change cln={0}, user={1}".format(cln, user))
-                  changeTime, reviewRequestId = "", ""
-                  describeList, changeTime = self.p4Parser.getDescribes(cln)
-                  if self.p4Parser.isEmergencyBackout(describeList):
-                     logger.info("It is emergency back out change")
-                     continue
-                  reviewRequestId = self.p4Parser.getReviewRequestId(describeList)
-                  lastChangeDiff = self.p4Parser.getDifference(describeList)
-                  lastReviewDiff = self.rbParser.getDifference(reviewRequestId)
-                  # last change diff compare with last review diff
-                  self.compareTwoDiffs(lastChangeDiff, lastReviewDiff)
-               except ReviewLinkNotFound as e:
-                  logger.info("occur review link not found: {0}".format(e))
-                  noReviews[user].append((cln, changeTime))
-               except CompareNotEqual as e:
-                  logger.info("occur compare not equal: {0}".format(e))
-                  unEquals[user].append((cln, reviewRequestId, changeTime, str(e)))
-               except Exception as e:
-                  logger.info("occur unknown exception during generating p4-review-check-report: {0}".format(e))
-                  unknowns.append(str(e))
+      self.p4Parser.setParams(self.dtStartTime, self.dtEndTime, self.branchList, self.useChangeIndex)
+      with self.rbParser, ThreadPoolExecutor(max_workers=self.p4Workers) as p4Pool, \
+            ThreadPoolExecutor(max_workers=self.reviewBoardWorkers) as rbPool:
+         changesByUser = self.p4Parser.getChangesByUser(self.userList)
+         changeList = []
+         for userName, userChanges in changesByUser.items():
+            logger.info("{0} change list count: {1}".format(userName, len(userChanges)))
+            changeList += userChanges
+         changeList = self.selectShard(changeList)
+         uncheckedList = self.replayVerdicts(changeList, records, rbPool)
+         # replayed and checked changes in the order of the change list
+         changeOrder = {change.cln: index for index, change in enumerate(changeList)}
+         uncheckedCounts = Counter(change.user for change in uncheckedList)
+         def finishUser(user):
+            for userRecords in (noReviews[user], unEquals[user]):
+               userRecords.sort(key=lambda record: changeOrder.get(record[0], -1))
+            if onUserFinal is not None:
+               onUserFinal(user, noReviews[user], unEquals[user])
+         for user in self.userList:
+            if 0 == uncheckedCounts[user]:
+               finishUser(user)
+         chunks = [uncheckedList[i:i + DESCRIBE_BATCH_SIZE]
+                   for i in range(0, len(uncheckedList), DESCRIBE_BATCH_SIZE)]
+         parsePool = self.createParsePool(len(uncheckedList))
+         try:
+            checkChunk = lambda chunk: self.checkChunk(chunk, p4Pool, rbPool, parsePool)
+            for chunk, chunkFuture in boundedMap(checkChunk, chunks, maxWorkers=CHECK_CHUNK_WORKERS):
+               for check, error, lastChangeDiff, lastReviewDiff in chunkFuture.result():
+                  try:
+                     if error is not None:
+                        raise error
+                     if lastChangeDiff is not None:
+                        # last change diff compare with last review diff
+                        self.compareTwoDiffs(lastChangeDiff, lastReviewDiff)
+                     self.verdictStore.save(check, VERDICT_OK)
+                  except Exception as e:
+                     self.recordFailure(check, e, records)
+                  uncheckedCounts[check['user']] -= 1
+                  if 0 == uncheckedCounts[check['user']]:
+                     finishUser(check['user'])
+         finally:
+            if parsePool is not None:
+               parsePool.shutdown()
       return noReviews, unEquals, unknowns
 
+   def selectShard(self, changeList):
+      '''
+      Changes of the shard --shardIndex, all shards list the same changes of the window and pick their own part:
+      by crc32 of the user, or by CLN range of about the same number of changes.
+      '''
+      if self.shardIndex is None or self.shardCount <= 1:
+         return changeList
+      if 'user' == self.shardBy:
+         shardList = [change for change in changeList
+                      if self.shardIndex == zlib.crc32(change.user.encode()) % self.shardCount]
+      else:
+         clns = sorted(int(change.cln) for change in changeList)
+         start, end = (len(clns) * index // self.shardCount for index in (self.shardIndex, self.shardIndex + 1))
+         shardClns = set(clns[start:end])
+         shardList = [change for change in changeList if int(change.cln) in shardClns]
+      logger.info("shard {0}/{1} by {2}: {3} of {4} changes".format(self.shardIndex, self.shardCount, self.shardBy,
+                                                                    len(shardList), len(changeList)))
+      return shardList
+
+   def writeShardRecords(self, output):
+      '''Check the changes of this shard and write the records to the json file for the merge'''
+      noReviews, unEquals, unknowns = self.getRecords()
+      tmpOutput = "{0}.{1}.tmp".format(output, os.getpid())
+      with open(tmpOutput, 'w') as f:
+         json.dump({'noReviews': noReviews, 'unEquals': unEquals, 'unknowns': unknowns}, f)
+      os.replace(tmpOutput, output)
+
+   def mergeShardRecords(self, outputs):
+      '''Merge the records written by writeShardRecords, a missing shard is reported in unknowns'''
+      noReviews, unEquals = defaultdict(list), defaultdict(list)
+      unknowns = []
+      for output in outputs:
+         try:
+            with open(output) as f:
+               shardRecords = json.load(f)
+         except Exception as e:
+            logger.info("read review check shard {0} err: {1}".format(output, e))
+            unknowns.append("review check shard {0} failed".format(os.path.basename(output)))
+            continue
+         for user, records in shardRecords['noReviews'].items():
+            noReviews[user] += [tuple(record) for record in records]
+         for user, records in shardRecords['unEquals'].items():
+            unEquals[user] += [tuple(record) for record in records]
+         unknowns += shardRecords['unknowns']
+      # newer changes first, as the change list of one process
+      for userRecords in list(noReviews.values()) + list(unEquals.values()):
+         userRecords.sort(key=lambda record: -int(record[0]))
+      return noReviews, unEquals, unknowns
+
+   def getShardedRecords(self):
+      '''
+      Run --shards processes of this script with --shardIndex and merge their records.
+      The shards share the p4 ticket got here, the describe, patch and verdict caches under persist,
+      but not the memory. A shard still running at the deadline is killed, its checked changes are
+      saved in the verdict store for the next run.
+      '''
+      self.p4Parser.loginPerforce()
+      os.makedirs(SHARD_DIR, exist_ok=True)
+      processes, outputs = [], []
+      for shardIndex in range(self.shardCount):
+         output = os.path.join(SHARD_DIR, "{0}-{1}.json".format(os.getpid(), shardIndex))
+         argv = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + \
+                ['--shardIndex', str(shardIndex), '--shardOutput', output,
+                 '--runTimeout', str(int(max(0, getRemainingTime())))]
+         processes.append(subprocess.Popen(argv, stdout=subprocess.DEVNULL))
+         outputs.append(output)
+      for shardIndex, process in enumerate(processes):
+         try:
+            process.wait(timeout=max(1, getRemainingTime()))
+         except subprocess.TimeoutExpired:
+            logger.info("review check shard {0} is killed at the deadline".format(shardIndex))
+            process.kill()
+            process.wait()
+      try:
+         return self.mergeShardRecords(outputs)
+      finally:
+         for output in outputs:
+            if os.path.exists(output):
+               os.remove(output)
+
    def getReportByChangeOwner(self, userName, noReviewList, unEqualList):
       message = []
       message.append("*Title: {0}'s {1}*".format(userName, self.title))
@@ -165,39 +507,48 @@ class PerforceReviewCheckSpider(object):
             message.append("      #{0}  {1}  {2}  {3}".format(p4Link, reviewLink, info[2], info[3]))
       return message
 
-   @noIntervalPolling
    def sendReportByUser(self, userName, message):
-      url = POST_MESSAGE_API_BY_USER.format(userName)
-      session = requests.session()
-      session.headers = {"Authorization": POST_MESSAGE_BEAR_TOKEN}
-      result = session.post(url, data={"text": message}, verify=False)
-      logger.info("sendReportByUser response: {0}".format(result.content.decode(errors='ignore')))
+      return self.dispatcher.post(POST_MESSAGE_API_BY_USER.format(userName), {"text": message})
 
-   @noIntervalPolling
    def sendReportByChannelId(self, channelId, message):
-      url = POST_MESSAGE_API_BY_CHANNEL.format(channelId)
-      session = requests.session()
-      session.headers = {"Authorization": POST_MESSAGE_BEAR_TOKEN}
-      result = session.post(url, data={"text": message}, verify=False)
-      logger.info("sendReportByChannelId response: {0}".format(result.content.decode(errors='ignore')))
+      return self.dispatcher.post(POST_MESSAGE_API_BY_CHANNEL.format(channelId), {"text": message})
+
+   def sendUserReport(self, user, noReviewList, unEqualList):
+      '''Send the report of the user once, as soon as all changes of the user are checked'''
+      if user in self.sentUsers:
+         return
+      self.sentUsers.add(user)
+      if len(noReviewList) > 0 or len(unEqualList) > 0:
+         report = "\n".join(self.getReportByChangeOwner(user, noReviewList, unEqualList))
+         self.sendReportByUser(userName=user, message=report)
+
+   def collectRecords(self):
+      if self.shardResults:
+         return self.mergeShardRecords(self.shardResults)
+      if self.shardCount > 1 and self.shardIndex is None:
+         return self.getShardedRecords()
+      return self.getRecords(onUserFinal=self.sendUserReport)
 
    @logExecutionTime
    def sendReports(self):
       message = []
-      noReviews, unEquals, unknowns = self.getRecords()
-      if len(unknowns) > 0:
-         msg = "\n".join(unknowns)
-         self.sendReportByChannelId(channelId=VSAN_SLACKBOT_MONITOR_CHANNELID, message=msg)
       self.checkinTime = "Checkin Time(PST): {0} --- {1}".format(self.dtStartTime.strftime("%Y/%m/%d %H:%M:%S"),
                                                                  self.dtEndTime.strftime("%Y/%m/%d %H:%M:%S"))
-      for user in self.userList:
-         noReviewList = noReviews.get(user, [])
-         unEqualList = unEquals.get(user, [])
-         if len(noReviewList) > 0 or len(unEqualList) > 0:
-            msgs = self.getReportByChangeOwner(user, noReviewList, unEqualList)
-            report = "\n".join(msgs)
-            self.sendReportByUser(userName=user, message=report)
-            message.extend(msgs)
+      self.sentUsers = set()
+      # the user reports are posted while the other users are being checked, closing waits for all posts.
+      # The certificate of the slackbot service isn't verified, the same as the posts of the other reports.
+      with MessageDispatcher({"Authorization": POST_MESSAGE_BEAR_TOKEN}, maxConcurrency=POST_MESSAGE_WORKERS,
+                             minInterval=POST_MESSAGE_INTERVAL, verify=False) as self.dispatcher:
+         noReviews, unEquals, unknowns = self.collectRecords()
+         if len(unknowns) > 0:
+            msg = "\n".join(unknowns)
+            self.sendReportByChannelId(channelId=VSAN_SLACKBOT_MONITOR_CHANNELID, message=msg)
+         for user in self.userList:
+            noReviewList = noReviews.get(user, [])
+            unEqualList = unEquals.get(user, [])
+            self.sendUserReport(user, noReviewList, unEqualList)
+            if len(noReviewList) > 0 or len(unEqualList) > 0:
+               message.extend(self.getReportByChangeOwner(user, noReviewList, unEqualList))
       if not message:
          message.append("*Title: {0}*".format(self.title))
          message.append("Branch: {0}".format(" & ".join(self.branchList)))
@@ -213,12 +564,43 @@ def parseArgs():
    parser.add_argument('--startTime', type=float, required=True, help='Check start time')
    parser.add_argument('--endTime', type=float, required=True, help='Check end time')
    parser.add_argument('--users', type=str, required=True, help='Users of perforce review check report')
+   parser.add_argument('--changeIndex', type=str, default='No', choices=['Yes', 'No'],
+                       help='Query changes from the local submitted change index, opt-in while it is proven')
+   parser.add_argument('--maxFileDiffLines', type=int, default=MAX_FILE_DIFF_LINES,
+                       help='A change with more diff lines in one file is too large to compare')
+   parser.add_argument('--maxChangeDiffLines', type=int, default=MAX_CHANGE_DIFF_LINES,
+                       help='A change with more diff lines is too large to compare')
+   parser.add_argument('--p4Workers', type=int, default=DESCRIBE_BATCH_WORKERS,
+                       help='Max p4 describe commands running at the same time')
+   parser.add_argument('--reviewBoardWorkers', type=int, default=REVIEW_BOARD_WORKERS,
+                       help='Max review board requests at the same time')
+   parser.add_argument('--parseWorkers', type=int, default=0,
+                       help='Parse and compare diffs in so many processes, 0 to parse in the report process')
+   parser.add_argument('--recheck', type=str, default='No', choices=['Yes', 'No'],
+                       help='Check the changes judged by earlier runs again or not')
+   parser.add_argument('--shards', type=int, default=1,
+                       help='Split the check into so many shard processes')
+   parser.add_argument('--shardBy', type=str, default='user', choices=['user', 'cln'],
+                       help='Split the changes by user hash or by CLN range')
+   parser.add_argument('--shardIndex', type=int, default=None,
+                       help='Only check this shard of --shards and write the records to --shardOutput')
+   parser.add_argument('--shardOutput', type=str, default=None,
+                       help='Json file of the records of --shardIndex')
+   parser.add_argument('--shardResults', type=str, default=None,
+                       help='Comma separated --shardOutput files of the shards run elsewhere, merge and send them')
+   parser.add_argument('--runTimeout', type=int, default=REVIEW_CHECK_RUN_TIMEOUT,
+                       help='Seconds before the scheduler kills the report')
    return parser.parse_args()
 
 if __name__ == '__main__':
    args = parseArgs()
+   setRunTimeout(args.runTimeout)
    spider = PerforceReviewCheckSpider(args)
-   ret = spider.sendReports()
-   # schedule.js wait for the stdout and send report to selected channel
-   print(ret)
-   logger.info(ret)
+   if args.shardIndex is not None:
+      spider.writeShardRecords(args.shardOutput)
+   else:
+      ret = spider.sendReports()
+      # schedule.js wait for the stdout and send report to selected channel
+      print(ret)
+      logger.info(ret)
+   commandExecutor.logStats()
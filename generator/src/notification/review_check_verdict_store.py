@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+review_check_verdict_store.py
+Verdict of each CLN checked by perforce review check report, saved in persist/cache/review-check-verdicts.db
+as soon as the CLN is checked. A run killed by the timeout resumes from the saved verdicts, and the CLNs
+judged by an earlier run of an overlapping window are not checked again.
+A verdict is only valid for the last diff revision of the review request it was judged against, a new
+revision uploaded to the review is checked again, and it expires after VERDICT_TTL seconds, so a description
+edited to link a review after the check is picked up.
+VERDICT_ERROR is saved for the record only, the CLN is checked again by the next run.
+'''
+
+import os
+import time
+import sqlite3
+from collections import namedtuple
+
+VERDICT_PATH = os.path.join(os.path.abspath(__file__).split("/generator")[0], "persist/cache/review-check-verdicts.db")
+VERDICT_OK = 'ok'
+VERDICT_NO_REVIEW = 'noReview'
+VERDICT_UNEQUAL = 'unequal'
+VERDICT_ERROR = 'error'
+VERDICT_TTL = 7 * 24 * 3600
+
+Verdict = namedtuple('Verdict', ['cln', 'user', 'verdict', 'reviewRequestId', 'reviewRevision', 'changeTime',
+                                 'reason'])
+
+class VerdictStore(object):
+   def __init__(self, path=VERDICT_PATH):
+      self.path = path
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+      self.conn.execute("PRAGMA journal_mode=WAL")
+      self.conn.execute("CREATE TABLE IF NOT EXISTS verdicts (cln INTEGER PRIMARY KEY, user TEXT, verdict TEXT, "
+                        "reviewRequestId TEXT, reviewRevision INTEGER, changeTime TEXT, reason TEXT, "
+                        "updated INTEGER)")
+      columns = [row[1] for row in self.conn.execute("PRAGMA table_info(verdicts)")]
+      if 'reviewRevision' not in columns:
+         # verdicts saved before the revision was kept are checked again, their revision is NULL
+         self.conn.execute("ALTER TABLE verdicts ADD COLUMN reviewRevision INTEGER")
+      self.conn.commit()
+
+   def save(self, check, verdict, reason=""):
+      '''
+      Save the verdict of the CLN, committed at once so it survives a killed run.
+      :param check: dict with cln, user, reviewRequestId, reviewRevision and changeTime
+      '''
+      self.conn.execute("INSERT OR REPLACE INTO verdicts (cln, user, verdict, reviewRequestId, reviewRevision, "
+                        "changeTime, reason, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (int(check['cln']), check['user'], verdict, check['reviewRequestId'],
+                         check.get('reviewRevision'), check['changeTime'], reason, int(time.time())))
+      self.conn.commit()
+
+   def load(self, clns, ttl=VERDICT_TTL):
+      '''
+      Return {cln: Verdict} of the judged CLNs, CLNs without verdict, with VERDICT_ERROR or with a verdict
+      older than ttl seconds are missing. The caller checks the review revision of the verdicts.
+      '''
+      verdicts = {}
+      clns = [int(cln) for cln in clns]
+      minUpdated = int(time.time()) - ttl
+      # sqlite allows 999 variables in one statement
+      for start in range(0, len(clns), 900):
+         part = clns[start:start + 900]
+         sql = "SELECT cln, user, verdict, reviewRequestId, reviewRevision, changeTime, reason FROM verdicts " \
+               "WHERE cln IN ({0}) AND verdict != ? AND updated >= ?".format(",".join("?" * len(part)))
+         for row in self.conn.execute(sql, part + [VERDICT_ERROR, minUpdated]):
+            verdict = Verdict(str(row[0]), *row[1:])
+            verdicts[verdict.cln] = verdict
+      return verdicts
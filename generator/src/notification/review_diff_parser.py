@@ -7,23 +7,38 @@ Module docstring.
 review_diff_parser.py
 '''
 
-import re
 from rbtools.api.client import RBClient
 from generator.src.utils.BotConst import SERVICE_ACCOUNT, SERVICE_PASSWORD
 from generator.src.utils.Logger import logger
+from generator.src.utils.Utils import RetryPolicy
+from generator.src.utils.DiskCache import DiskCache
+from diff_engine import iterUnifiedDiffs, iterLines, DiffTooLarge, DELETED_FILE
+
+# an uploaded diff revision never changes, its patch and file list are cached by review request id and revision
+patchCache = DiskCache('rb-patch', maxBytes=512 * 1024 * 1024)
+
+def getPatchCacheKey(reviewRequestId, revision, flavor='patch'):
+   return "{0}:{1}:{2}".format(reviewRequestId, revision, flavor)
 
 class ReviewDiffParser(object):
-   def __init__(self):
+   def __init__(self, maxFileDiffLines=None, maxChangeDiffLines=None):
       self.queryUrl = "https://reviewboard.eng.vmware.com/api/review-requests/{0}/diffs/"
-      self.linePattern = re.compile(r"^@@ (\-\d+),(\d+) (\+\d+),(\d+) @@")
+      self.maxFileDiffLines = maxFileDiffLines
+      self.maxChangeDiffLines = maxChangeDiffLines
+      # review request id -> diff resource of the last revision, shared by getFileList and getDifference
+      self.lastDiffs = {}
 
    def __enter__(self):
       '''login review board system'''
       self.clientRB = RBClient('https://reviewboard.eng.vmware.com/')
-      self.clientRB.login(username=SERVICE_ACCOUNT, password=SERVICE_PASSWORD)
+      self.login()
       logger.info("login review board -->")
       return self.clientRB
 
+   @RetryPolicy()
+   def login(self):
+      self.clientRB.login(username=SERVICE_ACCOUNT, password=SERVICE_PASSWORD)
+
    def __exit__(self, exc_type, exc_val, exc_tb):
       logger.info("<-- logout review board")
       try:
@@ -37,29 +52,87 @@ class ReviewDiffParser(object):
       Restore difference infos by file list.
       :return param diffInfo: dict<filePath, diffList>
       '''
+      return self.getDifferenceFromPatch(self.getPatch(reviewRequestId))
+
+   def getPatch(self, reviewRequestId):
+      try:
+         return self.downloadPatchInfo(reviewRequestId)
+      except Exception as e:
+         logger.info("get review diff error: {0}".format(e))
+         raise Exception("get review diff failure")
+
+   def getDifferenceFromPatch(self, diffConntent):
+      '''Parse the patch got by getPatch, deleted files are filtered'''
       try:
-         diffConntent = self.downloadPatchInfo(reviewRequestId)
          lastReviewDiff = self.parseLastReviewDiff(diffConntent)
          # filter delete file
          diffInfo = {}
          for filePath, reviewCodes in lastReviewDiff.items():
-            if "delete" == reviewCodes:  # delete file
+            if DELETED_FILE == reviewCodes:  # delete file
                logger.info("review: {0} deleted".format(filePath))
             else:
                diffInfo[filePath] = reviewCodes
+      except DiffTooLarge:
+         raise
       except Exception as e:
          logger.info("get review diff error: {0}".format(e))
          raise Exception("get review diff failure")
       return diffInfo
 
+   def getLastDiff(self, reviewRequestId):
+      '''
+      Get the diff resource of the last revision of the review request.
+      Ask one item for the total count of revisions, then get the last one by its index,
+      instead of paging through all revisions.
+      '''
+      lastReviewDiffResource = self.lastDiffs.get(reviewRequestId)
+      if lastReviewDiffResource is None:
+         url = self.queryUrl.format(reviewRequestId)
+         reviewDiffRes = self.clientRB.get_url(url, max_results=1, timeout=5000)
+         if reviewDiffRes.total_results < 1:
+            raise Exception("review request #{0} hasn't any diff".format(reviewRequestId))
+         if reviewDiffRes.total_results > 1:
+            reviewDiffRes = self.clientRB.get_url(url, start=reviewDiffRes.total_results - 1, max_results=1,
+                                                  timeout=5000)
+         lastReviewDiffResource = reviewDiffRes[0]
+         logger.info("review request #{0} revision {1}".format(reviewRequestId, lastReviewDiffResource.revision))
+         self.lastDiffs[reviewRequestId] = lastReviewDiffResource
+      return lastReviewDiffResource
+
+   @RetryPolicy(relogin=lambda self, *args: self.login())
+   def getLastRevision(self, reviewRequestId):
+      '''Get the revision number of the last diff of the review request'''
+      return self.getLastDiff(reviewRequestId).revision
+
+   @RetryPolicy(relogin=lambda self, *args: self.login())
+   def getFileList(self, reviewRequestId):
+      '''
+      Get the file paths of the last review revision without downloading the patch.
+      Deleted files are left out like getDifference does, binary files are kept.
+      '''
+      lastReviewDiffResource = self.getLastDiff(reviewRequestId)
+      cacheKey = getPatchCacheKey(reviewRequestId, lastReviewDiffResource.revision, 'file-paths')
+      filePaths = patchCache.get(cacheKey)
+      if filePaths is not None:
+         return filePaths
+      filePaths = []
+      for fileDiff in lastReviewDiffResource.get_files().all_items:
+         if 'deleted' == getattr(fileDiff, 'status', ''):
+            continue
+         filePaths.append(fileDiff.dest_file)
+      patchCache.set(cacheKey, filePaths)
+      return filePaths
+
+   @RetryPolicy(relogin=lambda self, *args: self.login())
    def downloadPatchInfo(self, reviewRequestId):
-      '''Download patch info by review request id'''
-      url = self.queryUrl.format(reviewRequestId)
-      allReviewDiffRes = self.clientRB.get_url(url, timeout=5000)
-      logger.info("review request #{0}".format(reviewRequestId))
-      *_, lastReviewDiffResource = allReviewDiffRes.all_items
-      patchInfo = lastReviewDiffResource.get_patch()
-      return patchInfo.data.decode(errors='ignore')
+      '''Download patch info by review request id, the patch of a revision is downloaded once'''
+      lastReviewDiffResource = self.getLastDiff(reviewRequestId)
+      cacheKey = getPatchCacheKey(reviewRequestId, lastReviewDiffResource.revision)
+      patch = patchCache.get(cacheKey)
+      if patch is None:
+         patch = lastReviewDiffResource.get_patch().data.decode(errors='ignore')
+         patchCache.set(cacheKey, patch)
+      return patch
 
    def parseLastReviewDiff(self, differences):
       '''
@@ -76,75 +149,4 @@ class ReviewDiffParser(object):
       Get file path from line start with '---' or '+++'
       Split difference by file path to get each file difference detail
       '''
-      diffInfo = {}
-      filePath, fileContent = "", []
-      diffLines = differences.split('\n')
-      while diffLines:
-         line = diffLines.pop(0)
-         if line.startswith("diff --git"):
-            continue
-         elif re.match(r"index [0-9a-z]{40}..[0-9a-z]{40}", line):
-            continue
-         elif line.startswith("--- ") or line.startswith("+++ "):
-            if fileContent and filePath:
-               diffInfo[filePath] = self.getReviewFileDiff(fileContent)
-               fileContent = []
-            filePath = self.getReviewFilePath(line)
-         else:
-            fileContent.append(line)
-      if fileContent and filePath:
-         diffInfo[filePath] = self.getReviewFileDiff(fileContent)
-      return diffInfo
-
-   def getReviewFilePath(self, line):
-      line = line.replace("--- ", "").replace("+++ ", "")
-      line = line.split()[0]
-      if line.startswith("a/") or line.startswith("b/"):
-         return "/".join(line.split("/")[2:])
-      return "/".join(line.split("/")[5:])
-
-   def getReviewFileDiff(self, diffContent):
-      '''
-      Get each file difference detail
-      :return param fileDiff: List element: Tuple (+/-, code, lineNo)
-      Here explain for example:
-         @@ -158,6 +158,71 @@ test_all_done(const uint8 done, const uint8 num_tables)
-      Use RegExp `^@@ (\-\d+),(\d+) (\+\d+),(\d+) @@` to match `@@ -158,6 +158,71 @@`
-      Then get delete start lineNo=-158 and add start lineNo=158, and abs(lineNo)
-      If one file's difference is '-' totally, it's a deleted file, just mark 'delete' to skip compare detail.
-      '''
-      otherLineNo = 0
-      deleteLineNo, addLineNo = 0, 0
-      codes = []
-      fileDiff = []
-      while diffContent:
-         line = diffContent.pop(0)
-         if self.linePattern.match(line):
-            if codes:
-               fileDiff.extend(codes)
-               codes = []
-            lineNoInfo = self.linePattern.findall(line)[0]
-            deleteLineNo, addLineNo = abs(int(lineNoInfo[0])), int(lineNoInfo[2])
-            continue
-         if line.startswith("-"):
-            if line[1:]:
-               codes.append(('-', deleteLineNo, line[1:]))
-            deleteLineNo += 1
-         elif line.startswith("+"):
-            if line[1:]:
-               codes.append(('+', addLineNo, line[1:]))
-            addLineNo += 1
-         elif "\ No newline at end of file" == line:
-            continue
-         else:
-            deleteLineNo += 1
-            addLineNo += 1
-            otherLineNo += 1
-      fileDiff.extend(codes)
-
-      if 0 == otherLineNo:
-         if 0 == len(list((r for r in fileDiff if '+' == r[0]))):  # delete file
-            return "delete"
-         elif 0 == len(list((r for r in fileDiff if '-' == r[0]))):  # add file
-            return fileDiff
-      return fileDiff
+      return dict(iterUnifiedDiffs(iterLines(differences), self.maxFileDiffLines, self.maxChangeDiffLines))
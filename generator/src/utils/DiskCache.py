@@ -0,0 +1,148 @@
+# !/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+DiskCache.py
+Key-value cache shared by report generator processes, saved in persist/cache/<name>.db.
+Values are pickled and zlib compressed. When the total size exceeds maxBytes,
+least recently used entries are evicted. If ttl is given, entries expire after ttl seconds.
+Hits and misses recorded by recordStats are counted per hour in the same database, so the hit ratio
+of all processes over a period, e.g. the reports of the morning, is read by getHitRatio.
+'''
+
+import os
+import time
+import zlib
+import pickle
+import sqlite3
+import threading
+from generator.src.utils.Logger import logger
+
+CACHE_DIR = os.path.join(os.path.abspath(__file__).split("/generator")[0], "persist/cache")
+# check the total size after every N writes, or after writing (1 - EVICT_TARGET_RATIO) * maxBytes
+EVICT_CHECK_INTERVAL = 50
+# evict until the total size is under this ratio of maxBytes
+EVICT_TARGET_RATIO = 0.8
+# hit and miss counts are kept per hour for this many days
+STATS_KEEP_DAYS = 30
+
+class DiskCache(object):
+   def __init__(self, name, maxBytes=256 * 1024 * 1024, ttl=None):
+      self.path = os.path.join(CACHE_DIR, "{0}.db".format(name))
+      self.maxBytes = maxBytes
+      self.ttl = ttl
+      self.hits, self.misses = 0, 0
+      self._conn = None
+      self._lock = threading.Lock()
+      self._writeCount = 0
+      self._writtenBytes = 0
+
+   @property
+   def conn(self):
+      if self._conn is None:
+         os.makedirs(CACHE_DIR, exist_ok=True)
+         self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+         self._conn.execute("PRAGMA journal_mode=WAL")
+         self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, "
+                            "size INTEGER, created REAL, accessed REAL)")
+         self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+         self._conn.execute("CREATE TABLE IF NOT EXISTS stats (hour INTEGER PRIMARY KEY, hits INTEGER, "
+                            "misses INTEGER)")
+      return self._conn
+
+   def get(self, key, default=None):
+      try:
+         with self._lock:
+            row = self.conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+               self.misses += 1
+               return default
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+         value = pickle.loads(zlib.decompress(row[0]))
+      except Exception as e:
+         logger.error("read cache {0} key {1} error: {2}".format(self.path, key, e))
+         self.misses += 1
+         return default
+      self.hits += 1
+      return value
+
+   def contains(self, key):
+      '''Check the key without reading and unpickling the value'''
+      try:
+         with self._lock:
+            row = self.conn.execute("SELECT created FROM cache WHERE key = ?", (key,)).fetchone()
+      except Exception as e:
+         logger.error("read cache {0} key {1} error: {2}".format(self.path, key, e))
+         return False
+      return row is not None and (self.ttl is None or time.time() - row[0] <= self.ttl)
+
+   def set(self, key, value):
+      try:
+         blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+         now = time.time()
+         with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO cache (key, value, size, created, accessed) "
+                              "VALUES (?, ?, ?, ?, ?)", (key, blob, len(blob), now, now))
+            self._writeCount += 1
+            self._writtenBytes += len(blob)
+            if 1 == self._writeCount % EVICT_CHECK_INTERVAL or \
+                  self._writtenBytes > self.maxBytes * (1 - EVICT_TARGET_RATIO):
+               self.evict()
+               self._writtenBytes = 0
+      except Exception as e:
+         logger.error("write cache {0} key {1} error: {2}".format(self.path, key, e))
+
+   def evict(self):
+      '''Delete least recently used entries until the total size is under maxBytes.'''
+      totalSize = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+      if totalSize <= self.maxBytes:
+         return
+      targetSize = self.maxBytes * EVICT_TARGET_RATIO
+      expiredKeys = []
+      for key, size in self.conn.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall():
+         if totalSize <= targetSize:
+            break
+         expiredKeys.append((key,))
+         totalSize -= size
+      self.conn.executemany("DELETE FROM cache WHERE key = ?", expiredKeys)
+      logger.info("evict {0} entries from cache {1}".format(len(expiredKeys), self.path))
+
+   def recordStats(self, hits=0, misses=0):
+      '''Add the hits and misses to the counts of this hour shared by all processes'''
+      hour = int(time.time() // 3600)
+      try:
+         with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+               self.conn.execute("INSERT OR IGNORE INTO stats (hour, hits, misses) VALUES (?, 0, 0)", (hour,))
+               self.conn.execute("UPDATE stats SET hits = hits + ?, misses = misses + ? WHERE hour = ?",
+                                 (hits, misses, hour))
+               self.conn.execute("DELETE FROM stats WHERE hour < ?", (hour - STATS_KEEP_DAYS * 24,))
+               self.conn.execute("COMMIT")
+            except Exception:
+               self.conn.execute("ROLLBACK")
+               raise
+      except Exception as e:
+         logger.error("record stats of cache {0} error: {1}".format(self.path, e))
+
+   def getStats(self, since=None):
+      '''(hits, misses) recorded by all processes since the epoch time, counted by the hour of since'''
+      try:
+         with self._lock:
+            return tuple(self.conn.execute("SELECT COALESCE(SUM(hits), 0), COALESCE(SUM(misses), 0) FROM stats "
+                                           "WHERE hour >= ?", (int((since or 0) // 3600),)).fetchone())
+      except Exception as e:
+         logger.error("read stats of cache {0} error: {1}".format(self.path, e))
+         return 0, 0
+
+   def getHitRatio(self, since=None):
+      '''Hit ratio of the hits and misses recorded by all processes since the epoch time'''
+      hits, misses = self.getStats(since)
+      return hits / (hits + misses) if hits + misses > 0 else 0.0
+
+   def hitRatio(self):
+      total = self.hits + self.misses
+      return self.hits / total if total > 0 else 0.0
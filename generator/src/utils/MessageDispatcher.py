@@ -0,0 +1,121 @@
+# !/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+MessageDispatcher.py
+Post report messages through one keep-alive session by a bounded pool of threads.
+Posts to the same destination, the host of the API by default, are spaced by minInterval seconds.
+A 429 or 503 response with Retry-After holds the destination for that long before the post is retried,
+the rate limit of a server covers all of its urls, so the posts to its other urls wait too.
+Other retryable errors back off with jitter.
+Usage:
+   with MessageDispatcher({"Authorization": token}) as dispatcher:
+      dispatcher.post(url, {"text": message})
+'''
+
+import time
+import random
+import threading
+import email.utils
+import requests
+from urllib import parse
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from generator.src.utils.Logger import logger
+from generator.src.utils.Utils import raiseForStatus, isRetryableError, getRemainingTime
+
+def getRetryAfter(response):
+   '''Seconds of the Retry-After header, which is seconds or an HTTP date, None if there isn't one'''
+   value = response.headers.get('Retry-After')
+   if not value:
+      return None
+   try:
+      return max(0.0, float(value))
+   except ValueError:
+      pass
+   try:
+      return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+   except (TypeError, ValueError):
+      return None
+
+class MessageDispatcher(object):
+   def __init__(self, headers, maxConcurrency=4, minInterval=1.0, maxAttempts=3, baseDelay=1, maxDelay=30,
+                timeout=60, verify=True):
+      '''
+      :param verify: verify the certificate of the server, False for a server whose certificate isn't
+                     in the CA bundle of the generator host
+      '''
+      self.session = requests.Session()
+      self.session.headers.update(headers)
+      adapter = HTTPAdapter(pool_connections=1, pool_maxsize=maxConcurrency)
+      self.session.mount('https://', adapter)
+      self.session.mount('http://', adapter)
+      self.pool = ThreadPoolExecutor(max_workers=maxConcurrency)
+      self.minInterval = minInterval
+      self.maxAttempts = maxAttempts
+      self.baseDelay = baseDelay
+      self.maxDelay = maxDelay
+      self.timeout = timeout
+      self.verify = verify
+      self.lock = threading.Lock()
+      # destination -> time.monotonic() of its next post
+      self.nextPostTimes = {}
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, exc_type, exc_val, exc_tb):
+      self.close()
+
+   def post(self, url, data, destination=None):
+      '''
+      Queue the post and return at once.
+      :param destination: posts of the same destination are rate limited together, the host of the url by default
+      :return: Future of the response, or of "error" if the post failed after retries
+      '''
+      return self.pool.submit(self.send, url, data, destination or parse.urlsplit(url).netloc)
+
+   def reserve(self, destination):
+      '''Take the next post time of the destination, return the seconds to wait for it'''
+      with self.lock:
+         now = time.monotonic()
+         postTime = max(now, self.nextPostTimes.get(destination, now))
+         self.nextPostTimes[destination] = postTime + self.minInterval
+      return postTime - now
+
+   def hold(self, destination, seconds):
+      with self.lock:
+         self.nextPostTimes[destination] = max(self.nextPostTimes.get(destination, 0), time.monotonic() + seconds)
+
+   def send(self, url, data, destination):
+      attempt = 0
+      while True:
+         attempt += 1
+         retryAfter = None
+         waitTime = self.reserve(destination)
+         if waitTime >= getRemainingTime():
+            logger.error("post {0} err: run deadline exceeded before the next post in {1:.1f}s".format(url, waitTime))
+            return "error"
+         time.sleep(waitTime)
+         try:
+            response = self.session.post(url, data=data, verify=self.verify, timeout=self.timeout)
+            if response.status_code in (429, 503):
+               retryAfter = getRetryAfter(response)
+               if retryAfter is not None:
+                  self.hold(destination, retryAfter)
+            raiseForStatus(response)
+            logger.info("post {0} response: {1}".format(url, response.content.decode(errors='ignore')))
+            return response
+         except Exception as e:
+            logger.exception('attempt {0}/{1}, post {2} err: {3}'.format(attempt, self.maxAttempts, url, e))
+            if attempt >= self.maxAttempts or not isRetryableError(e):
+               return "error"
+            if retryAfter is None:
+               self.hold(destination, random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** (attempt - 1))))
+
+   def close(self):
+      '''Wait for the queued posts and close the connections'''
+      self.pool.shutdown(wait=True)
+      self.session.close()
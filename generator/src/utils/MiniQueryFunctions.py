@@ -14,6 +14,7 @@ import hashlib
 import pickle
 from filelock import FileLock
 from generator.src.utils.Logger import logger
+from generator.src.utils.Utils import RetryPolicy
 
 def long2short(long_url):
     try:
@@ -21,7 +22,8 @@ def long2short(long_url):
                    'short_key': '',
                    'expire_type': 'indefinitely',
                    'user_id': 'svc.vsan-er'}
-        response = requests.post(url='https://vsanvia.broadcom.net/api/shorten', data=json.dumps(payload), verify=False)
+        response = RetryPolicy().call(requests.post, url='https://vsanvia.broadcom.net/api/shorten',
+                                      data=json.dumps(payload), verify=False, timeout=60)
         if response.status_code == 200:
             data = response.json()
             return data.get('short_url', None)
@@ -31,7 +33,7 @@ def long2short(long_url):
 
 def short2long(short_url):
     try:
-        response = requests.get(url=short_url, allow_redirects=False, verify=False)
+        response = RetryPolicy().call(requests.get, url=short_url, allow_redirects=False, verify=False, timeout=60)
         logger.info(response.status_code)
         logger.info(response.content.decode())
         if response.status_code == 302:
@@ -49,7 +51,7 @@ def QueryUserById(oktaId):
    else:
       API = 'https://127.0.0.1:3001/api/v1/user?name='
    try:
-      res = requests.get(API + oktaId)
+      res = RetryPolicy().call(requests.get, API + oktaId, timeout=60)
       if res.status_code == 200:
          return res.json()
    except Exception as e:
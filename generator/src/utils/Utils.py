@@ -8,12 +8,20 @@ Utils.py
 '''
 import json
 import os
+import socket
+import random
 import traceback
 import pytz
+import requests
 import subprocess
+import threading
+import tempfile
+import contextlib
+import collections
 import time
 import functools
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from urllib import parse
 from generator.src.utils.Logger import logger
 
@@ -22,16 +30,328 @@ MAX_CHAR_LENGTH_IN_ONE_REPORT = 3700
 # Cache for slash command usages
 slashCmdUsagesCache = {}
 
-def runCmd(cmd, nTimeOut=300):
-   process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE, shell=True)
-   try:
-      stdout, stderr = process.communicate(timeout=nTimeOut)
-      returncode = process.returncode
-   except subprocess.TimeoutExpired:
-      process.kill()
-      stdout, stderr = process.communicate()
-      returncode = process.returncode
-   return stdout, stderr, returncode
+# scheduler.js kills the generator after 10 minutes, and the perforce review check after 60 minutes.
+RUN_TIMEOUT = 10 * 60
+REVIEW_CHECK_RUN_TIMEOUT = 60 * 60
+# keep some seconds to print the report before the scheduler kills the generator
+DEADLINE_MARGIN = 30
+processStartTime = time.monotonic()
+runDeadline = processStartTime + RUN_TIMEOUT - DEADLINE_MARGIN
+
+# p4, bugzilla and review board error messages which mean the ticket or session should be renewed
+LOGIN_EXPIRED_MESSAGES = ('your session has expired', 'p4passwd) invalid or unset', 'please login again',
+                          'you are not logged in')
+# p4 error messages which mean a temporary network or server failure
+P4_RETRYABLE_MESSAGES = ('connect to server failed', 'tcp receive failed', 'tcp send failed',
+                         'ssl receive failed', 'ssl send failed', 'partner exited unexpectedly',
+                         'server is too busy')
+
+def setRunTimeout(seconds):
+   global runDeadline
+   runDeadline = processStartTime + seconds - DEADLINE_MARGIN
+
+def getRemainingTime():
+   return runDeadline - time.monotonic()
+
+def getRunDeadline():
+   '''The deadline by time.time(), to pass it to a child process whose monotonic clock differs'''
+   return time.time() + getRemainingTime()
+
+def setRunDeadline(deadline):
+   '''Set the deadline of this process to the deadline by time.time() of the parent process'''
+   setRunTimeout(deadline - time.time() + time.monotonic() - processStartTime + DEADLINE_MARGIN)
+
+class DeadlineExceeded(Exception):
+   def __str__(self):
+      return "run deadline exceeded before calling {0}".format(super().__str__())
+
+class RetryableError(Exception):
+   pass
+
+class LoginExpired(RetryableError):
+   pass
+
+class HttpStatusError(Exception):
+   def __init__(self, statusCode, message=''):
+      super().__init__("{0} - {1}".format(statusCode, message))
+      self.statusCode = statusCode
+
+def raiseForStatus(response):
+   '''Raise HttpStatusError for the status codes worth retrying: 5xx, 429 and 401 (login expired).'''
+   statusCode = response.status_code
+   if statusCode >= 500 or statusCode in (401, 429):
+      raise HttpStatusError(statusCode, response.reason)
+
+def raiseForP4Error(command, stderr, returncode):
+   '''
+   Classify a failed p4 command by its stderr, so that RetryPolicy knows whether it is worth retrying.
+   Raise LoginExpired or RetryableError, other failures are left to the caller.
+   Negative returncode means the command was killed after timeout.
+   '''
+   errorText = (stderr or b'').decode('utf-8', errors='ignore').strip()
+   if any(msg in errorText.lower() for msg in LOGIN_EXPIRED_MESSAGES):
+      raise LoginExpired("{0}: {1}".format(command, errorText))
+   if returncode < 0 or any(msg in errorText.lower() for msg in P4_RETRYABLE_MESSAGES):
+      raise RetryableError("{0}: {1} returncode={2}".format(command, errorText, returncode))
+
+def isLoginExpired(e):
+   if isinstance(e, LoginExpired):
+      return True
+   if isinstance(e, HttpStatusError):
+      return 401 == e.statusCode
+   if 401 == getattr(e, 'http_status', None):  # rbtools APIError
+      return True
+   return any(msg in str(e).lower() for msg in LOGIN_EXPIRED_MESSAGES)
+
+def isRetryableError(e):
+   if isinstance(e, DeadlineExceeded):
+      return False
+   if isinstance(e, (RetryableError, subprocess.TimeoutExpired, socket.timeout, TimeoutError, ConnectionError,
+                     requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+      return True
+   if isinstance(e, HttpStatusError):
+      return e.statusCode >= 500 or e.statusCode in (401, 429)
+   if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+      return e.response.status_code >= 500 or e.response.status_code in (401, 429)
+   statusCode = getattr(e, 'http_status', None)  # rbtools APIError
+   if isinstance(statusCode, int):
+      return statusCode >= 500 or statusCode in (401, 429)
+   return isLoginExpired(e)
+
+class RetryPolicy(object):
+   '''
+   Retry a function with jittered exponential backoff.
+   The n-th retry sleeps a random time in [0, min(maxDelay, baseDelay * 2^(n-1))] seconds.
+   Only errors classified by `isRetryable` are retried, and no retry sleeps past the run deadline.
+   `relogin` is called with the arguments of the failed call before retrying a login expired error.
+   If `fallback` is given, it is returned instead of raising the last error.
+   Usage:
+      @RetryPolicy(maxAttempts=5)
+      def search(...)
+   or
+      RetryPolicy().call(session.get, url)
+   '''
+   RAISE = object()
+
+   def __init__(self, maxAttempts=3, baseDelay=1, maxDelay=30, isRetryable=isRetryableError,
+                relogin=None, fallback=RAISE):
+      self.maxAttempts = maxAttempts
+      self.baseDelay = baseDelay
+      self.maxDelay = maxDelay
+      self.isRetryable = isRetryable
+      self.relogin = relogin
+      self.fallback = fallback
+
+   def getDelay(self, attempt):
+      return random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** (attempt - 1)))
+
+   def call(self, func, *args, **kwargs):
+      attempt = 0
+      while True:
+         attempt += 1
+         try:
+            if getRemainingTime() <= 0:
+               raise DeadlineExceeded(func.__name__)
+            return func(*args, **kwargs)
+         except Exception as e:
+            logger.exception('attempt {0}/{1}, Function [{2}] err: {3}'.format(attempt, self.maxAttempts,
+                                                                              func.__name__, e))
+            delay = self.getDelay(attempt)
+            if attempt >= self.maxAttempts or not self.isRetryable(e) or delay >= getRemainingTime():
+               if self.fallback is RetryPolicy.RAISE:
+                  raise
+               return self.fallback
+            if self.relogin is not None and isLoginExpired(e):
+               try:
+                  self.relogin(*args, **kwargs)
+               except Exception as loginError:
+                  logger.error('relogin before retrying [{0}] err: {1}'.format(func.__name__, loginError))
+            time.sleep(delay)
+
+   def __call__(self, func):
+      @functools.wraps(func)
+      def wrapper(*args, **kwargs):
+         return self.call(func, *args, **kwargs)
+      return wrapper
+
+class CommandFailed(Exception):
+   def __init__(self, command, stderr, returncode):
+      super().__init__("{0} returncode={1}".format(command, returncode))
+      self.command = command
+      self.stderr = stderr
+      self.returncode = returncode
+
+@contextlib.contextmanager
+def openCmdStream(cmd, nTimeOut=300):
+   '''
+   Start the command and give its stdout as a binary stream, so the output can be processed
+   while the command is still running, instead of buffering the whole stdout.
+   The command is killed after nTimeOut seconds. stderr goes to a temporary file, so a chatty stderr
+   can't block the command while stdout is being read.
+   Raise CommandFailed with stderr and returncode if the command exits with nonzero.
+   Usage:
+      with openCmdStream(['p4', 'changes', '//depot/bora/main/...@now']) as stdout:
+         for line in stdout:
+            ...
+   '''
+   nTimeOut = max(1, min(nTimeOut, getRemainingTime()))
+   with tempfile.TemporaryFile() as stderrFile:
+      process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderrFile, stdin=subprocess.DEVNULL,
+                                 shell=isinstance(cmd, str))
+      watchdog = threading.Timer(nTimeOut, process.kill)
+      watchdog.start()
+      try:
+         yield process.stdout
+      except BaseException:
+         process.kill()
+         raise
+      finally:
+         watchdog.cancel()
+         process.stdout.close()
+         returncode = process.wait()
+      if returncode != 0:
+         stderrFile.seek(0)
+         raise CommandFailed(cmd, stderrFile.read(), returncode)
+
+def boundedMap(func, items, maxWorkers=4, maxPending=None):
+   '''
+   Call func on each item in a thread pool while `items` is still being produced, e.g. streamed from `p4 changes`.
+   Yield (item, future) in the order of items. At most maxPending calls are queued or running,
+   `items` is not read further until the oldest call is consumed, so a fast producer can't pile up work
+   and results in memory. Exceptions are raised by future.result() of the failed item only.
+   '''
+   maxPending = maxPending or maxWorkers * 2
+   pending = collections.deque()
+   with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+      try:
+         for item in items:
+            if len(pending) >= maxPending:
+               yield pending.popleft()
+            pending.append((item, executor.submit(func, item)))
+         while pending:
+            yield pending.popleft()
+      finally:
+         # the consumer stops early, don't start the queued calls
+         for item, future in pending:
+            future.cancel()
+
+CommandStat = collections.namedtuple('CommandStat', ['command', 'latency', 'stdoutBytes', 'stderrBytes',
+                                                       'returncode'])
+
+# global options followed by a value, e.g. `p4 -u <user> -p <port> describe`
+OPTIONS_WITH_VALUE = ('-u', '-c', '-p', '-P', '-C', '-H', '-d', '-x')
+
+def getCommandName(argv):
+   '''Group key of command stats, e.g. "p4 describe" for ['/build/apps/bin/p4', '-u', 'svc', '-G', 'describe', '123']'''
+   name = os.path.basename(argv[0])
+   for index in range(1, len(argv)):
+      if not argv[index].startswith('-') and argv[index - 1] not in OPTIONS_WITH_VALUE:
+         return "{0} {1}".format(name, argv[index])
+   return name
+
+class CountingReader(object):
+   '''Binary stream wrapper counting the bytes read through it, works with readline, iteration and marshal.load'''
+   def __init__(self, stream):
+      self.stream = stream
+      self.bytesRead = 0
+
+   def read(self, size=-1):
+      data = self.stream.read(size)
+      self.bytesRead += len(data)
+      return data
+
+   def readinto(self, buffer):
+      size = self.stream.readinto(buffer)
+      self.bytesRead += size or 0
+      return size
+
+   def readline(self, size=-1):
+      line = self.stream.readline(size)
+      self.bytesRead += len(line)
+      return line
+
+   def __iter__(self):
+      for line in self.stream:
+         self.bytesRead += len(line)
+         yield line
+
+class CommandExecutor(object):
+   '''
+   Run commands as argv lists without a shell, at most maxConcurrency commands at the same time.
+   Input like the password of `p4 login` is written to stdin instead of `echo '...' |`,
+   so it never shows in the process list. Every command gets a timeout clamped to the rest of the run.
+   The latency and output bytes of every command are recorded in `stats`.
+   Usage:
+      stdout, stderr, returncode = commandExecutor.run(['p4', 'login'], input=b'password\n')
+      future = commandExecutor.submit(['p4', 'describe', '-s', '9385524'])
+   '''
+   def __init__(self, maxConcurrency=10, nTimeOut=300):
+      self.maxConcurrency = maxConcurrency
+      self.nTimeOut = nTimeOut
+      self.stats = []
+      self._semaphore = threading.BoundedSemaphore(maxConcurrency)
+      self._lock = threading.Lock()
+      self._pool = None
+
+   def record(self, argv, startTime, stdoutBytes, stderrBytes, returncode):
+      stat = CommandStat(command=getCommandName(argv), latency=time.perf_counter() - startTime,
+                         stdoutBytes=stdoutBytes, stderrBytes=stderrBytes, returncode=returncode)
+      with self._lock:
+         self.stats.append(stat)
+      logger.debug("{0} took {1:.3f}s, stdout {2} bytes, returncode {3}".format(
+         " ".join(argv), stat.latency, stdoutBytes, returncode))
+
+   def run(self, argv, nTimeOut=None, input=None):
+      '''Run the command and return stdout, stderr and returncode, negative returncode means it was killed'''
+      nTimeOut = max(1, min(nTimeOut or self.nTimeOut, getRemainingTime()))
+      with self._semaphore:
+         startTime = time.perf_counter()
+         process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    stdin=subprocess.DEVNULL if input is None else subprocess.PIPE)
+         try:
+            stdout, stderr = process.communicate(input=input, timeout=nTimeOut)
+         except subprocess.TimeoutExpired:
+            process.kill()
+            stdout, stderr = process.communicate()
+         self.record(argv, startTime, len(stdout), len(stderr), process.returncode)
+      return stdout, stderr, process.returncode
+
+   def submit(self, argv, nTimeOut=None, input=None):
+      '''Run the command in a background thread, return a concurrent.futures.Future of run()'''
+      with self._lock:
+         if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.maxConcurrency)
+      return self._pool.submit(self.run, argv, nTimeOut, input)
+
+   @contextlib.contextmanager
+   def stream(self, argv, nTimeOut=None):
+      '''Same as openCmdStream, the command holds one of the concurrency slots until the stream is closed'''
+      with self._semaphore:
+         startTime = time.perf_counter()
+         reader, returncode, stderrBytes = None, 0, 0
+         try:
+            with openCmdStream(argv, nTimeOut or self.nTimeOut) as stdout:
+               reader = CountingReader(stdout)
+               yield reader
+         except CommandFailed as e:
+            returncode, stderrBytes = e.returncode, len(e.stderr)
+            raise
+         finally:
+            self.record(argv, startTime, reader.bytesRead if reader else 0, stderrBytes, returncode)
+
+   def logStats(self):
+      '''Log count, total latency and stdout bytes of the commands grouped by the first arguments'''
+      summary = collections.OrderedDict()
+      with self._lock:
+         for stat in self.stats:
+            count, latency, stdoutBytes = summary.get(stat.command, (0, 0.0, 0))
+            summary[stat.command] = (count + 1, latency + stat.latency, stdoutBytes + stat.stdoutBytes)
+      for command, (count, latency, stdoutBytes) in summary.items():
+         logger.info("command stats: {0} x{1}, total {2:.3f}s, avg {3:.3f}s, stdout {4} bytes".format(
+            command, count, latency, latency / count, stdoutBytes))
+
+# shared by all the callers in one generator process, so the concurrency limit is process wide
+commandExecutor = CommandExecutor()
 
 def logExecutionTime(func):
    @functools.wraps(func)
@@ -65,22 +385,6 @@ def removeOldFiles(path, dtDay=15, keyWord=""):
             except Exception as e:
                logger.exception(f'removeOldFiles error: {e}')
 
-def noIntervalPolling(func):
-   count = 0
-   @functools.wraps(func)
-   def wrapper(*args, **kwargs):
-      nonlocal count
-      count += 1
-      try:
-         return func(*args, **kwargs)
-      except Exception as e:
-         output = 'polling times: {}, Function [{}] err: {}'.format(count, func.__name__, e)
-         logger.exception(output)
-         if count < 3:
-            return wrapper(*args, **kwargs)
-      return "error"
-   return wrapper
-
 # Maybe in python generator this memo dict couldn't cache any result.
 funcResultMemo = {}
 def memorize(func):
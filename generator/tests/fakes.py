@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+fakes.py
+Fakes of perforce, review board, jira and the slackbot service shared by the tests. Importing it puts
+generator/src/notification in sys.path, the notification scripts import each other by bare name.
+Usage:
+   from fakes import makeSpider, FakeReviewBoard
+'''
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+sys.path.insert(1, os.path.join(os.path.abspath(__file__).split("/generator")[0], "generator/src/notification"))
+
+def makeTempDir(testCase):
+   '''Temporary directory removed when the test case is cleaned up'''
+   tempDir = tempfile.mkdtemp()
+   testCase.addCleanup(shutil.rmtree, tempDir)
+   return tempDir
+
+def makeSpider(**attributes):
+   '''PerforceReviewCheckSpider with the given attributes only, without parsing args or logging in'''
+   from perforce_review_check_report import PerforceReviewCheckSpider
+   spider = PerforceReviewCheckSpider.__new__(PerforceReviewCheckSpider)
+   spider.branchList = ["bora/main"]
+   spider.__dict__.update(attributes)
+   return spider
+
+class FakeReviewBoard(object):
+   '''ReviewDiffParser of review requests {reviewRequestId: last revision}'''
+   def __init__(self, revisions):
+      self.revisions = revisions
+
+   def getLastRevision(self, reviewRequestId):
+      if reviewRequestId not in self.revisions:
+         raise Exception("review request #{0} not found".format(reviewRequestId))
+      return self.revisions[reviewRequestId]
+
+class FakeJira(object):
+   '''
+   jira_api_util.search of an in-memory issue table, the issues are ordered by id, id descending or by priority.
+   writingWhileSearching is set if the mirror has a write transaction open while searching.
+   '''
+   def __init__(self, issueCount):
+      # id -> [priority, updated since the last sync]
+      self.issues = {str(index): ['P{0}'.format(index % 3), False] for index in range(issueCount)}
+      self.jqls = []
+      self.mirror = None
+      self.writingWhileSearching = False
+
+   def search(self, jql, startAt, maxResults, fields):
+      self.jqls.append(jql)
+      if self.mirror is not None and self.mirror.conn.in_transaction:
+         self.writingWhileSearching = True
+      ids = sorted(self.issues, key=int)
+      matchObj = re.match(r'id in \((.*)\)', jql)
+      if matchObj:
+         ids = [issueId for issueId in ids if issueId in matchObj.group(1).split(',')]
+      if 'updated >=' in jql:
+         ids = [issueId for issueId in ids if self.issues[issueId][1]]
+      if 'ORDER BY priority' in jql:
+         ids.sort(key=lambda issueId: self.issues[issueId][0])
+      elif 'ORDER BY key DESC' in jql:
+         ids.reverse()
+      page = [{'id': issueId, 'key': 'K-' + issueId,
+               'fields': {'priority': {'name': self.issues[issueId][0]}} if 'priority' in fields else {}}
+              for issueId in ids[startAt:startAt + maxResults]]
+      return startAt, maxResults, len(ids), page
+
+class FlakyCall(object):
+   '''Raise the errors in turn, then return 'ok' '''
+   def __init__(self, *errors):
+      self.errors = list(errors)
+      self.calls = 0
+      self.__name__ = 'flakyCall'
+
+   def __call__(self, *args):
+      self.calls += 1
+      if self.errors:
+         raise self.errors.pop(0)
+      return 'ok'
+
+class FakeResponse(object):
+   '''requests.Response of the status code and headers'''
+   def __init__(self, statusCode, headers=None):
+      self.status_code = statusCode
+      self.headers = headers or {}
+      self.reason = 'Too Many Requests' if 429 == statusCode else 'OK'
+      self.content = b'{"ok": true}'
+
+class FakeSession(object):
+   '''requests.Session posting the responses in turn, then 200, the posted urls are kept in posts'''
+   def __init__(self, *responses):
+      self.responses = list(responses)
+      self.posts = []
+      self.headers = {}
+
+   def post(self, url, data=None, **kwargs):
+      self.posts.append(url)
+      return self.responses.pop(0) if self.responses else FakeResponse(200)
+
+   def mount(self, prefix, adapter):
+      pass
+
+   def close(self):
+      pass
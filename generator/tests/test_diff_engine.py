@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+test_diff_engine.py
+isSameDiff and findCodeMismatch of the same hunk parsed from `p4 describe -a` and a review board patch.
+findCodeMismatch is run with numpy if it is installed, and always with the dict compare.
+'''
+
+import unittest
+from unittest import mock
+import fakes  # puts the notification scripts in sys.path
+import diff_engine
+from diff_engine import FileDiff, iterP4Diffs, iterUnifiedDiffs, isSameDiff, findCodeMismatch
+
+P4_DIFF = """==== //depot/bora/main/lib/foo.c#3 (text) ====
+
+10,11c10,12
+< int a = 1;
+< int b = 2;
+---
+> int a = 10;
+> int b = 20;
+> int c = 30;
+"""
+
+REVIEW_PATCH = """--- a/bora/lib/foo.c
++++ b/bora/lib/foo.c
+@@ -10,2 +10,3 @@
+-int a = 1;
++int a = 10;
+-int b = 2;
++int b = 20;
++int c = 30;
+"""
+
+def makeFileDiff(lines):
+   fileDiff = FileDiff()
+   for sign, lineNo, code in lines:
+      fileDiff.append(sign, lineNo, code)
+   return fileDiff.computeDigest()
+
+class IsSameDiffTest(unittest.TestCase):
+   def testP4AndReviewPatch(self):
+      changeDiffs = dict(iterP4Diffs(P4_DIFF.split('\n')))
+      reviewDiffs = dict(iterUnifiedDiffs(REVIEW_PATCH.split('\n')))
+      self.assertEqual(list(changeDiffs), ['lib/foo.c'])
+      self.assertEqual(list(reviewDiffs), ['lib/foo.c'])
+      # the '+' and '-' lines are printed in different order by p4 and review board
+      self.assertNotEqual(changeDiffs['lib/foo.c'], reviewDiffs['lib/foo.c'])
+      self.assertTrue(isSameDiff(reviewDiffs['lib/foo.c'], changeDiffs['lib/foo.c']))
+
+   def testDifferentCode(self):
+      reviewDiff = makeFileDiff([('-', 10, 'int a = 1;'), ('+', 10, 'int a = 10;')])
+      changeDiff = makeFileDiff([('-', 10, 'int a = 1;'), ('+', 10, 'int a = 11;')])
+      self.assertFalse(isSameDiff(reviewDiff, changeDiff))
+
+   def testSameCodeOtherSign(self):
+      reviewDiff = makeFileDiff([('+', 10, 'int a = 1;')])
+      changeDiff = makeFileDiff([('-', 10, 'int a = 1;')])
+      self.assertFalse(isSameDiff(reviewDiff, changeDiff))
+
+   def testWithoutDigest(self):
+      reviewDiff = FileDiff()
+      reviewDiff.append('+', 10, 'int a = 1;')
+      self.assertFalse(isSameDiff(reviewDiff, reviewDiff))
+
+class FindCodeMismatchTest(unittest.TestCase):
+   def assertMismatch(self, reviewLines, changeLines, sign, expected):
+      reviewDiff, changeDiff = makeFileDiff(reviewLines), makeFileDiff(changeLines)
+      if diff_engine.numpy is not None:
+         self.assertEqual(findCodeMismatch(reviewDiff, changeDiff, sign), expected)
+      with mock.patch.object(diff_engine, 'numpy', None):
+         self.assertEqual(findCodeMismatch(reviewDiff, changeDiff, sign), expected)
+
+   def testSmallestLineNo(self):
+      self.assertMismatch([('+', 12, 'c'), ('+', 10, 'a'), ('+', 11, 'b')],
+                          [('+', 10, 'a'), ('+', 11, 'x'), ('+', 12, 'y')], '+', (11, 'b', 'x'))
+
+   def testSameLines(self):
+      self.assertMismatch([('+', 10, 'a'), ('-', 10, 'b')], [('+', 10, 'a'), ('-', 10, 'b')], '+', None)
+
+   def testOtherSignNotCompared(self):
+      self.assertMismatch([('+', 10, 'a'), ('-', 10, 'b')], [('+', 10, 'a'), ('-', 10, 'c')], '+', None)
+      self.assertMismatch([('+', 10, 'a'), ('-', 10, 'b')], [('+', 10, 'a'), ('-', 10, 'c')], '-', (10, 'b', 'c'))
+
+   def testLineOnlyInOneSide(self):
+      self.assertMismatch([('+', 10, 'a'), ('+', 20, 'b')], [('+', 10, 'a'), ('+', 30, 'c')], '+', None)
+
+   def testLastLineOfSameLineNoWins(self):
+      self.assertMismatch([('+', 10, 'a'), ('+', 10, 'b')], [('+', 10, 'b')], '+', None)
+      self.assertMismatch([('+', 10, 'b'), ('+', 10, 'a')], [('+', 10, 'b')], '+', (10, 'a', 'b'))
+
+if __name__ == '__main__':
+   unittest.main()
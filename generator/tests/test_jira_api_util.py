@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+test_jira_api_util.py
+Usage:
+   PYTHONPATH=`pwd` python3 -m pytest generator/tests
+'''
+
+import time
+import unittest
+from unittest import mock
+from fakes import FakeJira, makeTempDir
+import jira_api_util
+from jira_api_util import normalizeJql, isCachedResultEnough, selectFields
+from generator.src.utils import DiskCache
+
+class NormalizeJqlTest(unittest.TestCase):
+   def testSpacesAndReservedWords(self):
+      self.assertEqual(normalizeJql('project  = VSAN AND  status IN ("In  Progress", Open)  ORDER BY priority'),
+                       normalizeJql('project=VSAN and status in ("In  Progress",Open) order by priority'))
+
+   def testQuotedValueKept(self):
+      self.assertNotEqual(normalizeJql('summary ~ "In  Progress"'), normalizeJql('summary ~ "in progress"'))
+
+   def testUnquotedValueCaseKept(self):
+      self.assertNotEqual(normalizeJql('labels = vsan-Perf'), normalizeJql('labels = vsan-perf'))
+      self.assertNotEqual(normalizeJql('fixVersion = 8.0U3'), normalizeJql('fixVersion = 8.0u3'))
+
+   def testReservedWordInsideValueKept(self):
+      self.assertEqual(normalizeJql('component = Orchestrator AND labels is EMPTY'),
+                       'component=Orchestrator and labels is empty')
+
+class CachedResultTest(unittest.TestCase):
+   def testFieldSupersetAndLimit(self):
+      cached = {'fields': ['priority', 'summary'], 'limit': 50, 'total': 80, 'issues': []}
+      self.assertTrue(isCachedResultEnough(cached, ['summary'], 20))
+      self.assertFalse(isCachedResultEnough(cached, ['summary'], None))
+      self.assertFalse(isCachedResultEnough(cached, ['status'], 20))
+      self.assertFalse(isCachedResultEnough(None, ['summary'], 20))
+      cached['limit'] = None
+      self.assertTrue(isCachedResultEnough(cached, ['priority'], None))
+
+   def testSelectFields(self):
+      issue = {'id': '1', 'key': 'K-1', 'fields': {'priority': {'name': 'P0'}, 'summary': 's'}}
+      self.assertEqual(selectFields(issue, ['summary']), {'id': '1', 'key': 'K-1', 'fields': {'summary': 's'}})
+      self.assertIn('priority', issue['fields'])
+
+class JqlCacheStatsTest(unittest.TestCase):
+   def setUp(self):
+      cacheDirPatcher = mock.patch.object(DiskCache, 'CACHE_DIR', makeTempDir(self))
+      cacheDirPatcher.start()
+      self.addCleanup(cacheDirPatcher.stop)
+      for name, value in (('jqlCache', DiskCache.DiskCache('jira-jql', ttl=jira_api_util.JQL_CACHE_TTL)),
+                          ('search', FakeJira(10).search)):
+         patcher = mock.patch.object(jira_api_util, name, value)
+         patcher.start()
+         self.addCleanup(patcher.stop)
+
+   def search(self, jql):
+      return [issue for _, page in jira_api_util.iterIssuePages(jql, ['priority']) for issue in page]
+
+   def testStatsSharedByProcesses(self):
+      self.search('project = X')
+      self.search('project  =  X')
+      self.search('project = Y')
+      # another process opens the cache database again
+      otherCache = DiskCache.DiskCache('jira-jql')
+      self.assertEqual(otherCache.getStats(), (1, 2))
+      self.assertAlmostEqual(otherCache.getHitRatio(time.time() - 3600), 1 / 3)
+      self.assertEqual(otherCache.getStats(time.time() + 7200), (0, 0))
+      with mock.patch.object(jira_api_util, 'jqlCache', otherCache):
+         self.assertAlmostEqual(jira_api_util.getJqlCacheHitRatio(), 1 / 3)
+
+if __name__ == '__main__':
+   unittest.main()
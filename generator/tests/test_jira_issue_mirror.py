@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+test_jira_issue_mirror.py
+JiraIssueMirror synced from a fake jira search of an in-memory issue table.
+'''
+
+import os
+import unittest
+from unittest import mock
+from fakes import FakeJira, makeTempDir
+import jira_api_util
+import jira_issue_mirror
+from jira_issue_mirror import JiraIssueMirror, splitOrderBy, isOrderedByMutableFields
+
+class JiraIssueMirrorTest(unittest.TestCase):
+   def setUp(self):
+      self.tempDir = makeTempDir(self)
+      self.jira = FakeJira(120)
+      self.mirror = JiraIssueMirror(os.path.join(self.tempDir, 'mirror.db'))
+      self.jira.mirror = self.mirror
+      for module in (jira_api_util, jira_issue_mirror):
+         patcher = mock.patch.object(module, 'search', self.jira.search)
+         patcher.start()
+         self.addCleanup(patcher.stop)
+
+   def getIds(self, jql):
+      return [issue['id'] for _, page in self.mirror.iterIssuePages(jql, ['priority']) for issue in page]
+
+   def getJiraIds(self, jql):
+      return [issue['id'] for _, page in jira_api_util.searchIssuePages(jql, ['priority']) for issue in page]
+
+   def testSplitOrderBy(self):
+      self.assertEqual(splitOrderBy('a = "x" order BY key desc'), ('a = "x"', 'order BY key desc'))
+      self.assertEqual(splitOrderBy('a = b'), ('a = b', ''))
+      self.assertTrue(isOrderedByMutableFields('project = X ORDER BY updated DESC'))
+      self.assertTrue(isOrderedByMutableFields('project = X ORDER BY created DESC, priority'))
+      self.assertFalse(isOrderedByMutableFields('project = X ORDER BY key DESC'))
+      self.assertFalse(isOrderedByMutableFields('project = X'))
+
+   def testDeltaSync(self):
+      jql = 'project = X ORDER BY key'
+      self.mirror.sync(jql, ['priority'])
+      self.assertEqual(self.getIds(jql), self.getJiraIds(jql))
+      self.jira.issues['5'] = ['P9', True]
+      self.jira.jqls = []
+      self.mirror.sync(jql, ['priority'])
+      self.assertRegex(self.jira.jqls[0], r'^\(project = X\) AND updated >= -\d+m ORDER BY key$')
+      self.assertEqual(len(self.jira.jqls), 2)  # the updated search and the total
+      self.assertEqual(self.getIds(jql), self.getJiraIds(jql))
+      issues = [issue for _, page in self.mirror.iterIssuePages(jql, ['priority'], limit=8) for issue in page]
+      self.assertEqual(issues[5]['fields']['priority']['name'], 'P9')
+
+   def testIssueLeftAndJoined(self):
+      jql = 'project = X ORDER BY key'
+      self.mirror.sync(jql, ['priority'])
+      del self.jira.issues['7']
+      self.mirror.sync(jql, ['priority'])
+      self.assertEqual(self.getIds(jql), self.getJiraIds(jql))
+      self.jira.issues['600'] = ['P0', False]
+      with mock.patch.object(jira_issue_mirror, 'MIRROR_FULL_SCAN_INTERVAL', -1):
+         self.mirror.sync(jql, ['priority'])
+      self.assertEqual(self.getIds(jql), self.getJiraIds(jql))
+
+   def syncNewIssues(self, jql, newIds, updatedIds=()):
+      '''Sync the jql after the issues newIds joined it, return the searched jqls'''
+      self.mirror.sync(jql, ['priority'])
+      for issueId in newIds:
+         self.jira.issues[issueId] = ['P1', True]
+      for issueId in updatedIds:
+         self.jira.issues[issueId][1] = True
+      self.jira.jqls = []
+      self.mirror.sync(jql, ['priority'])
+      jqls = list(self.jira.jqls)
+      self.assertEqual(self.getIds(jql), self.getJiraIds(jql))
+      return jqls
+
+   def testNewIssueWithoutFullScan(self):
+      jqls = self.syncNewIssues('project = X ORDER BY key', ['500', '501'])
+      # the updated search and the total, no ID-only search of the jql
+      self.assertEqual(len(jqls), 2)
+
+   def testOldIssueJoinedReconciled(self):
+      del self.jira.issues['60']
+      jqls = self.syncNewIssues('project = X ORDER BY key', ['60'])
+      self.assertIn('project = X ORDER BY key', jqls)  # the ID-only search of the jql ranks the issue
+
+   def testNewIssueRankedFirstDescending(self):
+      jqls = self.syncNewIssues('project = X ORDER BY key DESC', ['500', '501'])
+      self.assertEqual(len(jqls), 2)
+
+   def testNewIssueRanked(self):
+      jql = 'project = X ORDER BY priority'
+      self.mirror.sync(jql, ['priority'])
+      self.jira.issues['500'] = ['P0', True]
+      self.mirror.sync(jql, ['priority'])
+      self.assertEqual(self.getIds(jql), self.getJiraIds(jql))
+
+   def testUpdateReordersMutableOrder(self):
+      jql = 'project = X ORDER BY priority'
+      self.mirror.sync(jql, ['priority'])
+      self.jira.issues['119'] = ['P0', True]
+      self.mirror.sync(jql, ['priority'])
+      self.assertEqual(self.getIds(jql), self.getJiraIds(jql))
+
+   def testNoWriteTransactionWhileSearching(self):
+      jql = 'project = X ORDER BY priority'
+      self.mirror.sync(jql, ['priority'])
+      self.jira.issues['119'] = ['P0', True]
+      del self.jira.issues['3']
+      self.mirror.sync(jql, ['priority'])
+      self.assertFalse(self.jira.writingWhileSearching)
+
+   def testValueCaseNotShared(self):
+      self.mirror.sync('labels = Perf', ['priority'])
+      self.jira.jqls = []
+      self.mirror.sync('labels = perf', ['priority'])
+      self.assertEqual(self.jira.jqls[0], 'labels = perf')  # full sync, not the delta of labels = Perf
+
+if __name__ == '__main__':
+   unittest.main()
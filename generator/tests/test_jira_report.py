@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+test_jira_report.py
+'''
+
+import re
+import argparse
+import unittest
+from unittest import mock
+from urllib import parse
+import fakes  # puts the notification scripts in sys.path
+import jira_report
+from jira_report import JiraReport, PIVOT_MAX_COLUMNS, PIVOT_OTHER_NAME
+from generator.src.utils.Utils import MAX_CHAR_LENGTH_IN_ONE_REPORT
+
+def makeIssues(issueCount, assigneeCount):
+   return [{'id': str(index), 'key': 'K-{0}'.format(index),
+            'fields': {'priority': {'name': 'P{0}'.format(index % 5)},
+                       'assignee': {'emailAddress': 'engineer-with-a-long-name-{0}@broadcom.com'.format(
+                          index % assigneeCount)}}}
+           for index in range(issueCount)]
+
+def makeReport(groupby, pivot, issues):
+   args = argparse.Namespace(title='Pivot', jql='project = VSAN AND labels = "vsan-perf"', fields='',
+                             groupby=groupby, pivot=pivot, creator='me', mirror='No')
+   report = JiraReport(args)
+   report.IterIssuePages = lambda jql, limit=None: iter([(len(issues), issues)])
+   return report
+
+def getCount(line):
+   return int(re.search(r'\|(\d+)>', line).group(1))
+
+def getJql(line):
+   return parse.unquote(re.search(r'jql=([^|]*)\|', line).group(1))
+
+class PivotTableTest(unittest.TestCase):
+   def getReports(self, report):
+      with mock.patch.object(jira_report, 'transformReport', lambda messages, **kwargs: messages):
+         return report.GetReport()
+
+   def testWidePivotSplitUnderLimit(self):
+      issues = makeIssues(3000, 300)
+      reports = self.getReports(makeReport('priority', 'assignee', issues))
+      self.assertGreater(len(reports), 1)
+      for report in reports:
+         self.assertLessEqual(len(report), MAX_CHAR_LENGTH_IN_ONE_REPORT)
+
+   def testCellCounts(self):
+      issues = makeIssues(3000, 300)
+      report = makeReport('priority', 'assignee', issues)
+      lines = report.GetPivotTable(report.CountPivotIssues())
+      self.assertEqual(getCount(lines[2]), 3000)
+      self.assertTrue(lines[2].endswith('Total'))
+      rowLines = [line for line in lines[2:] if not line.startswith(' ')]
+      self.assertEqual([line.split()[-1] for line in rowLines], ['Total', 'P0', 'P1', 'P2', 'P3', 'P4'])
+      # cells of each row add up to the row count
+      index = 2
+      while index < len(lines):
+         rowCount, cellCount = getCount(lines[index]), 0
+         index += 1
+         while index < len(lines) and lines[index].startswith(' '):
+            cellCount += getCount(lines[index])
+            index += 1
+         self.assertEqual(rowCount, cellCount)
+      otherLines = [line for line in lines if line.endswith(PIVOT_OTHER_NAME)]
+      self.assertEqual(len(otherLines), 6)
+      self.assertIn('assignee not in (', getJql(otherLines[0]))
+      totalCells = []
+      for line in lines[3:]:
+         if not line.startswith(' '):
+            break
+         totalCells.append(line)
+      self.assertEqual(len(totalCells), PIVOT_MAX_COLUMNS + 1)
+
+   def testDrillDownJql(self):
+      report = makeReport('priority', 'assignee', makeIssues(20, 2))
+      lines = report.GetPivotTable(report.CountPivotIssues())
+      rowLine = [line for line in lines if line.endswith('P1')][0]
+      cellLine = lines[lines.index(rowLine) + 1]
+      self.assertEqual(getJql(rowLine), 'project = VSAN AND labels = "vsan-perf" AND priority = "P1"')
+      self.assertEqual(getJql(cellLine), 'project = VSAN AND labels = "vsan-perf" AND priority = "P1" '
+                                         'AND assignee = "{0}"'.format(cellLine.split()[-1]))
+
+   def testGroupbyTableUnchanged(self):
+      report = makeReport('priority', 'none', makeIssues(20, 2))
+      lines = report.GetJiraTable(report.CountIssues())
+      self.assertEqual([line.split()[-1] for line in lines[2:]], ['Total', 'P0', 'P1', 'P2', 'P3', 'P4'])
+      self.assertEqual([getCount(line) for line in lines[2:]], [20, 4, 4, 4, 4, 4])
+
+if __name__ == '__main__':
+   unittest.main()
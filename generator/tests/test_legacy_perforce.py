@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+test_legacy_perforce.py
+p4 commands of utils/perforce.py run as argv lists without a shell.
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+# botconst is imported by bare name, after the utils package of the repo root
+sys.path.append(os.path.join(os.path.abspath(__file__).split("/generator")[0], "utils"))
+from utils import perforce
+from utils.utils import RunArgv
+
+CHANGES_OUTPUT = b"""Change 13812345 on 2024/05/06 by alanh@alanh-jetpack 'fix the leak'
+Change 13812344 on 2024/05/06 by svc.cbot@CBOT-ws 'CBOT: sync'
+Change 13812301 on 2024/05/06 by dperi@dperi-main 'Back out'
+Change 13812288 on 2024/05/06 by wyattx@wyattx-ws 'CBOT: update'
+Change 13812250 on 2024/05/06 by kelsallt@kelsallt-ws 'Revert'
+"""
+
+class RunArgvTest(unittest.TestCase):
+   def testNoShell(self):
+      self.assertEqual(RunArgv(['echo', '$HOME;', 'a|b']), b'$HOME; a|b\n')
+
+   def testInput(self):
+      self.assertEqual(RunArgv(['cat'], input=b'secret\n'), b'secret\n')
+
+class LegacyPerforceTest(unittest.TestCase):
+   def testLoginPasswordOnStdin(self):
+      with mock.patch.object(perforce, 'RunArgv', return_value=b'') as runArgv, \
+            mock.patch.object(perforce, 'SERVICE_PASSWORD', 'p@ss'):
+         perforce.p4Login()
+      argv, kwargs = runArgv.call_args[0][0], runArgv.call_args[1]
+      self.assertNotIn('p@ss', " ".join(argv))
+      self.assertEqual(kwargs['input'], b'p@ss\n')
+
+   def testSubmittedExcludesCbot(self):
+      with mock.patch.object(perforce, 'RunArgv', return_value=CHANGES_OUTPUT) as runArgv:
+         outputs = perforce.p4Submitted(['//depot/bora/main/...'], users=['bob'], checkTime='2024/05/06,2024/05/07',
+                                        args='-m 100')
+      self.assertEqual(runArgv.call_args[0][0][-5:],
+                       ['-u', 'bob', '//depot/bora/main/...@2024/05/06,2024/05/07', '-m', '100'])
+      self.assertEqual(len(outputs), 1)
+      self.assertNotIn('CBOT', outputs[0])
+      self.assertIn('13812250', outputs[0])
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+test_message_dispatcher.py
+Posts of MessageDispatcher spaced per destination host and held by Retry-After, the sleeps are recorded.
+'''
+
+import unittest
+from unittest import mock
+from fakes import FakeResponse, FakeSession
+from generator.src.utils import MessageDispatcher as dispatcherModule
+from generator.src.utils.MessageDispatcher import MessageDispatcher, getRetryAfter
+
+USER_URL = "https://slackbot.example.com/api/v1/user/{0}/messages"
+CHANNEL_URL = "https://slackbot.example.com/api/v1/channel/{0}/messages"
+
+class MessageDispatcherTest(unittest.TestCase):
+   def makeDispatcher(self, *responses, **kwargs):
+      self.session = FakeSession(*responses)
+      with mock.patch.object(dispatcherModule.requests, 'Session', return_value=self.session):
+         dispatcher = MessageDispatcher({"Authorization": "Bearer x"}, maxConcurrency=1, **kwargs)
+      self.addCleanup(dispatcher.close)
+      return dispatcher
+
+   def testRetryAfter(self):
+      self.assertEqual(getRetryAfter(FakeResponse(429, {'Retry-After': '5'})), 5.0)
+      self.assertEqual(getRetryAfter(FakeResponse(429, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})), 0.0)
+      self.assertIsNone(getRetryAfter(FakeResponse(429)))
+
+   def testSpacedPerHost(self):
+      dispatcher = self.makeDispatcher(minInterval=2.0)
+      self.assertEqual(dispatcher.reserve('slackbot.example.com'), 0)
+      self.assertAlmostEqual(dispatcher.reserve('slackbot.example.com'), 2.0, delta=0.1)
+      self.assertEqual(dispatcher.reserve('other.example.com'), 0)
+      with mock.patch.object(dispatcherModule.time, 'sleep') as sleep:
+         dispatcher.post(USER_URL.format('bob'), {"text": "a"}).result()
+         dispatcher.post(CHANNEL_URL.format('C1'), {"text": "b"}).result()
+      waits = [call[0][0] for call in sleep.call_args_list]
+      # the posts to two urls of the host wait after the two reservations of the host above
+      self.assertAlmostEqual(waits[0], 4.0, delta=0.1)
+      self.assertAlmostEqual(waits[1], 6.0, delta=0.1)
+
+   def testRetryAfterHoldsHost(self):
+      dispatcher = self.makeDispatcher(FakeResponse(429, {'Retry-After': '30'}), minInterval=0.0)
+      with mock.patch.object(dispatcherModule.time, 'sleep') as sleep:
+         response = dispatcher.post(USER_URL.format('bob'), {"text": "a"}).result()
+         self.assertEqual(response.status_code, 200)
+         waits = [call[0][0] for call in sleep.call_args_list]
+         self.assertEqual(waits[0], 0)
+         self.assertAlmostEqual(waits[1], 30.0, delta=0.1)
+         # another url of the host is held as well
+         self.assertGreater(dispatcher.reserve('slackbot.example.com'), 29.0)
+      self.assertEqual(self.session.posts, [USER_URL.format('bob')] * 2)
+
+   def testNotRetryable(self):
+      dispatcher = self.makeDispatcher(FakeResponse(404), minInterval=0.0)
+      with mock.patch.object(dispatcherModule.time, 'sleep'):
+         response = dispatcher.post(USER_URL.format('bob'), {"text": "a"}).result()
+      self.assertEqual(response.status_code, 404)
+      self.assertEqual(len(self.session.posts), 1)
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+test_perforce_diff_parser.py
+Timeouts of batched `p4 describe -a`.
+'''
+
+import contextlib
+import unittest
+from unittest import mock
+import fakes  # puts the notification scripts in sys.path
+import perforce_diff_parser
+from perforce_diff_parser import PerforceDiffParser, DescribeTimeout, getDescribeTimeout, DESCRIBE_DIFF_TIMEOUT
+from generator.src.utils.Utils import CommandFailed
+
+class DescribeTimeoutTest(unittest.TestCase):
+   def setUp(self):
+      self.parser = PerforceDiffParser()
+      self.parser.getDescribes = lambda cln: "describe {0}".format(cln)
+      self.batches = []
+
+   def describeBatch(self, clns, error):
+      def describeFromPerforce(batch):
+         self.batches.append(list(batch))
+         if len(batch) > 1:
+            raise error
+         return {}
+      self.parser.describeFromPerforce = describeFromPerforce
+      results = {}
+      self.parser.describeBatch(clns, results)
+      return results
+
+   def testTimeoutScalesWithBatch(self):
+      self.assertEqual(getDescribeTimeout(1), DESCRIBE_DIFF_TIMEOUT)
+      self.assertEqual(getDescribeTimeout(2), 2 * perforce_diff_parser.DESCRIBE_BATCH_TIMEOUT_PER_CLN)
+      self.assertEqual(getDescribeTimeout(100), DESCRIBE_DIFF_TIMEOUT)
+
+   def testKilledDescribeIsTimeout(self):
+      @contextlib.contextmanager
+      def killedStream(argv, nTimeOut=None):
+         self.assertEqual(nTimeOut, getDescribeTimeout(3))
+         raise CommandFailed(" ".join(argv), b'', -9)
+         yield
+      with mock.patch.object(perforce_diff_parser.commandExecutor, 'stream', killedStream):
+         with self.assertRaises(DescribeTimeout):
+            self.parser.streamDescribes(['1', '2', '3'], lambda changeLines, changeTime: None)
+
+   def testTimedOutBatchDescribedAlone(self):
+      results = self.describeBatch(['1', '2', '3', '4'], DescribeTimeout("4 CLNs in 1200s"))
+      self.assertEqual(self.batches, [['1', '2', '3', '4']])
+      self.assertEqual(results, {cln: "describe {0}".format(cln) for cln in ['1', '2', '3', '4']})
+
+   def testFailedBatchSplit(self):
+      self.describeBatch(['1', '2', '3', '4'], Exception("Perforce internal error"))
+      self.assertEqual(self.batches, [['1', '2', '3', '4'], ['1', '2'], ['3', '4']])
+
+if __name__ == '__main__':
+   unittest.main()
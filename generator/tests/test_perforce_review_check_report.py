@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+test_perforce_review_check_report.py
+'''
+
+import os
+import time
+import unittest
+from collections import defaultdict
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from fakes import makeSpider, makeTempDir, FakeReviewBoard
+from perforce_client import ChangeRecord
+from perforce_review_check_report import PerforceReviewCheckSpider, CompareNotEqual, getBranchPath
+from review_check_verdict_store import VerdictStore, VERDICT_OK, VERDICT_NO_REVIEW, VERDICT_UNEQUAL, VERDICT_TTL
+
+class CompareFileListsTest(unittest.TestCase):
+   def setUp(self):
+      self.spider = makeSpider(branchList=["bora/main", "bora/vsan-dev"])
+
+   def assertUnequal(self, changeFiles, reviewFiles):
+      with self.assertRaises(CompareNotEqual) as context:
+         self.spider.compareFileLists(changeFiles, reviewFiles)
+      self.assertEqual(str(context.exception), "compare file list unequal")
+
+   def testBranchPath(self):
+      self.assertEqual(getBranchPath("//depot/bora/main/lib/foo.c", ["bora/main"]), "lib/foo.c")
+      self.assertEqual(getBranchPath("//depot/bora/main/lib/foo.c#3", ["bora", "bora/main"]), "lib/foo.c")
+      self.assertEqual(getBranchPath("a/bora/lib/foo.c", ["bora/main"]), "lib/foo.c")
+      self.assertEqual(getBranchPath("bora/lib/foo.c", ["bora/main"]), "lib/foo.c")
+      self.assertEqual(getBranchPath("foo.c", ["bora/main"]), "foo.c")
+
+   def testSameFiles(self):
+      self.spider.compareFileLists(["//depot/bora/main/lib/foo.c", "//depot/bora/main/lib/bar/foo.c"],
+                                   ["//depot/bora/main/lib/bar/foo.c", "//depot/bora/main/lib/foo.c"])
+      self.spider.compareFileLists(["//depot/bora/main/lib/foo.c", "//depot/bora/main/lib/bar/foo.c"],
+                                   ["bora/lib/bar/foo.c", "bora/lib/foo.c"])
+
+   def testCountUnequal(self):
+      with self.assertRaises(CompareNotEqual):
+         self.spider.compareFileLists(["//depot/bora/main/lib/foo.c"], [])
+
+   def testBasenameDoesNotMatchOtherDirectory(self):
+      self.assertUnequal(["//depot/bora/main/lib/foo.c"], ["foo.c"])
+      self.assertUnequal(["//depot/bora/main/lib/foo.c"], ["lib2/lib/foo.c"])
+      self.assertUnequal(["//depot/bora/main/lib/foo.c"], ["bora/vmkernel/lib/foo.c"])
+      self.assertUnequal(["//depot/bora/main/lib/foo.c"], ["//depot/bora/main/vmkernel/lib/foo.c"])
+      self.assertUnequal(["//depot/bora/main/vmkernel/lib/foo.c"], ["//depot/bora/main/lib/foo.c"])
+
+   def testBinaryFileKept(self):
+      # a binary file of the change which isn't in the review fails the check
+      self.assertUnequal(["//depot/bora/main/lib/foo.c", "//depot/bora/main/doc/logo.png"],
+                         ["//depot/bora/main/lib/foo.c", "//depot/bora/main/doc/other.png"])
+
+class ReplayVerdictsTest(unittest.TestCase):
+   def setUp(self):
+      self.spider = makeSpider(recheck=False, rbParser=FakeReviewBoard({"100": 2, "101": 1}),
+                               verdictStore=VerdictStore(os.path.join(makeTempDir(self), "verdicts.db")))
+      self.addCleanup(self.spider.verdictStore.conn.close)
+      self.rbPool = ThreadPoolExecutor(max_workers=2)
+      self.addCleanup(self.rbPool.shutdown)
+
+   def save(self, cln, verdict, reviewRequestId="", reviewRevision=None, reason=""):
+      check = {'cln': cln, 'user': 'bob', 'changeTime': "2024/01/01 01:00:00", 'reviewRequestId': reviewRequestId,
+               'reviewRevision': reviewRevision}
+      self.spider.verdictStore.save(check, verdict, reason)
+
+   def replay(self, clns):
+      records = (defaultdict(list), defaultdict(list), [])
+      changeList = [ChangeRecord(cln, 'bob', 'ws', 0, '', 'submitted') for cln in clns]
+      unchecked = self.spider.replayVerdicts(changeList, records, self.rbPool)
+      return [change.cln for change in unchecked], records
+
+   def testSameRevisionReplayed(self):
+      self.save("10", VERDICT_OK, "100", 2)
+      self.save("11", VERDICT_UNEQUAL, "101", 1, "compare file list unequal")
+      self.save("12", VERDICT_NO_REVIEW)
+      unchecked, (noReviews, unEquals, _) = self.replay(["10", "11", "12", "13"])
+      self.assertEqual(unchecked, ["13"])
+      self.assertEqual(unEquals['bob'], [("11", "101", "2024/01/01 01:00:00", "compare file list unequal")])
+      self.assertEqual(noReviews['bob'], [("12", "2024/01/01 01:00:00")])
+
+   def testNewRevisionChecked(self):
+      self.save("10", VERDICT_OK, "100", 1)
+      self.save("11", VERDICT_UNEQUAL, "101", None, "compare file list unequal")
+      self.save("12", VERDICT_OK, "102", 1)
+      unchecked, (_, unEquals, _) = self.replay(["10", "11", "12"])
+      self.assertEqual(unchecked, ["10", "11", "12"])
+      self.assertEqual(unEquals['bob'], [])
+
+   def testExpiredVerdictChecked(self):
+      self.save("12", VERDICT_NO_REVIEW)
+      self.spider.verdictStore.conn.execute("UPDATE verdicts SET updated = ?",
+                                            (int(time.time()) - VERDICT_TTL - 1,))
+      self.assertEqual(self.replay(["12"])[0], ["12"])
+
+class ShardTest(unittest.TestCase):
+   def setUp(self):
+      self.tmpDir = makeTempDir(self)
+      self.changeList = [ChangeRecord(str(1000 + index), 'user{0}'.format(index % 7), 'ws', 0, '', 'submitted')
+                         for index in range(50)]
+
+   def selectShards(self, shardBy, shardCount):
+      shards = []
+      for shardIndex in range(shardCount):
+         spider = makeSpider(shardCount=shardCount, shardBy=shardBy, shardIndex=shardIndex)
+         shards.append(spider.selectShard(self.changeList))
+      return shards
+
+   def testShardsByUser(self):
+      shards = self.selectShards('user', 3)
+      self.assertEqual(sorted(change.cln for shard in shards for change in shard),
+                       sorted(change.cln for change in self.changeList))
+      shardUsers = [set(change.user for change in shard) for shard in shards]
+      for index, users in enumerate(shardUsers):
+         for otherUsers in shardUsers[index + 1:]:
+            self.assertFalse(users & otherUsers)
+
+   def testShardsByCln(self):
+      shards = self.selectShards('cln', 3)
+      self.assertEqual([len(shard) for shard in shards], [16, 17, 17])
+      self.assertEqual([change.cln for shard in shards for change in shard],
+                       [change.cln for change in self.changeList])
+
+   def testMergeShardRecords(self):
+      spider = makeSpider()
+      shardRecords = [
+         ({'bob': [("1001", "2024/01/01 01:00:00")]}, {'amy': [("1003", "55", "2024/01/01 03:00:00", "unequal")]},
+          ["change 1002 too large to compare"]),
+         ({'bob': [("1004", "2024/01/01 04:00:00")]}, {}, []),
+      ]
+      outputs = []
+      for index, records in enumerate(shardRecords):
+         outputs.append(os.path.join(self.tmpDir, "shard-{0}.json".format(index)))
+         with mock.patch.object(spider, 'getRecords', return_value=records):
+            spider.writeShardRecords(outputs[-1])
+      outputs.append(os.path.join(self.tmpDir, "shard-killed.json"))
+      noReviews, unEquals, unknowns = spider.mergeShardRecords(outputs)
+      self.assertEqual(noReviews['bob'], [("1004", "2024/01/01 04:00:00"), ("1001", "2024/01/01 01:00:00")])
+      self.assertEqual(unEquals['amy'], [("1003", "55", "2024/01/01 03:00:00", "unequal")])
+      self.assertEqual(unknowns, ["change 1002 too large to compare", "review check shard shard-killed.json failed"])
+      self.assertEqual(sorted(os.listdir(self.tmpDir)), ["shard-0.json", "shard-1.json"])
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# Copyright 2024 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+'''
+Module docstring.
+test_utils.py
+'''
+
+import unittest
+import multiprocessing
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
+from generator.src.utils import Utils
+from fakes import FlakyCall
+
+class RunDeadlineTest(unittest.TestCase):
+   def setUp(self):
+      self.addCleanup(setattr, Utils, 'runDeadline', Utils.runDeadline)
+
+   def testSpawnedProcessGetsDeadline(self):
+      Utils.setRunTimeout(Utils.REVIEW_CHECK_RUN_TIMEOUT)
+      remaining = Utils.getRemainingTime()
+      with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=Utils.setRunDeadline, initargs=(Utils.getRunDeadline(),)) as pool:
+         childRemaining = pool.submit(Utils.getRemainingTime).result()
+      self.assertGreater(childRemaining, Utils.RUN_TIMEOUT)
+      self.assertLessEqual(childRemaining, remaining)
+      self.assertAlmostEqual(childRemaining, Utils.getRemainingTime(), delta=5)
+
+class RetryPolicyTest(unittest.TestCase):
+   def setUp(self):
+      self.addCleanup(setattr, Utils, 'runDeadline', Utils.runDeadline)
+      Utils.setRunTimeout(Utils.RUN_TIMEOUT)
+      sleepPatcher = mock.patch.object(Utils.time, 'sleep')
+      self.sleep = sleepPatcher.start()
+      self.addCleanup(sleepPatcher.stop)
+
+   def testBackoffBound(self):
+      policy = Utils.RetryPolicy(baseDelay=1, maxDelay=5)
+      with mock.patch.object(Utils.random, 'uniform', side_effect=lambda low, high: high):
+         self.assertEqual([policy.getDelay(attempt) for attempt in range(1, 6)], [1, 2, 4, 5, 5])
+      for attempt in range(1, 10):
+         self.assertTrue(0 <= policy.getDelay(attempt) <= 5)
+
+   def testRetryUntilSuccess(self):
+      func = FlakyCall(Utils.RetryableError("tcp receive failed"), TimeoutError())
+      self.assertEqual(Utils.RetryPolicy(maxAttempts=3).call(func), 'ok')
+      self.assertEqual(func.calls, 3)
+      self.assertEqual(self.sleep.call_count, 2)
+
+   def testGiveUpAfterMaxAttempts(self):
+      func = FlakyCall(*[Utils.RetryableError("tcp receive failed")] * 5)
+      with self.assertRaises(Utils.RetryableError):
+         Utils.RetryPolicy(maxAttempts=3).call(func)
+      self.assertEqual(func.calls, 3)
+
+   def testNotRetryable(self):
+      func = FlakyCall(ValueError("bad jql"))
+      with self.assertRaises(ValueError):
+         Utils.RetryPolicy(maxAttempts=3).call(func)
+      self.assertEqual(func.calls, 1)
+      self.sleep.assert_not_called()
+
+   def testFallback(self):
+      func = FlakyCall(ValueError("bad jql"))
+      self.assertEqual(Utils.RetryPolicy(fallback=[]).call(func), [])
+
+   def testReloginBeforeRetry(self):
+      relogin = mock.Mock()
+      func = FlakyCall(Utils.LoginExpired("your session has expired"))
+      self.assertEqual(Utils.RetryPolicy(relogin=relogin).call(func, 'arg'), 'ok')
+      relogin.assert_called_once_with('arg')
+
+   def testNoSleepPastDeadline(self):
+      Utils.runDeadline = Utils.time.monotonic() + 2
+      func = FlakyCall(*[Utils.RetryableError("tcp receive failed")] * 5)
+      # the delay is its upper bound 10s, longer than the 2s left
+      with mock.patch.object(Utils.random, 'uniform', side_effect=lambda low, high: high), \
+            self.assertRaises(Utils.RetryableError):
+         Utils.RetryPolicy(maxAttempts=5, baseDelay=10, maxDelay=10).call(func)
+      self.assertEqual(func.calls, 1)
+      self.sleep.assert_not_called()
+
+   def testDeadlineExceeded(self):
+      Utils.runDeadline = Utils.time.monotonic() - 1
+      func = FlakyCall()
+      with self.assertRaises(Utils.DeadlineExceeded):
+         Utils.RetryPolicy().call(func)
+      self.assertEqual(func.calls, 0)
+
+if __name__ == '__main__':
+   unittest.main()
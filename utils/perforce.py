@@ -1,9 +1,11 @@
 import os
-import os
 import sys
+import shlex
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 from botconst import SERVICE_ACCOUNT, SERVICE_PASSWORD
-from utils.utils import RunCmd
+from utils.utils import RunArgv
+
+P4_BIN = "/build/apps/bin/p4"
 
 def p4Login():
     # p4Ticket = "/tmp/.vdcstestframework.mtsautomation.p4tickets"
@@ -11,31 +13,37 @@ def p4Login():
     os.environ['P4USER'] = SERVICE_ACCOUNT
     # os.environ['P4TICKETS'] = p4Ticket
     # cmd = "/build/apps/bin/p4_login --all --user {0} --password {1} --ticket-file {2}".format(P4_ACCOUNT, P4_PASSWORD, p4Ticket)
-    cmd = "echo '{0}' | /build/apps/bin/p4 -u {1} login".format(SERVICE_PASSWORD, SERVICE_ACCOUNT)
-    print(cmd)
-    output = RunCmd(cmd).decode('utf-8')
+    cmd = [P4_BIN, '-u', SERVICE_ACCOUNT, 'login']
+    print(" ".join(cmd))
+    # the password goes to stdin, not to the command line
+    output = RunArgv(cmd, input="{0}\n".format(SERVICE_PASSWORD).encode()).decode('utf-8')
     print(output)
 
-def p4Submitted(pathes, users=None, checkTime=None, args=""):
-   baseCmd = "/build/apps/bin/p4 -u svc.vsan-er changes -s submitted"
+def p4Submitted(pathes, users=None, checkTime=None, args="", excludeKeyword="CBOT"):
+   '''
+   Output of `p4 changes -s submitted` for each user, args are more p4 arguments.
+   The changes whose line contains excludeKeyword are left out, like `| grep -v CBOT`.
+   '''
+   baseCmd = [P4_BIN, '-u', 'svc.vsan-er', 'changes', '-s', 'submitted']
    fullCmds = []
    outputs = []
-   repo = ""
-   if checkTime:
-      checkTime = "@" + checkTime
+   repo = []
+   checkTime = "@" + checkTime if checkTime else ""
    for path in pathes:
-      repo += " " + path + checkTime
+      repo.append(path + checkTime)
    if users:
       for user in users:
-         cmd = baseCmd + " -u {0}".format(user) + repo + args
+         cmd = baseCmd + ['-u', user] + repo + shlex.split(args)
          fullCmds.append(cmd)
    else:
-      cmd = baseCmd + repo + args
+      cmd = baseCmd + repo + shlex.split(args)
       fullCmds.append(cmd)
    for cmd in fullCmds:
-      print("command for p4 submitted change: " + cmd)
-      output = RunCmd(cmd).decode('utf-8')
+      print("command for p4 submitted change: " + " ".join(cmd))
+      output = RunArgv(cmd).decode('utf-8')
       output = output.split("\n", 2)[2]
+      if excludeKeyword:
+         output = "\n".join(line for line in output.split("\n") if excludeKeyword not in line)
       outputs.append(output)
       print("output: " + output)
    return outputs
@@ -46,9 +54,9 @@ def p4DescribeChange(clns):
       print("No cln for p4 change description")
       return ret
    for cln in clns:
-      cmd = "/build/apps/bin/p4 -u svc.vsan-er describe -s {1}".format(SERVICE_PASSWORD, cln)
-      print("command for getting p4 change description: " + cmd)
-      output = RunCmd(cmd).decode('utf-8')
+      cmd = [P4_BIN, '-u', 'svc.vsan-er', 'describe', '-s', str(cln)]
+      print("command for getting p4 change description: " + " ".join(cmd))
+      output = RunArgv(cmd).decode('utf-8')
       print("output: " + output)
       output = ExtractRecord(output)
       ret.append(output)
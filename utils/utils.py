@@ -3,11 +3,18 @@ import subprocess
 
 def RunCmd(cmd):
    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-   process.wait()
-   output = process.stdout.read()
-   print(output)
-   error = process.stderr.read()
+   # read the pipes while waiting, wait() before reading blocks forever once the output fills the pipe buffer
+   output, error = process.communicate()
    if error:
-      print(cmd)
       print(error)
-   return output
\ No newline at end of file
+   return output
+
+def RunArgv(argv, input=None, timeout=300):
+   '''
+   Run the command as an argv list without a shell, so no argument is parsed by a shell.
+   input, e.g. a password, is written to stdin instead of the command line, which shows in the process list.
+   '''
+   process = subprocess.run(argv, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+   if process.stderr:
+      print(process.stderr)
+   return process.stdout